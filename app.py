@@ -15,13 +15,31 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import functools
+import hmac
+import json
 import logging
+import threading
+import time
+from datetime import datetime
 from flask import Flask, render_template, jsonify, Response, request
-from helper import get_mqtt_params, get_foxess_env,set_logger_state,log_queue
-from mqtt_handler import MqttHandler
+from helper import get_mqtt_params, get_foxess_env,set_logger_state,log_queue,get_profiling_token,get_logging_stats
+from foxess_profiler import sample_threads, AllocationTracker, ProfilerBusy, DEFAULT_TOP
+from mqtt_handler_async import create_mqtt_handler
+from foxess_metrics import render_metrics, CONTENT_TYPE
+from foxess_timeseries import DEFAULT_LIMIT
+from foxess_rollups import RESOLUTIONS, HOUR
 
 logger = logging.getLogger("livelogviewer") # You can use logging.getLogger('my_app') if you prefer
 
+# each stream holds a server thread, e.g. gunicorn --threads
+MAX_LOG_STREAMS = 4
+# comment sent when there is no new line, keeps proxies from closing the stream
+STREAM_KEEPALIVE = 15
+log_streams = threading.BoundedSemaphore(MAX_LOG_STREAMS)
+MAX_TELEMETRY_STREAMS = 4
+telemetry_streams = threading.BoundedSemaphore(MAX_TELEMETRY_STREAMS)
+
 
 mqtt = get_mqtt_params()
 foxess = get_foxess_env()
@@ -39,10 +57,169 @@ def get_env_vars():
 def index():
     return render_template('index.html',env_vars=get_env_vars())
 
+def _cursor(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
 @app.route('/logs')
 def get_logs():
-    log_content = "\n".join(list(log_queue))
-    return jsonify(logs=log_content)
+    """
+    ?since=<seq> returns only lines newer than seq, reset is true when some of them are already gone
+    """
+    since = _cursor(request.args.get('since'))
+    # cursor from before restart
+    restarted = since > log_queue.seq
+    if restarted:
+        since = 0
+    lines = log_queue.since(since)
+    reset = restarted or (bool(since) and log_queue.first() > since + 1)
+    seq = lines[-1][0] if lines else max(since, log_queue.seq)
+    return jsonify(logs="\n".join(line for _, line in lines), seq=seq, reset=reset)
+
+def _sse(seq, line):
+    data = "\n".join(f"data: {l}" for l in line.split("\n"))
+    return f"id: {seq}\n{data}\n\n"
+
+@app.route('/logs/stream')
+def stream_logs():
+    """
+    Server-Sent Events, one event per log line, reconnecting EventSource continues from Last-Event-ID
+    """
+    if not log_streams.acquire(blocking=False):
+        return Response("Too many log streams", status=503)
+    since = _cursor(request.headers.get('Last-Event-ID', request.args.get('since')))
+
+    def events(since):
+        if since > log_queue.seq:
+            since = 0
+            yield "event: reset\ndata: \n\n"
+        elif since and log_queue.first() > since + 1:
+            yield "event: reset\ndata: \n\n"
+        while True:
+            lines = log_queue.wait(since, STREAM_KEEPALIVE)
+            if not lines:
+                yield ": keepalive\n\n"
+                continue
+            since = lines[-1][0]
+            yield "".join(_sse(seq, line) for seq, line in lines)
+
+    response = Response(events(since), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(log_streams.release)
+    return response
+
+@app.route('/telemetry/latest')
+def telemetry_latest():
+    return Response(json.dumps(mqtt_handler.get_latest_frames(), default=str), mimetype='application/json')
+
+@app.route('/telemetry/stream')
+def telemetry_stream():
+    """
+    Every parsed frame as soon as it is decoded, Server-Sent Events or ?format=ndjson (one JSON per line).
+    ?device=<id> only frames of one inverter. A client which cannot keep up skips frames, it is told how many.
+    """
+    ndjson = request.args.get('format') == 'ndjson'
+    device = request.args.get('device')
+    if not telemetry_streams.acquire(blocking=False):
+        return Response("Too many telemetry streams", status=503)
+    subscription = mqtt_handler.telemetry.subscribe()
+
+    def events():
+        # headers are sent with the first chunk, client knows at once it is connected
+        yield "\n" if ndjson else ": connected\n\n"
+        while True:
+            items, skipped = subscription.read(STREAM_KEEPALIVE)
+            chunk = []
+            if skipped:
+                chunk.append(json.dumps({"skipped": skipped}) + "\n" if ndjson
+                             else f"event: skipped\ndata: {skipped}\n\n")
+            for item in items:
+                if device is None or item.device_id == device:
+                    chunk.append(item.json() + "\n" if ndjson else f"id: {item.seq}\ndata: {item.json()}\n\n")
+            if chunk:
+                yield "".join(chunk)
+            elif not ndjson:
+                yield ": keepalive\n\n"
+            else:
+                yield "\n"
+
+    def close():
+        subscription.close()
+        telemetry_streams.release()
+
+    response = Response(events(), mimetype='application/x-ndjson' if ndjson else 'text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(close)
+    return response
+
+def _time_arg(value, default):
+    """
+    seconds since epoch or ISO datetime
+    """
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/timeseries')
+def timeseries():
+    """
+    Frames kept in memory, ?device=<id>&fields=grid_power_value,load_power_value&start=<time>&end=<time>&limit=<rows>
+    time is seconds since epoch or ISO datetime, default the last hour
+    ranges starting before the oldest frame in memory are read from STORE_DIR store
+    """
+    devices = {d.device_id: d for d in list(mqtt_handler.devices.values())
+               if d.timeseries is not None or d.store is not None}
+    device_id = request.args.get('device')
+    if device_id is None and len(devices) == 1:
+        device_id = next(iter(devices))
+    device = devices.get(device_id)
+    if device is None:
+        return jsonify(error="unknown device", devices=list(devices)), 404
+    fields = request.args.get('fields')
+    try:
+        end = _time_arg(request.args.get('end'), None)
+        start = _time_arg(request.args.get('start'), (end or time.time()) - 3600)
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    fields = fields.split(',') if fields else None
+    first = device.timeseries.stats()["first"] if device.timeseries is not None else None
+    if device.store is not None and (first is None or start < first):
+        data = device.store.query(start, end, fields, limit)
+    else:
+        data = device.timeseries.query(start, end, fields, limit)
+    return Response(json.dumps(data), mimetype='application/json')
+
+@app.route('/rollups')
+def rollups():
+    """
+    Closed min/max/mean/last buckets, ?device=<id>&resolution=minute|hour|day&fields=<keys>&start=<time>&end=<time>
+    &current=true adds the bucket in progress
+    """
+    devices = {d.device_id: d for d in list(mqtt_handler.devices.values())}
+    device_id = request.args.get('device')
+    if device_id is None and len(devices) == 1:
+        device_id = next(iter(devices))
+    device = devices.get(device_id)
+    if device is None:
+        return jsonify(error="unknown device", devices=list(devices)), 404
+    resolution = request.args.get('resolution', HOUR)
+    if resolution not in RESOLUTIONS:
+        return jsonify(error="unknown resolution", resolutions=list(RESOLUTIONS)), 400
+    fields = request.args.get('fields')
+    try:
+        start = _time_arg(request.args.get('start'), None)
+        end = _time_arg(request.args.get('end'), None)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    current = request.args.get('current', 'false').lower() in ('1', 'true', 'yes')
+    buckets = device.rollups.query(resolution, start, end, fields.split(',') if fields else None, current)
+    return jsonify(resolution=resolution, buckets=buckets)
 
 @app.route('/health')
 def health():
@@ -58,6 +235,75 @@ def ready():
     else:
         return Response(status=500)
 
+@app.route('/stats')
+def stats():
+    return jsonify(publisher=mqtt_handler.get_publisher_stats(),
+                   policy=mqtt_handler.get_policy_stats(),
+                   workers=mqtt_handler.get_worker_stats(),
+                   runtime=mqtt_handler.get_runtime_stats(),
+                   logging=get_logging_stats(),
+                   telemetry=mqtt_handler.telemetry.stats(),
+                   storage=mqtt_handler.get_storage_stats())
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(mqtt_handler), mimetype=CONTENT_TYPE)
+
+# --- profiling, enabled only when PROFILING_TOKEN is set ---
+allocation_tracker = AllocationTracker()
+
+def profiling_protected(f):
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        token = get_profiling_token()
+        if token is None:
+            return Response(status=404)
+        given = request.headers.get('X-Profiling-Token') or ''
+        if not hmac.compare_digest(given.encode(), token.encode()):
+            return Response(status=403)
+        return f(*args, **kwargs)
+    return wrapper
+
+@app.route('/debug/profile')
+@profiling_protected
+def debug_profile():
+    try:
+        result = sample_threads(request.args.get('seconds', 5, type=float),
+                                top=request.args.get('top', DEFAULT_TOP, type=int),
+                                thread=request.args.get('thread'))
+    except ProfilerBusy as e:
+        return jsonify(error=str(e)), 409
+    return jsonify(result)
+
+@app.route('/debug/tracemalloc/start', methods=['POST'])
+@profiling_protected
+def debug_tracemalloc_start():
+    return jsonify(allocation_tracker.start(request.args.get('frames', 10, type=int)))
+
+@app.route('/debug/tracemalloc/stop', methods=['POST'])
+@profiling_protected
+def debug_tracemalloc_stop():
+    return jsonify(allocation_tracker.stop())
+
+@app.route('/debug/tracemalloc/snapshot')
+@profiling_protected
+def debug_tracemalloc_snapshot():
+    top = allocation_tracker.snapshot(request.args.get('top', DEFAULT_TOP, type=int),
+                                      request.args.get('group', 'lineno'))
+    if top is None:
+        return jsonify(error="tracemalloc not started"), 409
+    return jsonify(status=allocation_tracker.status(), top=top, buffers=mqtt_handler.get_memory_stats())
+
+@app.route('/debug/tracemalloc/diff')
+@profiling_protected
+def debug_tracemalloc_diff():
+    diff = allocation_tracker.diff(request.args.get('top', DEFAULT_TOP, type=int),
+                                   request.args.get('group', 'lineno'),
+                                   rebase=request.args.get('rebase', 'false').lower() == 'true')
+    if diff is None:
+        return jsonify(error="tracemalloc not started"), 409
+    return jsonify(status=allocation_tracker.status(), diff=diff, buffers=mqtt_handler.get_memory_stats())
+
 @app.route('/set_log_level', methods=['POST'])
 def set_log_level():
     level = request.json.get('level', 'INFO').upper()
@@ -71,7 +317,7 @@ def set_log_level():
     return jsonify(status="success", level=level)
 
 
-mqtt_handler = MqttHandler(mqtt_param=mqtt, foxess=foxess)
+mqtt_handler = create_mqtt_handler(mqtt_param=mqtt, foxess=foxess)
 set_logger_state()
 
 logger.info("Starting Log Viewer application...")
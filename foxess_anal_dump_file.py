@@ -16,27 +16,34 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import argparse
 import json
+import os
+from datetime import datetime
 
+from foxess_capture import CaptureReader
+from foxess_dump_export import export_dump
+from foxess_parallel_dump import parallel_messages
 from foxess_parser_data_tseries import FoxessTSeriesDataParser
 
-CACHE = bytearray()
+READ_SIZE = 1000
 
-def analyse_dump_file(fname):
-    global CACHE
+def analyse_dump_file(fname, workers=1):
+    """
+    :param workers: processes parsing the file, output is the same for any number
+    """
+    if workers != 1:
+        analyse_dump_file_parallel(fname, workers)
+        return
     parser = FoxessTSeriesDataParser()
     try:
         with open(fname, 'rb') as f:
             while True:
-                chunk = f.read(1000)
+                chunk = f.read(READ_SIZE)
                 if not chunk:
                     break
-                CACHE.extend(bytearray(chunk))
-                # process all frames in buffer and stop when no more found
-                stop = -1
-                while len(CACHE) != stop:
-                    stop = len(CACHE)
-                    CACHE = parser.parse_data(CACHE)
+                # process all frames in buffer
+                parser.feed(chunk)
                 # print messages found
                 messages = parser.get_messages()
                 if len(messages)>0:
@@ -50,6 +57,67 @@ def analyse_dump_file(fname):
         print(f"An error occurred while reading file: {e}")
 
 
+def analyse_dump_file_parallel(fname, workers=None):
+    # messages printed in groups of the sequential reading: frames returned after the same read
+    try:
+        group = []
+        group_read = None
+        for ready, message in parallel_messages(fname, workers):
+            read = (ready - 1) // READ_SIZE
+            if read != group_read and group:
+                print(json.dumps(group, indent=4))
+                group = []
+            group_read = read
+            group.append(message)
+        if group:
+            print(json.dumps(group, indent=4))
+    except FileNotFoundError:
+        print(f"File '{fname}' not found.")
+    except Exception as e:
+        print(f"An error occurred while reading file: {e}")
+
+
+def analyse_capture(directory, start=None, end=None):
+    """
+    Replay frames stored by CAPTURE_DIR capture, only frames received in [start, end) are read
+    :param start: datetime or None
+    :param end: datetime or None
+    """
+    parser = FoxessTSeriesDataParser()
+    reader = CaptureReader(directory)
+    start_us = int(start.timestamp() * 1000000) if start else None
+    end_us = int(end.timestamp() * 1000000) if end else None
+    for timestamp, frame in reader.read(start_us, end_us):
+        parser.feed(frame)
+        messages = parser.get_messages()
+        if len(messages)>0:
+            print(datetime.fromtimestamp(timestamp / 1000000).isoformat())
+            print(json.dumps(messages, indent=4, default=str))
+
+
 if __name__ == '__main__':
-    fname = "arch/data1.bin"
-    analyse_dump_file(fname)
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Print frames parsed from a raw dump file or capture directory")
+    arg_parser.add_argument("fname", nargs="?", default="arch/data1.bin",
+                            help="raw dump file or capture directory of one inverter (CAPTURE_DIR/<device>)")
+    arg_parser.add_argument("--start", type=datetime.fromisoformat, help="capture replay from, e.g. 2025-06-01T12:00")
+    arg_parser.add_argument("--end", type=datetime.fromisoformat, help="capture replay to")
+    arg_parser.add_argument("--workers", type=int, default=1,
+                            help="processes parsing a dump file, 0 - one per cpu")
+    arg_parser.add_argument("--export", metavar="OUTPUT",
+                            help="write type 2 frames to a columnar file instead of printing, .parquet or CSV")
+    arg_parser.add_argument("--timezone", default="UTC", help="FOXESS_TIME_ZONE of the inverter, for --export")
+    arg_parser.add_argument("--no-bulk", dest="bulk", action="store_false", default=None,
+                            help="decode frame by frame, also used when numpy is not installed")
+    args = arg_parser.parse_args()
+    if args.export:
+        start_us = int(args.start.timestamp() * 1000000) if args.start else None
+        end_us = int(args.end.timestamp() * 1000000) if args.end else None
+        try:
+            count = export_dump(args.fname, args.export, args.timezone, start_us, end_us, bulk=args.bulk)
+            print(f"{count} frames written to {args.export}")
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"Export failed: {e}")
+    elif os.path.isdir(args.fname):
+        analyse_capture(args.fname, args.start, args.end)
+    else:
+        analyse_dump_file(args.fname, args.workers or None)
\ No newline at end of file
@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Micro benchmarks of the parser hot path
+# run: python foxess_benchmark.py [--suite ...]
+
+import argparse
+import collections
+import logging
+import os
+import shutil
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+import paho.mqtt.client as mqtt
+
+from foxess_capture import CaptureWriter, CaptureReader
+from foxess_crc import crc16_modbus
+from foxess_parser_data_tseries import FoxessTSeriesDataParser, STATUS_ONLINE
+from foxess_device import FoxessDevice, TIMESERIES_COLUMNS
+from foxess_dump_export import export_dump, np, pa
+from foxess_frame_generator import FrameGenerator, build_frame, chunks
+from foxess_logging import RateLimitFilter, start_listener
+from foxess_parallel_dump import parallel_messages
+from foxess_store import FrameStore
+from foxess_timeseries import TimeSeriesRing
+from foxess_timezone import LocalTimeConverter, utc_offset
+from foxess_workers import ShardedWorkerPool
+from helper import FOXESS_DEVICE_NAME, FOXESS_SN
+from test_foxess_crc import crc16_modbus_legacy
+
+
+def parse_frame_2_legacy(frame_data):
+    """
+    Reference field by field decoder (original _parse_frame_2 code)
+    """
+    p = FoxessTSeriesDataParser
+    be2 = p._big_endian2
+    be4 = p._big_endian4
+    prec = p._calculate_precision
+    message = {
+        "grid_power_value": be2(frame_data, p.GRID_POWER_2B),
+        "load_power_value": be2(frame_data, p.LOAD_POWER_2B),
+        "generated_power_value": be2(frame_data, p.CURRENT_POWER_2B),
+        "today_yield_value": prec(be2(frame_data, p.TODAY_YIELD_2B), 1),
+        "total_yield_value": prec(be4(frame_data, p.TOTAL_YIELD_4B), 1),
+        "grid_voltage_r_value": prec(be2(frame_data, p.GRID_VOLTAGE_R_2B), 1),
+        "grid_current_r_value": prec(be2(frame_data, p.GRID_CURRENT_R_2B), 1),
+        "grid_frequency_r_value": prec(be2(frame_data, p.GRID_FREQUENCY_R_2B), 2),
+        "grid_power_r_value": be2(frame_data, p.GRID_POWER_R_2B),
+        "grid_voltage_s_value": prec(be2(frame_data, p.GRID_VOLTAGE_S_2B), 1),
+        "grid_current_s_value": prec(be2(frame_data, p.GRID_CURRENT_S_2B), 1),
+        "grid_frequency_s_value": prec(be2(frame_data, p.GRID_FREQUENCY_S_2B), 2),
+        "grid_power_s_value": be2(frame_data, p.GRID_POWER_S_2B),
+        "grid_voltage_t_value": prec(be2(frame_data, p.GRID_VOLTAGE_T_2B), 1),
+        "grid_current_t_value": prec(be2(frame_data, p.GRID_CURRENT_T_2B), 1),
+        "grid_frequency_t_value": prec(be2(frame_data, p.GRID_FREQUENCY_T_2B), 2),
+        "grid_power_t_value": be2(frame_data, p.GRID_POWER_T_2B),
+        "pv1_voltage_value": prec(be2(frame_data, p.PV1_VOLTAGE_2B), 1),
+        "pv1_current_value": prec(be2(frame_data, p.PV1_CURRENT_2B), 1),
+        "pv2_voltage_value": prec(be2(frame_data, p.PV2_VOLTAGE_2B), 1),
+        "pv2_current_value": prec(be2(frame_data, p.PV2_CURRENT_2B), 1),
+        "pv3_voltage_value": prec(be2(frame_data, p.PV3_VOLTAGE_2B), 1),
+        "pv3_current_value": prec(be2(frame_data, p.PV3_CURRENT_2B), 1),
+        "pv4_voltage_value": prec(be2(frame_data, p.PV4_VOLTAGE_2B), 1),
+        "pv4_current_value": prec(be2(frame_data, p.PV4_CURRENT_2B), 1),
+        "boost_temperature_value": be2(frame_data, p.BOST_TEMP_2B),
+        "inverter_temperature_value": be2(frame_data, p.INVERTER_TEMP_2B),
+        "ambient_temperature_value": be2(frame_data, p.AMBIENT_TEMP_2B),
+        "status": STATUS_ONLINE
+    }
+    for i in range(1, 5):
+        message[f"pv{i}_power_value"] = int(message[f"pv{i}_voltage_value"] * message[f"pv{i}_current_value"])
+    message["fault_messages"] = [{"id": x, "code": be4(frame_data, x)}
+                                 for x in p.FAULT_MESSAGES if be4(frame_data, x) != 0]
+    return message
+
+
+def verify_register_map():
+    parser = FoxessTSeriesDataParser()
+    for _ in range(2000):
+        frame_data = os.urandom(251)
+        assert parser._parse_frame_2(frame_data) == parse_frame_2_legacy(frame_data)
+        assert parser._parse_frame_2(memoryview(frame_data)) == parse_frame_2_legacy(frame_data)
+    print("_parse_frame_2: register map == field by field decoder for random frames")
+
+
+def verify_local_time(timezones=("Europe/Warsaw", "America/New_York", "Australia/Lord_Howe", "UTC")):
+    """
+    Cached conversion has to give the same result as pytz lookup of every timestamp, around every DST
+    transition and for timestamps in random order (cache misses)
+    """
+    for name in timezones:
+        converter = LocalTimeConverter(name)
+        timestamps = [int.from_bytes(os.urandom(4), "big") for _ in range(5000)]
+        for boundary in converter.boundaries:
+            if 0 <= boundary < 2 ** 32:
+                timestamps += [int(boundary) + d for d in (-3601, -1, 0, 1, 1799, 3600)]
+        for timestamp in timestamps:
+            assert converter.to_utc(timestamp) == timestamp - utc_offset(converter.timezone, timestamp), \
+                (name, timestamp)
+    print("LocalTimeConverter: cached offset == pytz lookup around DST transitions and for random timestamps")
+
+
+def bench(name, stmt, number):
+    elapsed = min(timeit.repeat(stmt, number=number, repeat=3))
+    print(f"{name:<40} {number / elapsed:>14,.0f} ops/s  {elapsed / number * 1e6:>10.2f} us/op")
+    return elapsed / number
+
+
+def bench_crc():
+    # type 2 frame payload is 256 bytes
+    payload = os.urandom(256)
+    old = bench("crc16_modbus bitwise (256B)", lambda: crc16_modbus_legacy(payload), 200)
+    new = bench("crc16_modbus table (256B)", lambda: crc16_modbus(payload), 5000)
+    bench("crc16_modbus table memoryview (256B)", lambda: crc16_modbus(memoryview(payload)), 5000)
+    print(f"crc16_modbus speedup: x{old / new:.1f}")
+
+
+def bench_frame_2():
+    parser = FoxessTSeriesDataParser()
+    frame_data = memoryview(os.urandom(251))
+    old = bench("_parse_frame_2 field by field", lambda: parse_frame_2_legacy(frame_data), 20000)
+    new = bench("_parse_frame_2 register map", lambda: parser._parse_frame_2(frame_data), 20000)
+    bench("RegisterMap.unpack (type 2)", lambda: parser.FRAME_2_MAP.unpack(frame_data), 20000)
+    print(f"_parse_frame_2 speedup: x{old / new:.1f}")
+
+
+def bench_local_time(timezone="Europe/Warsaw"):
+    converter = LocalTimeConverter(timezone)
+    # frames of one day without DST change (original raises in the skipped hour), every 5 seconds
+    timestamps = range(1750000000, 1750000000 + 86400, 5)
+    count = len(timestamps)
+    elapsed = min(timeit.repeat(lambda: [FoxessTSeriesDataParser.local_to_utc(t, timezone) for t in timestamps],
+                                number=1, repeat=3))
+    old = elapsed / count
+    print(f"{'local_to_utc pytz per call':<40} {1 / old:>14,.0f} ops/s  {old * 1e6:>10.2f} us/op")
+    elapsed = min(timeit.repeat(lambda: [converter.to_utc(t) for t in timestamps], number=1, repeat=3))
+    new = elapsed / count
+    print(f"{'LocalTimeConverter.to_utc':<40} {1 / new:>14,.0f} ops/s  {new * 1e6:>10.2f} us/op")
+    print(f"device time conversion speedup: x{old / new:.1f}, {converter.misses} offset lookups")
+
+
+def throughput(name, fn, frames, nbytes, number=3):
+    """
+    Best of number runs of fn() processing frames / nbytes, allocations of a single run
+    :return: frames per second
+    """
+    elapsed = min(timeit.repeat(fn, number=1, repeat=number))
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<44} {frames / elapsed:>12,.0f} frames/s {nbytes / elapsed / 1e6:>8.2f} MB/s "
+          f"{peak / 1024:>9.1f} KiB peak")
+    return frames / elapsed
+
+
+def bench_parser(frames=2000, chunk_sizes=(16, 64, 256, 1024, 4096), garbage_ratios=(0.0, 0.25, 1.0)):
+    """
+    Parser throughput on synthetic streams received in chunks of different size
+    """
+    generator = FrameGenerator(seed=1)
+    for garbage in garbage_ratios:
+        # damaged frames only together with garbage, clean stream is the common case
+        damaged = 0.05 if garbage else 0.0
+        data, valid = generator.stream(frames, garbage_ratio=garbage, truncated_ratio=damaged,
+                                       corrupted_ratio=damaged, frame_types=(1, 2, 2, 2, 2, 6))
+        print(f"stream: {frames} frames, {valid} valid, {len(data)} bytes, garbage ratio {garbage}")
+        for size in chunk_sizes:
+            packets = chunks(data, size)
+
+            # messages are taken after every packet, as in FoxessDevice, so peak memory is the working set
+            def feed():
+                parser = FoxessTSeriesDataParser()
+                count = 0
+                for packet in packets:
+                    parser.feed(packet)
+                    count += len(parser.get_messages())
+                assert count == valid
+
+            def parse_data():
+                # call pattern of the original on_message: not parsed rest is prepended to the next packet
+                parser = FoxessTSeriesDataParser()
+                rest = b''
+                for packet in packets:
+                    rest = parser.parse_data(rest + packet)
+                    parser.get_messages()
+
+            throughput(f"  feed        chunk {size:>5}B", feed, valid, len(data))
+            throughput(f"  parse_data  chunk {size:>5}B", parse_data, valid, len(data))
+
+    frame = build_frame(2, os.urandom(250))
+    data = frame[8:-2]
+    count = 5000
+    parser = FoxessTSeriesDataParser()
+    view = memoryview(data)
+
+    def crc():
+        for _ in range(count):
+            crc16_modbus(view)
+
+    def frame_2():
+        for _ in range(count):
+            parser._parse_frame_2(view)
+
+    throughput("crc16_modbus (type 2 frame)", crc, count, count * len(data))
+    throughput("_parse_frame_2", frame_2, count, count * len(data))
+
+
+def bench_devices(devices=32, frames=50, workers=4):
+    """
+    Memory and time per device when many inverters are handled by one process
+    """
+    client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+    pool = ShardedWorkerPool(workers=workers)
+    pool.start()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    handlers = []
+    for i in range(devices):
+        topic = f"foxess/inv{i}/raw"
+        handlers.append(FoxessDevice(f"inv{i}", topic, {}, {FOXESS_DEVICE_NAME: f"Foxess inv{i}", FOXESS_SN: f"SN{i}"},
+                                     client, pool=pool, shard=pool.shard(topic)))
+    payload = build_frame(2, bytes(range(200)))
+
+    def wait():
+        while any(w.queue for w in pool.workers) or any(d.publisher.queue_depth() for d in handlers):
+            time.sleep(0.001)
+
+    # the first frame creates sensors
+    for d in handlers:
+        d.on_payload(payload)
+    wait()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    memory = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    start = time.perf_counter()
+    for _ in range(frames):
+        for d in handlers:
+            d.on_payload(payload)
+    wait()
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    total = devices * frames
+    print(f"devices: {devices}, workers: {workers}, memory per device: {memory / devices / 1024:.1f} KiB")
+    print(f"{total} frames (parse + publish) in {elapsed:.2f}s, {total / elapsed:,.0f} frames/s, "
+          f"{elapsed / total * 1e6:.0f} us/frame")
+
+
+def _thread_cpu(fn, number):
+    start = time.thread_time()
+    for _ in range(number):
+        fn()
+    return (time.thread_time() - start) / number
+
+
+def bench_logging(frames=5000):
+    """
+    CPU of the ingest thread spent on logging per frame: synchronous handlers with eagerly formatted
+    messages (as before) vs. lazy messages put on the listener queue and sampled by RateLimitFilter
+    """
+    generator = FrameGenerator(seed=1)
+    payload = generator.frame_2()
+    message = FoxessTSeriesDataParser().parse_data(payload) or {}
+    devnull = open(os.devnull, "w")
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    sync_handler = logging.StreamHandler(devnull)
+    sync_handler.setFormatter(formatter)
+    sync_logger = logging.getLogger("benchmark_sync")
+    sync_logger.propagate = False
+    sync_logger.addHandler(sync_handler)
+
+    listener_handler = logging.StreamHandler(devnull)
+    listener_handler.setFormatter(formatter)
+    queue_handler, listener = start_listener(listener_handler)
+    queue_handler.addFilter(RateLimitFilter(10))
+    queued_logger = logging.getLogger("benchmark_queued")
+    queued_logger.propagate = False
+    queued_logger.addHandler(queue_handler)
+
+    def sync():
+        sync_logger.debug(f"Message received:{payload.hex()}")
+        sync_logger.debug(payload.hex())
+        sync_logger.info(f"[inv0] data processed {message}")
+
+    def queued():
+        if queued_logger.isEnabledFor(logging.DEBUG):
+            queued_logger.debug("Message received:%s", payload.hex())
+            queued_logger.debug("%s", payload.hex())
+            queued_logger.debug("[%s] data processed %s", "inv0", message)
+
+    for level in (logging.INFO, logging.DEBUG):
+        sync_logger.setLevel(level)
+        queued_logger.setLevel(level)
+        old = _thread_cpu(sync, frames)
+        new = _thread_cpu(queued, frames)
+        name = logging.getLevelName(level)
+        print(f"logging {name:<6} synchronous, eager format       {old * 1e6:>10.2f} us/frame")
+        print(f"logging {name:<6} queued, lazy format, sampled    {new * 1e6:>10.2f} us/frame  x{old / new:.1f}")
+    listener.stop()
+    devnull.close()
+
+
+def bench_capture(frames=100000, segment_size=4 * 1024 * 1024):
+    """
+    Capture store: write rate, size compared to the hex log, time range read from the middle of the capture
+    """
+    generator = FrameGenerator(seed=1)
+    frame = generator.frame_2()
+    directory = tempfile.mkdtemp(prefix="foxess-capture-")
+    try:
+        writer = CaptureWriter(directory, segment_size=segment_size)
+        # one frame per second
+        start = 1700000000 * 1000000
+        begin = time.perf_counter()
+        for i in range(frames):
+            writer.write(frame, start + i * 1000000)
+        writer.close()
+        elapsed = time.perf_counter() - begin
+        stats = CaptureReader(directory).stats()
+        hex_size = frames * (2 * len(frame) + 1)
+        print(f"capture write {frames} frames ({frames / 86400:.1f} days) {frames / elapsed:>12,.0f} frames/s, "
+              f"{stats['segments']} segments, {stats['bytes'] / 1e6:.1f} MB (hex log {hex_size / 1e6:.1f} MB)")
+        reader = CaptureReader(directory)
+        middle = start + frames // 2 * 1000000
+        number = 100
+        begin = time.perf_counter()
+        for _ in range(number):
+            found = sum(1 for _ in reader.read(middle, middle + 60 * 1000000))
+        elapsed = (time.perf_counter() - begin) / number
+        print(f"capture read 1 minute range from the middle: {found} frames in {elapsed * 1e3:.3f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_export(frames=20000, copies=10):
+    """
+    Dump export: frame by frame parser vs. numpy bulk decoding, CSV and Parquet
+    """
+    generator = FrameGenerator(seed=1)
+    data, _ = generator.stream(frames, garbage_ratio=0.1, frame_types=(1, 2, 2, 2, 2, 6))
+    directory = tempfile.mkdtemp(prefix="foxess-export-")
+    try:
+        source = os.path.join(directory, "dump.bin")
+        with open(source, "wb") as f:
+            for _ in range(copies):
+                f.write(data)
+        print(f"dump {os.path.getsize(source) / 1e6:.1f} MB")
+        runs = [("parser", False, "csv")]
+        if np is not None:
+            runs.append(("numpy", True, "csv"))
+            if pa is not None:
+                runs.append(("numpy", True, "parquet"))
+        else:
+            print("numpy not installed, bulk decoding skipped")
+        for name, bulk, extension in runs:
+            output = os.path.join(directory, "frames." + extension)
+            begin = time.perf_counter()
+            count = export_dump(source, output, "Europe/Warsaw", bulk=bulk)
+            elapsed = time.perf_counter() - begin
+            print(f"export {name:<7} {extension:<8} {count} frames {count / elapsed * 60 / 1e6:>8.2f} M frames/min "
+                  f"{os.path.getsize(output) / 1e6:>8.1f} MB")
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_parallel(frames=20000, copies=5):
+    """
+    Dump parsing: sequential parser vs. processes parsing byte ranges, for 1 .. cpu count workers
+    """
+    generator = FrameGenerator(seed=1)
+    data, _ = generator.stream(frames, garbage_ratio=0.25, truncated_ratio=0.05, corrupted_ratio=0.05,
+                               frame_types=(1, 2, 2, 2, 2, 6))
+    directory = tempfile.mkdtemp(prefix="foxess-parallel-")
+    try:
+        source = os.path.join(directory, "dump.bin")
+        with open(source, "wb") as f:
+            for _ in range(copies):
+                f.write(data)
+        begin = time.perf_counter()
+        parser = FoxessTSeriesDataParser()
+        with open(source, "rb") as f:
+            parser.feed(f.read())
+        expected = parser.get_messages()
+        sequential = time.perf_counter() - begin
+        print(f"dump {os.path.getsize(source) / 1e6:.1f} MB, sequential {len(expected)} frames "
+              f"{len(expected) / sequential:>10,.0f} frames/s")
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            begin = time.perf_counter()
+            messages = [m for _, m in parallel_messages(source, workers)]
+            elapsed = time.perf_counter() - begin
+            assert messages == expected
+            print(f"parallel {workers:>3} workers {len(messages) / elapsed:>10,.0f} frames/s "
+                  f"x{sequential / elapsed:.2f}")
+            workers *= 2
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_store(frames=20000, block_rows=12):
+    """
+    Frame store: bytes per value, write rate, time range read (one block per minute, a frame every 5 s)
+    """
+    generator = FrameGenerator(seed=1)
+    parser = FoxessTSeriesDataParser()
+    parsed = []
+    for _ in range(frames):
+        parser.feed(generator.frame_2())
+        parsed += parser.get_messages()
+    directory = tempfile.mkdtemp(prefix="foxess-store-")
+    try:
+        store = FrameStore(directory, TIMESERIES_COLUMNS, flush_interval=3600)
+        start = 1700000000
+        begin = time.perf_counter()
+        for i, f in enumerate(parsed):
+            store.append(start + i * 5, f)
+            if i % block_rows == block_rows - 1:
+                store.flush()
+        store.close()
+        elapsed = time.perf_counter() - begin
+        size = store.stats()["bytes"]
+        values = len(TIMESERIES_COLUMNS) + 2
+        print(f"store write {frames} frames {frames / elapsed:>12,.0f} frames/s, {size / frames:.1f} B/frame, "
+              f"{size / frames / values:.2f} B/value (random values, {block_rows} frames per block)")
+        middle = start + frames * 5 // 2
+        bench("FrameStore query 1 hour, 3 fields",
+              lambda: store.query(middle, middle + 3600, ["grid_power_value", "load_power_value", "pv1_power_value"]),
+              20)
+        bench("FrameStore read all frames", lambda: sum(1 for _ in store.frames()), 1)
+    finally:
+        shutil.rmtree(directory)
+
+
+def _traced(fn):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_timeseries(frames=20000):
+    """
+    Memory per stored frame: deque of parsed frame dicts vs. columnar TimeSeriesRing, time range query
+    """
+    generator = FrameGenerator(seed=1)
+    parser = FoxessTSeriesDataParser()
+    payloads = [generator.frame_2() for _ in range(frames)]
+
+    def parsed():
+        for p in payloads:
+            parser.feed(p)
+            yield from parser.get_messages()
+
+    def fill_deque():
+        history = collections.deque(maxlen=frames)
+        history.extend(parsed())
+        return history
+
+    def fill_ring():
+        ring = TimeSeriesRing(TIMESERIES_COLUMNS, capacity=frames)
+        for i, f in enumerate(parsed()):
+            ring.append(1700000000 + i, f)
+        return ring
+
+    history, deque_size = _traced(fill_deque)
+    del history
+    ring, ring_size = _traced(fill_ring)
+    print(f"deque of dicts   {frames} frames {deque_size / 1e6:>8.2f} MB {deque_size / frames:>8.0f} B/frame")
+    print(f"TimeSeriesRing   {frames} frames {ring_size / 1e6:>8.2f} MB {ring_size / frames:>8.0f} B/frame  "
+          f"x{deque_size / ring_size:.1f} less")
+    start = 1700000000 + frames // 2
+    bench("TimeSeriesRing query 1 hour, 3 fields",
+          lambda: ring.query(start, start + 3600, ["grid_power_value", "load_power_value", "pv1_power_value"]), 100)
+
+
+SUITES = ("verify", "micro", "parser", "devices", "logging", "capture", "timeseries", "export", "parallel", "store")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Foxess parser benchmarks")
+    parser.add_argument("--suite", choices=SUITES, action="append",
+                        help="run only selected suite, may be repeated (default all)")
+    parser.add_argument("--frames", type=int, default=2000, help="frames in synthetic stream")
+    parser.add_argument("--chunk", type=int, action="append", help="chunk size in bytes, may be repeated")
+    parser.add_argument("--garbage", type=float, action="append", help="garbage ratio, may be repeated")
+    args = parser.parse_args()
+    suites = args.suite or SUITES
+
+    if "verify" in suites:
+        verify_register_map()
+        verify_local_time()
+    if "micro" in suites:
+        bench_crc()
+        bench_frame_2()
+        bench_local_time()
+    if "parser" in suites:
+        bench_parser(args.frames,
+                     tuple(args.chunk or (16, 64, 256, 1024, 4096)),
+                     tuple(args.garbage or (0.0, 0.25, 1.0)))
+    if "devices" in suites:
+        bench_devices()
+    if "logging" in suites:
+        bench_logging()
+    if "capture" in suites:
+        bench_capture()
+    if "timeseries" in suites:
+        bench_timeseries()
+    if "export" in suites:
+        bench_export()
+    if "parallel" in suites:
+        bench_parallel()
+    if "store" in suites:
+        bench_store()
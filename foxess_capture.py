@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Binary capture of raw frames.
+# Directory of segments, segment <start us>.frames: magic, then records
+#   timestamp (int64 us since epoch, LE), length (uint16 LE), frame bytes
+# and sidecar <start us>.idx: fixed size entries timestamp (int64 LE), offset of the record (uint64 LE).
+# Timestamps never decrease, so a time range is found by binary search over segment names
+# and then over the mmap-ed index of the segment.
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+logger = logging.getLogger("foxess_capture")
+
+MAGIC = b"FXCAP\x00\x01\x00"
+FRAMES_SUFFIX = ".frames"
+INDEX_SUFFIX = ".idx"
+RECORD = struct.Struct("<qH")
+INDEX_ENTRY = struct.Struct("<qQ")
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_SEGMENT_AGE = 24 * 3600
+# buffered records reach the disk at least this often (seconds)
+FLUSH_INTERVAL = 1.0
+
+
+def now_us():
+    return time.time_ns() // 1000
+
+
+class CaptureWriter:
+    """
+    Appends frames to the current segment, a new segment is started when the segment exceeds
+    segment_size bytes or is older than segment_age seconds, and always when the writer is created.
+    Single writer per directory, close() may be called from other thread than write().
+    :param max_size: oldest segments are deleted on rotation when all segments take more bytes, 0 - keep all
+    """
+
+    def __init__(self, directory, segment_size=DEFAULT_SEGMENT_SIZE, segment_age=DEFAULT_SEGMENT_AGE, max_size=0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segment_age = segment_age
+        self.max_size = max_size
+        self.frames_file = None
+        self.index_file = None
+        self.segment_start = 0
+        self.size = 0
+        self.last_timestamp = 0
+        self.last_flush = 0.0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        segments = list_segments(directory)
+        if segments:
+            # clock may be set back, keep timestamps ordered across segments
+            self.segment_start = segments[-1]
+            self.last_timestamp = max(segments[-1], _last_timestamp(directory, segments[-1]))
+
+    def _open_segment(self, timestamp):
+        self._close_segment()
+        if self.max_size:
+            self._remove_old_segments()
+        self.segment_start = timestamp
+        base = os.path.join(self.directory, str(timestamp))
+        self.frames_file = open(base + FRAMES_SUFFIX, "wb")
+        self.index_file = open(base + INDEX_SUFFIX, "wb")
+        self.frames_file.write(MAGIC)
+        self.size = len(MAGIC)
+        logger.info("Capture segment %s started", base)
+
+    def _close_segment(self):
+        for f in (self.frames_file, self.index_file):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError as e:
+                    # buffered data not written, e.g. disk full
+                    logger.warning("Capture segment not closed cleanly: %s", e)
+        self.frames_file = None
+        self.index_file = None
+
+    def _remove_old_segments(self):
+        segments = list_segments(self.directory)
+        sizes = [segment_size(self.directory, s) for s in segments]
+        total = sum(sizes)
+        for segment, size in zip(segments, sizes):
+            if total <= self.max_size:
+                break
+            base = os.path.join(self.directory, str(segment))
+            for suffix in (FRAMES_SUFFIX, INDEX_SUFFIX):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.info("Capture segment %s removed", base)
+
+    def write(self, frame, timestamp=None):
+        """
+        :param frame: bytes-like, one frame
+        :param timestamp: us since epoch, receive time by default
+        """
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self._write(frame, now_us() if timestamp is None else timestamp)
+            except OSError as e:
+                # e.g. disk full, capture must not stop parsing, next frame starts a new segment
+                logger.error("Capture write failed: %s", e)
+                self._close_segment()
+
+    def _write(self, frame, timestamp):
+        timestamp = max(timestamp, self.last_timestamp)
+        if (self.frames_file is None or self.size >= self.segment_size
+                or timestamp - self.segment_start >= self.segment_age * 1000000):
+            # segment name is its first timestamp, names are unique and ordered
+            timestamp = max(timestamp, self.segment_start + 1)
+            self._open_segment(timestamp)
+        self.index_file.write(INDEX_ENTRY.pack(timestamp, self.size))
+        self.frames_file.write(RECORD.pack(timestamp, len(frame)))
+        self.frames_file.write(frame)
+        self.size += RECORD.size + len(frame)
+        self.last_timestamp = timestamp
+        self.frames_written += 1
+        self.bytes_written += RECORD.size + len(frame)
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_INTERVAL:
+            self._flush()
+            self.last_flush = now
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.frames_file is not None:
+            # frames first, reader skips index entries pointing past the end of frames file
+            self.frames_file.flush()
+            self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self._flush()
+            self._close_segment()
+
+
+def list_segments(directory):
+    """
+    :return: sorted start timestamps of segments
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-len(FRAMES_SUFFIX)]) for n in names
+                  if n.endswith(FRAMES_SUFFIX) and n[:-len(FRAMES_SUFFIX)].isdigit())
+
+
+def segment_size(directory, segment):
+    base = os.path.join(directory, str(segment))
+    size = 0
+    for suffix in (FRAMES_SUFFIX, INDEX_SUFFIX):
+        try:
+            size += os.path.getsize(base + suffix)
+        except FileNotFoundError:
+            pass
+    return size
+
+
+def _last_timestamp(directory, segment):
+    try:
+        with SegmentIndex(os.path.join(directory, str(segment) + INDEX_SUFFIX)) as index:
+            return index[len(index) - 1] if len(index) else 0
+    except OSError:
+        return 0
+
+
+class SegmentIndex:
+    """
+    Read only view of a segment index, index[i] is the timestamp of record i.
+    Entries of a segment still being written are visible up to the last flush.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.count = size // INDEX_ENTRY.size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return INDEX_ENTRY.unpack_from(self.map, i * INDEX_ENTRY.size)[0]
+
+    def entry(self, i):
+        return INDEX_ENTRY.unpack_from(self.map, i * INDEX_ENTRY.size)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CaptureReader:
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self, start=None, end=None):
+        """
+        Segments which may contain frames with start <= timestamp < end
+        """
+        segments = list_segments(self.directory)
+        first = 0 if start is None else max(0, bisect_right(segments, start) - 1)
+        last = len(segments) if end is None else bisect_left(segments, end)
+        return segments[first:last]
+
+    def read(self, start=None, end=None):
+        """
+        Frames received in [start, end), timestamps in us since epoch
+        :return: generator of (timestamp, frame bytes)
+        """
+        for segment in self.segments(start, end):
+            base = os.path.join(self.directory, str(segment))
+            with SegmentIndex(base + INDEX_SUFFIX) as index, open(base + FRAMES_SUFFIX, "rb") as f:
+                if not len(index):
+                    continue
+                size = os.fstat(f.fileno()).st_size
+                first = 0 if start is None else bisect_left(index, start)
+                if first >= len(index):
+                    continue
+                last = len(index) if end is None else bisect_left(index, end, lo=first)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for i in range(first, last):
+                        timestamp, offset = index.entry(i)
+                        if offset + RECORD.size > size:
+                            break
+                        _, length = RECORD.unpack_from(data, offset)
+                        begin = offset + RECORD.size
+                        if begin + length > size:
+                            # segment being written, rest not flushed yet
+                            logger.debug("Capture segment %s truncated", base)
+                            break
+                        yield timestamp, data[begin:begin + length]
+
+    def stats(self):
+        segments = list_segments(self.directory)
+        size = 0
+        frames = 0
+        for segment in segments:
+            size += segment_size(self.directory, segment)
+            index = os.path.join(self.directory, str(segment) + INDEX_SUFFIX)
+            frames += os.path.getsize(index) // INDEX_ENTRY.size if os.path.exists(index) else 0
+        return {"segments": len(segments), "frames": frames, "bytes": size,
+                "first": segments[0] if segments else None}
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# CRC-16/Modbus (poly 0xA001 reflected, init 0xFFFF) used by the inverter frames.
+# Table driven - one lookup per byte instead of 8 shift/xor steps.
+
+CRC16_MODBUS_INIT = 0xFFFF
+CRC16_MODBUS_POLY = 0xA001
+
+
+def _build_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 0x1:
+                crc = (crc >> 1) ^ CRC16_MODBUS_POLY
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_MODBUS_TABLE = _build_table()
+
+
+def crc16_modbus(data, crc=CRC16_MODBUS_INIT):
+    """
+    Calculate CRC-16/Modbus of data
+    :param data: bytes, bytearray or memoryview
+    :param crc: initial value, pass previous result to continue calculation
+    :return: int
+    """
+    if data is None:
+        return 0
+    table = CRC16_MODBUS_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+class Crc16Modbus:
+    """
+    Incremental CRC-16/Modbus, data can be fed in chunks as they arrive.
+    """
+
+    def __init__(self, data=None):
+        self.crc = CRC16_MODBUS_INIT
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        self.crc = crc16_modbus(data, self.crc)
+        return self
+
+    def reset(self):
+        self.crc = CRC16_MODBUS_INIT
+
+    def value(self):
+        return self.crc
+
+    def matches(self, crc_bytes):
+        """
+        Compare with crc as transmitted in frame (2 bytes, little endian)
+        """
+        return self.crc == int.from_bytes(crc_bytes, 'little')
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# State of a single inverter: parser, HA sensors and publisher.
+# One MqttHandler may serve many devices, each identified by the mqtt topic it publishes to.
+
+import collections
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from foxess_capture import CaptureWriter
+from foxess_metrics import Histogram, PARSE_BUCKETS
+from foxess_parser_data_tseries import FoxessTSeriesDataParser, STATUS_ONLINE, STATUS_OFFLINE
+from foxess_energy import EnergyIntegrator, ENERGY_SOURCES, DEFAULT_MAX_GAP
+from foxess_publisher import SensorPublisher
+from foxess_rollups import RollupEngine, RESOLUTIONS, HOUR
+from foxess_store import FrameStore
+from foxess_sensors_handler import FoxessSensorsHandler, rollup_key, ROLLUP_STATS
+from foxess_timeseries import TimeSeriesRing, frame_columns, PV_POWER_COLUMNS, DEFAULT_CAPACITY
+from helper import FOXESS_TIME_ZONE, PUBLISH_QUEUE_SIZE, PUBLISH_POLICY
+from helper import CAPTURE_DIR, CAPTURE_SEGMENT_SIZE, CAPTURE_SEGMENT_AGE, CAPTURE_MAX_SIZE, TIMESERIES_CAPACITY
+from helper import ROLLUP_SENSORS, ROLLUP_SENSOR_RESOLUTION, ENERGY_SENSORS, ENERGY_STATE_DIR, ENERGY_MAX_GAP
+from helper import STORE_DIR, STORE_SEGMENT_SPAN, STORE_FLUSH_INTERVAL, STORE_RETENTION
+
+logger = logging.getLogger("foxess_device")
+
+MAX_HISTORY_BUFFER = 10
+TIMESERIES_COLUMNS = frame_columns(FoxessTSeriesDataParser.FRAME_2_MAP, extra=PV_POWER_COLUMNS)
+
+
+class FoxessDevice:
+
+    def __init__(self, device_id, topic, mqtt_param, foxess, client, pool=None, shard=0, inline=False,
+                 telemetry=None):
+        """
+        Data is processed on the pool worker number shard, without pool on the calling thread.
+        inline - publish on the calling thread too (asyncio runtime), otherwise publisher has own thread
+        telemetry - TelemetryRing receiving parsed frames for live HTTP clients
+        """
+        self.device_id = device_id
+        self.topic = topic
+        self.pool = pool
+        self.shard = shard
+        self.inline = inline
+        self.telemetry = telemetry
+        self.status = STATUS_ONLINE
+        self.last_message_timestamp = datetime.now()
+        self.history = collections.deque(maxlen=MAX_HISTORY_BUFFER)
+        # the last data handed to the publisher
+        self.last_data = {}
+        capacity = mqtt_param.get(TIMESERIES_CAPACITY, DEFAULT_CAPACITY)
+        self.timeseries = TimeSeriesRing(TIMESERIES_COLUMNS, capacity) if capacity else None
+        # frames received while the time series is loaded from the store, None when loaded
+        self.restoring = None
+        self.restore_lock = threading.Lock()
+        # metrics
+        self.payloads_received = 0
+        # payloads dropped from a full worker queue, the parser is reset before the next one
+        self.payloads_dropped = 0
+        self.parser_resets = 0
+        self.bytes_received = 0
+        self.offline_transitions = 0
+        self.parse_latency = Histogram(PARSE_BUCKETS)
+
+        self.capture = self._create_capture(mqtt_param)
+        self.store = self._create_store(mqtt_param)
+        self.parser = FoxessTSeriesDataParser(timezone=foxess.get(FOXESS_TIME_ZONE, 'UTC'), capture=self.capture)
+        self.sensors = FoxessSensorsHandler(mqtt_param, foxess=foxess, client=client)
+        self.rollups = RollupEngine(foxess.get(FOXESS_TIME_ZONE, 'UTC'))
+        self.rollup_sensors = mqtt_param.get(ROLLUP_SENSORS) or []
+        self.rollup_resolution = mqtt_param.get(ROLLUP_SENSOR_RESOLUTION, HOUR)
+        if self.rollup_resolution not in RESOLUTIONS:
+            logger.error("Unknown %s: %s, using %s", ROLLUP_SENSOR_RESOLUTION, self.rollup_resolution, HOUR)
+            self.rollup_resolution = HOUR
+        # values of the last closed bucket for rollup sensors
+        self.rollup_values = {}
+        if self.rollup_sensors:
+            self.sensors.add_rollup_sensors(self.rollup_sensors, self.rollup_resolution)
+        self.energy = None
+        # total_increasing counters must not start from 0 after a restart, so only with a state directory
+        if mqtt_param.get(ENERGY_SENSORS, True) and mqtt_param.get(ENERGY_STATE_DIR):
+            self.energy = EnergyIntegrator(device_id, mqtt_param.get(ENERGY_STATE_DIR),
+                                           mqtt_param.get(ENERGY_MAX_GAP, DEFAULT_MAX_GAP))
+            self.sensors.add_energy_sensors([key for key, _ in ENERGY_SOURCES])
+        self.publisher = SensorPublisher(self.sensors,
+                                         queue_size=mqtt_param.get(PUBLISH_QUEUE_SIZE, 100),
+                                         policy=mqtt_param.get(PUBLISH_POLICY, "drop_oldest"),
+                                         pool=pool, shard=shard)
+        if pool is None and not inline:
+            self.publisher.start()
+
+    def _device_dir(self, directory):
+        # device id is the topic in single inverter setup
+        return os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]", "_", self.device_id))
+
+    def _create_capture(self, mqtt_param):
+        directory = mqtt_param.get(CAPTURE_DIR)
+        if not directory:
+            return None
+        return CaptureWriter(self._device_dir(directory),
+                             segment_size=mqtt_param.get(CAPTURE_SEGMENT_SIZE, 64) * 1024 * 1024,
+                             segment_age=mqtt_param.get(CAPTURE_SEGMENT_AGE, 24) * 3600,
+                             max_size=mqtt_param.get(CAPTURE_MAX_SIZE, 0) * 1024 * 1024)
+
+    def _create_store(self, mqtt_param):
+        directory = mqtt_param.get(STORE_DIR)
+        if not directory:
+            return None
+        store = FrameStore(self._device_dir(directory), TIMESERIES_COLUMNS,
+                           segment_span=mqtt_param.get(STORE_SEGMENT_SPAN, 24) * 3600,
+                           flush_interval=mqtt_param.get(STORE_FLUSH_INTERVAL, 60),
+                           retention=mqtt_param.get(STORE_RETENTION, 0) * 86400)
+        if self.timeseries is not None:
+            # history kept in memory before the restart, read on own thread, the constructor runs on the network
+            # thread (or asyncio loop); frames received meanwhile wait in self.restoring
+            self.restoring = []
+            threading.Thread(target=self._restore_timeseries, args=(store, time.time()),
+                             name=f"foxess-restore-{self.device_id}", daemon=True).start()
+        return store
+
+    def _restore_timeseries(self, store, end):
+        try:
+            start = store.first_of_last(self.timeseries.capacity)
+            if start is not None:
+                for timestamp, frame in store.frames(start, end):
+                    self.timeseries.append(timestamp, frame)
+                logger.info(f"[{self.device_id}] {len(self.timeseries)} frames loaded from store")
+        except (OSError, ValueError) as e:
+            logger.error(f"[{self.device_id}] Frames not loaded from store: {e}")
+        finally:
+            with self.restore_lock:
+                for timestamp, frame in self.restoring:
+                    self.timeseries.append(timestamp, frame)
+                self.restoring = None
+
+    def _append_timeseries(self, timestamp, frame):
+        if self.restoring is not None:
+            with self.restore_lock:
+                if self.restoring is not None:
+                    self.restoring.append((timestamp, frame))
+                    return
+        self.timeseries.append(timestamp, frame)
+
+    def on_payload(self, payload):
+        """
+        Called with raw bytes received on device topic
+        """
+        self.last_message_timestamp = datetime.now()
+        if self.pool is None:
+            self.process_payload(payload)
+        else:
+            self.pool.submit(self.shard, self.process_payload, payload, on_drop=self._payload_dropped)
+
+    def _payload_dropped(self, payload):
+        # runs on the mqtt thread, the parser is reset on the worker before the next payload
+        self.payloads_dropped += 1
+
+    def process_payload(self, payload):
+        if self.parser_resets != self.payloads_dropped:
+            # payloads are pieces of one byte stream, a frame spanning the dropped one cannot be completed
+            self.parser_resets = self.payloads_dropped
+            self.parser.scanner.clear()
+        self.payloads_received += 1
+        self.bytes_received += len(payload)
+        received = time.time()
+        start = time.perf_counter()
+        self.parser.feed(payload)
+        parsed_frames = self.parser.get_messages()
+        self.parse_latency.observe(time.perf_counter() - start)
+
+        self.status = STATUS_ONLINE
+        for f in parsed_frames:
+            if self.telemetry is not None:
+                self.telemetry.publish(self.device_id, f)
+            if self.timeseries is not None:
+                self._append_timeseries(received, f)
+            if self.store is not None:
+                self.store.append(received, f)
+            for resolution, bucket in self.rollups.update(received, f):
+                if resolution == self.rollup_resolution and self.rollup_sensors:
+                    self.rollup_values = self._rollup_values(bucket)
+            # every telemetry (type 2) frame carries the last closed bucket, the frame closing it may be dropped by the publisher
+            if self.rollup_values and "load_power_value" in f:
+                f.update(self.rollup_values)
+            if self.energy is not None:
+                energy = self.energy.update(f)
+                if energy is not None:
+                    f.update(energy)
+            self._submit(f)
+            if logger.isEnabledFor(logging.DEBUG):
+                # every frame, no record is even created at INFO; sampled by LOG_RATE_LIMIT,
+                # formatted on the log listener thread
+                logger.debug("[%s] data processed %s", self.device_id, f)
+            self.history.append(f)
+
+    def _rollup_values(self, bucket):
+        values = {}
+        for key in self.rollup_sensors:
+            stats = bucket.values(key)
+            if stats is not None:
+                for stat in ROLLUP_STATS:
+                    values[rollup_key(key, self.rollup_resolution, stat)] = round(stats[stat], 3)
+        return values
+
+    def _submit(self, data):
+        self.last_data = data
+        self.publisher.submit(data)
+        if self.inline:
+            self.publisher.drain()
+
+    def flush_storage(self):
+        """
+        Called periodically, so the last frames are written to the store (when flush interval passed)
+        and capture even when no frame follows them
+        """
+        if self.store is not None:
+            self.store.flush(due=True)
+        if self.capture is not None:
+            self.capture.flush()
+
+    def check_offline(self, timeout):
+        self.flush_storage()
+        if (datetime.now() - self.last_message_timestamp).total_seconds() > timeout:
+            self.set_offline()
+
+    def set_offline(self):
+        if self.status != STATUS_ONLINE:
+            return
+        if self.pool is None:
+            self._set_offline()
+        else:
+            # parser, energy, time series and store are owned by the worker
+            self.pool.submit(self.shard, self._set_offline, droppable=False)
+
+    def _set_offline(self):
+        if self.status != STATUS_ONLINE:
+            return
+        logger.debug(f"[{self.device_id}] Inverter is offline, last message received at {self.last_message_timestamp}")
+        logger.info(f"[{self.device_id}] Inverter is offline")
+        message = self.parser.get_message_offline()
+        if self.energy is not None:
+            self.energy.reset()
+        if self.telemetry is not None:
+            self.telemetry.publish(self.device_id, message)
+        if self.timeseries is not None:
+            self._append_timeseries(time.time(), message)
+        if self.store is not None:
+            self.store.append(time.time(), message)
+            # no frames until the inverter is back, possibly the next morning
+            self.store.flush()
+        self._submit(message)
+        self.status = STATUS_OFFLINE
+        self.offline_transitions += 1
+
+    def request_discovery(self):
+        if self.pool is None:
+            self._request_discovery()
+        else:
+            self.pool.submit(self.shard, self._request_discovery, droppable=False)
+
+    def _request_discovery(self):
+        self.sensors.request_discovery()
+        # last values are sent again with the configs, an empty dict would be merged away by POLICY_LATEST
+        # and the inverter may be offline until morning
+        self._submit(dict(self.last_data))
+
+    def stop(self):
+        self.publisher.stop()
+        if self.energy is not None:
+            self.energy.save()
+        if self.capture is not None:
+            self.capture.close()
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Cache of Home Assistant discovery payloads.
+# Payload is built once per sensor definition (key = hash of the definition),
+# optionally stored on disk together with information what was already published (retained) to the broker.
+
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger("foxess_discovery_cache")
+
+
+class DiscoveryEntry:
+    """
+    Serialized discovery config of one sensor
+    """
+    __slots__ = ("config_topic", "state_topic", "config", "config_hash")
+
+    def __init__(self, config_topic, state_topic, config, config_hash):
+        self.config_topic = config_topic
+        self.state_topic = state_topic
+        self.config = config
+        self.config_hash = config_hash
+
+    def to_dict(self):
+        return {"config_topic": self.config_topic, "state_topic": self.state_topic, "config": self.config}
+
+
+def definition_hash(definition):
+    data = json.dumps(definition, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+class DiscoveryCache:
+    """
+    In memory cache of discovery payloads, stored in <directory>/discovery_<sn>.json when directory is set.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.sn = None
+        # definition hash -> DiscoveryEntry
+        self.entries = {}
+        # config topic -> config hash already published to the broker
+        self.published = {}
+        # keys used since load, the others belong to sensors which do not exist any more
+        self.seen = set()
+        self.dirty = False
+
+    def _path(self):
+        return os.path.join(self.directory, f"discovery_{self.sn}.json")
+
+    def load(self, sn):
+        if self.sn == sn:
+            return
+        self.sn = sn
+        self.entries = {}
+        self.published = {}
+        self.seen = set()
+        if self.directory is None:
+            return
+        try:
+            with open(self._path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for h, e in data.get("entries", {}).items():
+                self.entries[h] = DiscoveryEntry(e["config_topic"], e["state_topic"], e["config"],
+                                                 definition_hash(e["config"]))
+            self.published = data.get("published", {})
+            logger.info(f"Discovery cache loaded, {len(self.entries)} entries")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discovery cache {self._path()} not loaded: {e}")
+
+    def save(self):
+        if self.directory is None or not self.dirty:
+            return
+        data = {
+            "entries": {h: e.to_dict() for h, e in self.entries.items()},
+            "published": self.published,
+        }
+        path = self._path()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"Discovery cache {path} not saved: {e}")
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.seen.add(key)
+        return entry
+
+    def add(self, key, config_topic, state_topic, config):
+        entry = DiscoveryEntry(config_topic, state_topic, config, definition_hash(config))
+        self.entries[key] = entry
+        self.seen.add(key)
+        self.dirty = True
+        return entry
+
+    def prune(self):
+        """
+        Drops entries not used since load, called after a full discovery pass
+        """
+        stale = [key for key in self.entries if key not in self.seen]
+        for key in stale:
+            del self.entries[key]
+        topics = {e.config_topic for e in self.entries.values()}
+        published = {t: h for t, h in self.published.items() if t in topics}
+        if stale or len(published) != len(self.published):
+            self.published = published
+            self.dirty = True
+            logger.info(f"Discovery cache pruned, {len(stale)} entries removed")
+
+    def is_published(self, entry):
+        return self.published.get(entry.config_topic) == entry.config_hash
+
+    def set_published(self, entry):
+        self.published[entry.config_topic] = entry.config_hash
+        self.dirty = True
+
+    def clear_published(self):
+        self.published = {}
+        self.dirty = True
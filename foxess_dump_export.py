@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Export of type 2 frames from dump files and capture directories to a columnar file (CSV or Parquet).
+# With numpy a block of the dump is decoded at once: frame headers are found by array comparisons,
+# crc is computed for all frames of the same length together and every type 2 frame is one row of
+# a structured big endian array. Without numpy frames are decoded one by one by the parser, the output is the same.
+# Parquet needs pyarrow.
+
+import csv
+import logging
+import os
+
+from foxess_capture import CaptureReader
+from foxess_crc import CRC16_MODBUS_TABLE
+from foxess_parser_data_tseries import FoxessTSeriesDataParser, FRAME_TYPES, FRAME_HEADER_SIZE, FRAME_LENGTH_OFFSET
+from foxess_register_map import register_format
+from foxess_timezone import LocalTimeConverter, utc_offset
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger("foxess_dump_export")
+
+# bytes decoded at once
+BLOCK_SIZE = 16 * 1024 * 1024
+
+FRAME_2_MAP = FoxessTSeriesDataParser.FRAME_2_MAP
+FAULT_MAP = FoxessTSeriesDataParser.FAULT_MAP
+PV_POWER = tuple((f"pv{i}_power_value", f"pv{i}_voltage_value", f"pv{i}_current_value") for i in range(1, 5))
+DEVICE_TIME = "device_time"
+COLUMNS = ((DEVICE_TIME,) + tuple(r.key for r in FRAME_2_MAP.registers if not r.text)
+           + tuple(p[0] for p in PV_POWER) + tuple(f"fault_{x}" for x in FAULT_MAP.keys))
+
+
+class PythonDecoder:
+    """
+    Reference decoder, frames parsed by FoxessTSeriesDataParser
+    """
+
+    def __init__(self, timezone="UTC"):
+        self.parser = FoxessTSeriesDataParser(timezone=timezone)
+
+    def decode(self, data):
+        """
+        :param data: next bytes of the stream, incomplete frame at the end is kept for the next call
+        :return: dict column -> list, None when there is no type 2 frame
+        """
+        self.parser.feed(data)
+        messages = [m for m in self.parser.get_messages() if FRAME_2_MAP.keys[0] in m]
+        if not messages:
+            return None
+        columns = {key: [m[key] for m in messages] for key in COLUMNS[:-len(FAULT_MAP.keys)]}
+        faults = [{f["id"]: f["code"] for f in m["fault_messages"]} for m in messages]
+        for x in FAULT_MAP.keys:
+            columns[f"fault_{x}"] = [f.get(x, 0) for f in faults]
+        return columns
+
+
+class NumpyDecoder:
+    """
+    Finds the same frames as FrameScanner (including resync after a crc error), decodes a block at once
+    """
+
+    def __init__(self, timezone="UTC", frame_types=FRAME_TYPES):
+        self.converter = LocalTimeConverter(timezone)
+        self.frame_types = np.array(sorted(frame_types), dtype=np.uint8)
+        self.table = np.array(CRC16_MODBUS_TABLE, dtype=np.uint32)
+        self.width = max(FRAME_2_MAP.size, FAULT_MAP.size, FoxessTSeriesDataParser.DEVICE_TIME + 4)
+        fields = {r.key: (">" + register_format(r), r.offset)
+                  for r in FRAME_2_MAP.registers + FAULT_MAP.registers if not r.text}
+        fields[DEVICE_TIME] = (">u4", FoxessTSeriesDataParser.DEVICE_TIME)
+        # registers may overlap, fields of a structured dtype can
+        self.dtype = np.dtype({"names": [str(k) for k in fields], "formats": [f for f, _ in fields.values()],
+                               "offsets": [o for _, o in fields.values()], "itemsize": self.width})
+        self.rest = b""
+
+    def decode(self, data):
+        """
+        :param data: next bytes of the stream, incomplete frame at the end is kept for the next call
+        :return: dict column -> numpy array, None when there is no type 2 frame
+        """
+        buffer = np.frombuffer(self.rest + bytes(data), dtype=np.uint8) if self.rest else \
+            np.frombuffer(data, dtype=np.uint8)
+        starts, types, consumed = self._frames(buffer)
+        self.rest = buffer[consumed:].tobytes()
+        return self._decode_frame_2(buffer, starts[types == 2])
+
+    def _headers(self, a):
+        # same headers as FRAME_PATTERN: 5 zero bytes, length, 7E 7E, frame type
+        count = len(a) - FRAME_HEADER_SIZE + 1
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        starts = np.flatnonzero((a[6:6 + count] == 0x7E) & (a[7:7 + count] == 0x7E))
+        for i in range(5):
+            starts = starts[a[starts + i] == 0]
+        lengths = a[starts + 5]
+        # '.' of the pattern does not match new line; shorter frames never have a valid crc
+        starts = starts[np.isin(a[starts + 8], self.frame_types) & (lengths != 0x0A) & (lengths >= 4)]
+        return starts
+
+    def _crc_valid(self, a, starts, lengths):
+        valid = np.zeros(len(starts), dtype=bool)
+        for length in np.unique(lengths):
+            group = np.flatnonzero(lengths == length)
+            begin = starts[group] + FRAME_HEADER_SIZE - 1
+            # frame[8:-2], row per byte position, column per frame
+            data = a[begin[None, :] + np.arange(length - 4)[:, None]]
+            crc = np.full(len(group), 0xFFFF, dtype=np.uint32)
+            table = self.table
+            for row in data:
+                crc = (crc >> 8) ^ table[(crc ^ row) & 0xFF]
+            end = starts[group] + FRAME_LENGTH_OFFSET + length
+            valid[group] = crc == (a[end - 2].astype(np.uint32) | (a[end - 1].astype(np.uint32) << 8))
+        return valid
+
+    def _frames(self, a):
+        """
+        :return: (starts, frame types) of valid frames, number of bytes which are not needed any more
+        """
+        size = len(a)
+        starts = self._headers(a)
+        ends = starts + FRAME_LENGTH_OFFSET + a[starts + 5]
+        complete = ends <= size
+        valid = np.zeros(len(starts), dtype=bool)
+        valid[complete] = self._crc_valid(a, starts[complete], a[starts[complete] + 5].astype(np.int64))
+        # frames do not overlap, header inside an accepted frame is skipped as by the scanner
+        cursor = 0
+        accepted = []
+        pending = None
+        for i, (start, end, ok) in enumerate(zip(starts.tolist(), ends.tolist(), valid.tolist())):
+            if start < cursor:
+                continue
+            if end > size:
+                pending = start
+                break
+            if ok:
+                accepted.append(i)
+                cursor = end
+        consumed = pending if pending is not None else max(cursor, size - FRAME_HEADER_SIZE + 1, 0)
+        accepted = np.array(accepted, dtype=np.int64)
+        return starts[accepted], a[starts[accepted] + 8], consumed
+
+    def _decode_frame_2(self, a, starts):
+        if not len(starts):
+            return None
+        positions = np.arange(self.width)
+        index = starts[:, None] + (FRAME_HEADER_SIZE - 1) + positions[None, :]
+        rows = a[np.minimum(index, len(a) - 1)]
+        # short frame, missing registers are zero as in RegisterMap.unpack
+        rows[positions[None, :] >= (a[starts + 5].astype(np.int64) - 4)[:, None]] = 0
+        records = rows.view(self.dtype).ravel()
+
+        columns = {DEVICE_TIME: self._to_utc(records[DEVICE_TIME].astype(np.int64))}
+        for r in FRAME_2_MAP.registers:
+            if r.text:
+                continue
+            values = records[r.key].astype(np.int64)
+            columns[r.key] = values / 10 ** r.precision if r.precision else values
+        for key, voltage, current in PV_POWER:
+            columns[key] = np.trunc(columns[voltage] * columns[current]).astype(np.int64)
+        for x in FAULT_MAP.keys:
+            columns[f"fault_{x}"] = records[str(x)].astype(np.int64)
+        return {key: columns[key] for key in COLUMNS}
+
+    def _to_utc(self, local):
+        # one pytz lookup per DST interval present in the block
+        interval = np.searchsorted(np.array(self.converter.boundaries), local, side="right")
+        offsets = np.empty(len(local))
+        for i in np.unique(interval):
+            mask = interval == i
+            offsets[mask] = utc_offset(self.converter.timezone, int(local[mask][0]))
+        return local - offsets
+
+
+class CsvWriter:
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, columns):
+        self.writer.writerows(zip(*(c.tolist() if np is not None and isinstance(c, np.ndarray) else c
+                                    for c in columns.values())))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    """
+    Row group per decoded block
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def write(self, columns):
+        table = pa.table({key: pa.array(values, type=pa.float64() if key == DEVICE_TIME or isinstance(values[0], float)
+                                        else pa.int64()) for key, values in columns.items()})
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def _blocks(source, start=None, end=None, block_size=BLOCK_SIZE):
+    if os.path.isdir(source):
+        # capture directory, frames are complete already
+        block = []
+        size = 0
+        for _, frame in CaptureReader(source).read(start, end):
+            block.append(frame)
+            size += len(frame)
+            if size >= block_size:
+                yield b"".join(block)
+                block = []
+                size = 0
+        if block:
+            yield b"".join(block)
+        return
+    with open(source, "rb") as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                return
+            yield data
+
+
+def export_dump(source, output, timezone="UTC", start=None, end=None, bulk=None, block_size=BLOCK_SIZE):
+    """
+    Writes values of all type 2 frames, output format by extension: .parquet or CSV
+    :param source: raw dump file or capture directory
+    :param start: capture directory only, us since epoch
+    :param end: capture directory only, us since epoch
+    :param bulk: True - numpy decoder, False - parser, None - numpy when available
+    :return: number of exported frames
+    """
+    if bulk is None:
+        bulk = np is not None
+    if bulk and np is None:
+        raise RuntimeError("numpy is not installed, bulk decoding not available")
+    if LocalTimeConverter(timezone).timezone is None:
+        raise ValueError(f"Unknown timezone: {timezone}")
+    if output.endswith(".parquet"):
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed, Parquet export not available")
+        writer = ParquetWriter(output)
+    else:
+        writer = CsvWriter(output)
+    decoder = NumpyDecoder(timezone) if bulk else PythonDecoder(timezone)
+    frames = 0
+    try:
+        for data in _blocks(source, start, end, block_size):
+            columns = decoder.decode(data)
+            if columns is not None:
+                writer.write(columns)
+                frames += len(columns[DEVICE_TIME])
+    finally:
+        writer.close()
+    logger.info("%s frames exported to %s", frames, output)
+    return frames
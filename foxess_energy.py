@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Energy counters integrated from power values of type 2 frames.
+# Trapezoidal rule over device_time of consecutive frames, only the previous frame is kept.
+# Interval longer than max_gap (inverter offline, lost frames, clock set) is not integrated.
+# Totals are stored in <directory>/energy_<device>.json, so a restart keeps them.
+
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger("foxess_energy")
+
+# energy key, power key
+# grid_power_value is read as unsigned, the direction of the grid flow is not known, so there is no grid energy
+ENERGY_SOURCES = (
+    ("load_energy_value", "load_power_value"),
+    ("pv1_energy_value", "pv1_power_value"),
+    ("pv2_energy_value", "pv2_power_value"),
+    ("pv3_energy_value", "pv3_power_value"),
+    ("pv4_energy_value", "pv4_power_value"),
+)
+DEFAULT_MAX_GAP = 60
+# seconds between writes of the state file
+SAVE_INTERVAL = 60
+
+
+class EnergyIntegrator:
+    """
+    Called by the device worker only
+    :param directory: state file location, None - totals kept in memory only
+    :param max_gap: seconds, longer intervals between frames are skipped
+    """
+
+    def __init__(self, device_id, directory=None, max_gap=DEFAULT_MAX_GAP):
+        self.max_gap = max_gap
+        self.path = None
+        if directory:
+            self.path = os.path.join(directory, "energy_%s.json" % re.sub(r"[^A-Za-z0-9_.-]", "_", device_id))
+        # Wh, in ENERGY_SOURCES order
+        self.totals = [0.0] * len(ENERGY_SOURCES)
+        # device_time and powers of the previous frame
+        self.last_time = None
+        self.last_powers = None
+        self.last_save = time.monotonic()
+        self.dirty = False
+        self.gaps = 0
+        self.load()
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            totals = data.get("totals", {})
+            self.totals = [float(totals.get(key, 0.0)) for key, _ in ENERGY_SOURCES]
+            last = data.get("last")
+            if last and len(last["powers"]) == len(ENERGY_SOURCES):
+                # continues when the restart was shorter than max_gap
+                self.last_time = float(last["time"])
+                self.last_powers = [float(p) for p in last["powers"]]
+            logger.info("Energy totals loaded from %s", self.path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Energy totals %s not loaded: %s", self.path, e)
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        data = {"totals": {key: total for (key, _), total in zip(ENERGY_SOURCES, self.totals)}}
+        if self.last_time is not None:
+            data["last"] = {"time": self.last_time, "powers": self.last_powers}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(self.path + ".tmp", self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning("Energy totals %s not saved: %s", self.path, e)
+        self.last_save = time.monotonic()
+
+    def update(self, frame):
+        """
+        :param frame: parsed frame, other than type 2 frames are ignored
+        :return: dict energy key -> kWh, None when the frame has no power values
+        """
+        device_time = frame.get("device_time")
+        if device_time is None or "load_power_value" not in frame:
+            return None
+        powers = []
+        for _, power_key in ENERGY_SOURCES:
+            power = frame.get(power_key)
+            powers.append(max(0.0, power) if power is not None else 0.0)
+        if self.last_time is not None:
+            delta = device_time - self.last_time
+            if 0 < delta <= self.max_gap:
+                hours = delta / 3600
+                totals = self.totals
+                for i, (p0, p1) in enumerate(zip(self.last_powers, powers)):
+                    totals[i] += (p0 + p1) * 0.5 * hours
+            elif delta:
+                self.gaps += 1
+                logger.debug("Energy not integrated over %.0f s", delta)
+        self.last_time = device_time
+        self.last_powers = powers
+        self.dirty = True
+        if time.monotonic() - self.last_save >= SAVE_INTERVAL:
+            self.save()
+        return self.values()
+
+    def values(self):
+        return {key: round(total / 1000, 3) for (key, _), total in zip(ENERGY_SOURCES, self.totals)}
+
+    def reset(self):
+        """
+        Inverter offline, next frame starts a new interval
+        """
+        if self.last_time is not None:
+            self.last_time = None
+            self.last_powers = None
+            self.dirty = True
+        self.save()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Synthetic RS485 frames for benchmarks and replay without a real inverter.
+# Frames have the same layout as read by FoxessTSeriesDataParser: 00 00 00 00 00 LL 7E 7E TT <data> CRC(LE).
+
+import random
+import struct
+import time
+
+from foxess_crc import crc16_modbus
+from foxess_parser_data_tseries import FoxessTSeriesDataParser
+
+FRAME_PREFIX = b'\x00' * 5
+FRAME_MARKER = b'\x7e\x7e'
+# length byte counts: marker, type, data and crc
+FRAME_LENGTH_EXTRA = 5
+# data bytes (without type) of generated frames
+FRAME_2_DATA_SIZE = 250
+# 7E is replaced in noise, so noise never looks like a frame header
+NOISE_TABLE = bytes.maketrans(b'\x7e', b'\x7f')
+
+
+def build_frame(frame_type, payload):
+    """
+    Complete frame with header and modbus crc
+    :param frame_type: int
+    :param payload: bytes after frame type byte
+    """
+    data = bytes([frame_type]) + payload
+    return FRAME_PREFIX + bytes([len(payload) + FRAME_LENGTH_EXTRA]) + FRAME_MARKER + data + \
+        crc16_modbus(data).to_bytes(2, 'little')
+
+
+def encode_registers(register_map, values, size=0):
+    """
+    Reverse of RegisterMap.decode - frame data (with type byte at offset 0) containing values
+    """
+    data = bytearray(max(size, register_map.size))
+    for r in register_map.registers:
+        value = values.get(r.key)
+        if value is None:
+            continue
+        if r.text:
+            data[r.offset:r.offset + r.width] = value.encode()[:r.width].ljust(r.width, b'\x00')
+            continue
+        raw = round(value * 10 ** r.precision)
+        fmt = {1: "b", 2: "h", 4: "i"}[r.width]
+        if not r.signed:
+            fmt = fmt.upper()
+            raw &= (1 << 8 * r.width) - 1
+        struct.pack_into(">" + fmt, data, r.offset, raw)
+    return data
+
+
+class FrameGenerator:
+    """
+    Generates valid type 1, 2 and 6 frames and damaged streams (noise, truncated frames, wrong crc).
+    Same seed gives the same data.
+    """
+
+    def __init__(self, seed=0, series="T10-G3", model="T10", sn="SYNTH0000000001", device_time=None):
+        self.random = random.Random(seed)
+        self.series = series
+        self.model = model
+        self.sn = sn
+        self.device_time = int(time.time()) if device_time is None else device_time
+        self.total_yield = 12345.6
+        self.today_yield = 0.0
+
+    def _frame(self, frame_type, register_map, values, size=0):
+        data = encode_registers(register_map, values, size)
+        struct.pack_into(">I", data, FoxessTSeriesDataParser.DEVICE_TIME, self.device_time)
+        return build_frame(frame_type, bytes(data[1:]))
+
+    def frame_1(self):
+        return self._frame(1, FoxessTSeriesDataParser.FRAME_1_MAP, {"series": self.series, "model": self.model})
+
+    def frame_6(self):
+        return self._frame(6, FoxessTSeriesDataParser.FRAME_6_MAP, {"sn": self.sn})
+
+    def frame_2_values(self):
+        """
+        Random but plausible measurements
+        """
+        r = self.random
+        values = {}
+        for phase in "rst":
+            values[f"grid_voltage_{phase}_value"] = round(r.uniform(225, 245), 1)
+            values[f"grid_current_{phase}_value"] = round(r.uniform(0, 15), 1)
+            values[f"grid_frequency_{phase}_value"] = round(r.uniform(49.95, 50.05), 2)
+            values[f"grid_power_{phase}_value"] = r.randint(0, 3500)
+        for i in range(1, 5):
+            values[f"pv{i}_voltage_value"] = round(r.uniform(0, 600), 1)
+            values[f"pv{i}_current_value"] = round(r.uniform(0, 12), 1)
+        values["generated_power_value"] = r.randint(0, 10000)
+        values["load_power_value"] = r.randint(0, 10000)
+        values["grid_power_value"] = r.randint(0, 10000)
+        self.today_yield = round(self.today_yield + r.uniform(0, 0.1), 1)
+        self.total_yield = round(self.total_yield + r.uniform(0, 0.1), 1)
+        values["today_yield_value"] = self.today_yield
+        values["total_yield_value"] = self.total_yield
+        values["boost_temperature_value"] = r.randint(20, 60)
+        values["inverter_temperature_value"] = r.randint(20, 60)
+        values["ambient_temperature_value"] = r.randint(10, 40)
+        return values
+
+    def frame_2(self, values=None, step=1):
+        """
+        :param values: measurements, random when None
+        :param step: seconds added to device time
+        """
+        self.device_time += step
+        if values is None:
+            values = self.frame_2_values()
+        return self._frame(2, FoxessTSeriesDataParser.FRAME_2_MAP, values, FRAME_2_DATA_SIZE + 1)
+
+    def noise(self, size):
+        """
+        Random bytes, never containing a frame header
+        """
+        return self.random.randbytes(size).translate(NOISE_TABLE)
+
+    def truncated(self, frame):
+        """
+        Frame cut at random position (bridge lost bytes)
+        """
+        return frame[:self.random.randint(FoxessTSeriesDataParser.DEVICE_TIME + 9, len(frame) - 1)]
+
+    def corrupted_crc(self, frame):
+        return frame[:-2] + bytes([frame[-2] ^ 0xFF, frame[-1]])
+
+    def stream(self, frames, garbage_ratio=0.0, truncated_ratio=0.0, corrupted_ratio=0.0, frame_types=(2,)):
+        """
+        Byte stream of frames mixed with damaged data
+        :param frames: number of frames
+        :param garbage_ratio: noise bytes / valid frame bytes
+        :param truncated_ratio: part of frames which are cut
+        :param corrupted_ratio: part of frames with wrong crc
+        :return: (bytes, number of valid frames)
+        """
+        r = self.random
+        out = bytearray()
+        valid = 0
+        for i in range(frames):
+            frame_type = frame_types[i % len(frame_types)]
+            frame = {1: self.frame_1, 2: self.frame_2, 6: self.frame_6}[frame_type]()
+            if garbage_ratio:
+                out += self.noise(int(len(frame) * garbage_ratio * r.uniform(0.5, 1.5)))
+            x = r.random()
+            if x < truncated_ratio:
+                out += self.truncated(frame)
+            elif x < truncated_ratio + corrupted_ratio:
+                out += self.corrupted_crc(frame)
+            else:
+                out += frame
+                valid += 1
+        return bytes(out), valid
+
+
+def chunks(data, size):
+    """
+    Split data as it would be received from mqtt in packets of size bytes
+    """
+    return [data[i:i + size] for i in range(0, len(data), size)]
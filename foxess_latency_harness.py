@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# End to end latency: raw frame published on MQTT_TOPIC -> last sensor state received by the broker.
+# MqttHandler runs unchanged against the in-process stub broker, no network needed.
+# run: python foxess_latency_harness.py --rate 50 --frames 500
+
+import argparse
+import collections
+import threading
+import time
+
+from foxess_frame_generator import FrameGenerator
+from foxess_parser_data_tseries import FrameScanner
+from foxess_stub_broker import StubBroker
+from helper import MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, MQTT_CLIENT_ID, MQTT_USER, MQTT_PASSWORD
+from helper import PUBLISH_QUEUE_SIZE, PUBLISH_POLICY, PUBLISH_JSON_STATE, INGEST_WORKERS, MQTT_RUNTIME
+from helper import FOXESS_DEVICE_NAME, FOXESS_SN, FOXESS_TIME_ZONE
+from mqtt_handler_async import create_mqtt_handler
+
+CLIENT_ID = "foxess-latency-harness"
+STAGES = ("receive", "parse", "queue", "publish", "total")
+# frames completing below this part of the offered rate mean backlog builds up
+SUSTAINED_RATIO = 0.95
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class _Frame:
+    __slots__ = ("sent", "received", "parsed", "publish_start", "publish_end", "last_publish", "done")
+
+    def __init__(self):
+        self.sent = None
+        self.received = None
+        self.parsed = None
+        self.publish_start = None
+        self.publish_end = None
+        # index of the last mqtt publish made for this frame, None when policy suppressed all states
+        self.last_publish = None
+        self.done = None
+
+    def stages(self):
+        return {
+            "receive": self.received - self.sent,
+            "parse": self.parsed - self.received,
+            "queue": self.publish_start - self.parsed,
+            "publish": self.done - self.publish_start,
+            "total": self.done - self.sent,
+        }
+
+
+class LatencyHarness:
+    """
+    Wraps handler, device, publisher and client methods to timestamp every frame on its way.
+    Frames of one topic are processed in order, so each stage takes the oldest frame waiting for it.
+    """
+
+    def __init__(self, runtime="thread", workers=1, devices=1, json_state=False):
+        self.devices = devices
+        self.topic = "foxess/+/raw" if devices > 1 else "foxess/raw"
+        self.lock = threading.Lock()
+        self.frames = []
+        # topic -> frames waiting for the stage
+        self.waiting_receive = collections.defaultdict(collections.deque)
+        self.waiting_parse = collections.defaultdict(collections.deque)
+        self.waiting_publish = collections.defaultdict(collections.deque)
+        self.publish_count = 0
+        self.arrivals = []
+        self.broker = StubBroker(on_publish=self._on_broker_publish).start()
+        self.handler = create_mqtt_handler({
+            MQTT_BROKER: self.broker.host,
+            MQTT_PORT: self.broker.port,
+            MQTT_TOPIC: self.topic,
+            MQTT_CLIENT_ID: CLIENT_ID,
+            MQTT_USER: None,
+            MQTT_PASSWORD: None,
+            PUBLISH_QUEUE_SIZE: 100000,
+            PUBLISH_POLICY: "drop_oldest",
+            PUBLISH_JSON_STATE: json_state,
+            INGEST_WORKERS: workers,
+            MQTT_RUNTIME: runtime,
+        }, {FOXESS_DEVICE_NAME: "Foxess harness", FOXESS_SN: "HARNESS0001", FOXESS_TIME_ZONE: "UTC"})
+        self._wrap_handler()
+
+    # --- instrumentation ---
+
+    def _on_broker_publish(self, client_id, topic, payload, timestamp):
+        if client_id == CLIENT_ID:
+            self.arrivals.append(timestamp)
+
+    def _wrap_handler(self):
+        handler = self.handler
+        on_message = handler.on_message
+        create_device = handler._create_device
+
+        def wrapped_on_message(client, userdata, msg):
+            queue = self.waiting_receive.get(msg.topic)
+            if queue:
+                frame = queue.popleft()
+                frame.received = time.perf_counter()
+                self.waiting_parse[msg.topic].append(frame)
+            on_message(client, userdata, msg)
+
+        def wrapped_create_device(device_id, topic, foxess):
+            device = create_device(device_id, topic, foxess)
+            self._wrap_device(device, topic)
+            return device
+
+        handler.on_message = wrapped_on_message
+        handler._create_device = wrapped_create_device
+
+    def _wrap_client(self, client):
+        if getattr(client, "_harness_wrapped", False):
+            return
+        publish = client.publish
+
+        def wrapped_publish(*args, **kwargs):
+            # counted under lock, so the index is the order in which packets are queued by paho
+            with self.lock:
+                self.publish_count += 1
+                return publish(*args, **kwargs)
+
+        client.publish = wrapped_publish
+        client._harness_wrapped = True
+
+    def _wrap_device(self, device, topic):
+        self._wrap_client(device.sensors.client)
+        submit = device.publisher.submit
+        process_data = device.sensors.process_data
+
+        def wrapped_submit(data):
+            queue = self.waiting_parse.get(topic)
+            if queue:
+                frame = queue.popleft()
+                frame.parsed = time.perf_counter()
+                self.waiting_publish[topic].append(frame)
+            submit(data)
+
+        def wrapped_process_data(data):
+            queue = self.waiting_publish.get(topic)
+            frame = queue.popleft() if queue else None
+            if frame is not None:
+                frame.publish_start = time.perf_counter()
+                before = self.publish_count
+            process_data(data)
+            if frame is not None:
+                frame.publish_end = time.perf_counter()
+                if self.publish_count > before:
+                    frame.last_publish = self.publish_count - 1
+
+        device.publisher.submit = wrapped_submit
+        device.sensors.process_data = wrapped_process_data
+
+    # --- running ---
+
+    def start(self, timeout=10):
+        self.handler.start()
+        deadline = time.monotonic() + timeout
+        while not any(self.topic in s.subscriptions for s in list(self.broker.sessions)):
+            if time.monotonic() > deadline:
+                raise TimeoutError("handler did not subscribe to the stub broker")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.handler.stop()
+        self.broker.stop()
+
+    def _device_topic(self, i):
+        if self.devices == 1:
+            return self.topic
+        return self.topic.replace("+", f"inv{i % self.devices}")
+
+    def _complete(self, frame):
+        if frame.done is not None:
+            return True
+        if frame.publish_end is None:
+            return False
+        if frame.last_publish is None:
+            frame.done = frame.publish_end
+            return True
+        if len(self.arrivals) > frame.last_publish:
+            frame.done = self.arrivals[frame.last_publish]
+            return True
+        return False
+
+    def replay(self, payloads, rate, warmup=None, timeout=30):
+        """
+        Publish payloads (one frame each) at rate frames/s and wait until all are processed
+        :param warmup: first frames not measured, the first frames of a device publish discovery
+        :return: statistics
+        """
+        if warmup is None:
+            warmup = 5 * self.devices
+        frames = []
+
+        def sent(frame):
+            def callback(timestamp):
+                frame.sent = timestamp
+            return callback
+
+        start = time.perf_counter()
+        for i, payload in enumerate(payloads):
+            due = start + i / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            topic = self._device_topic(i)
+            frame = _Frame()
+            frames.append(frame)
+            self.waiting_receive[topic].append(frame)
+            self.broker.inject(topic, payload, sent(frame))
+        sending = time.perf_counter() - start
+
+        deadline = time.monotonic() + timeout
+        while not all(self._complete(f) for f in frames) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        measured = [f for f in frames[warmup:] if f.done is not None]
+        lost = len(frames) - warmup - len(measured)
+        stats = {"rate": rate, "frames": len(measured), "lost": lost, "sending": sending}
+        if measured:
+            stages = [f.stages() for f in measured]
+            for stage in STAGES:
+                values = [s[stage] for s in stages]
+                stats[stage] = {p: percentile(values, p) for p in (50, 95, 99)}
+            elapsed = max(f.done for f in measured) - min(f.sent for f in measured)
+            stats["throughput"] = len(measured) / elapsed if elapsed > 0 else float("inf")
+        stats["sustained"] = bool(not lost and measured and stats["throughput"] >= rate * SUSTAINED_RATIO)
+        return stats
+
+
+def generated_payloads(count, devices=1, seed=0):
+    """
+    Payload i is sent to device i % devices, each device gets model and serial number frames first
+    """
+    generators = [FrameGenerator(seed=seed + i, sn=f"SYNTH{i:010d}") for i in range(devices)]
+    payloads = [g.frame_1() for g in generators] + [g.frame_6() for g in generators]
+    return payloads + [generators[i % devices].frame_2() for i in range(count)]
+
+
+def captured_payloads(fname):
+    """
+    Frames found in a raw dump file (e.g. arch/data1.bin), one frame per payload
+    """
+    scanner = FrameScanner()
+    with open(fname, "rb") as f:
+        scanner.feed(f.read())
+    return [bytes(frame) for _, frame in scanner.frames()]
+
+
+def print_stats(stats):
+    print(f"rate {stats['rate']:>8.1f} frames/s: {stats['frames']} frames, lost {stats['lost']}, "
+          f"throughput {stats.get('throughput', 0):,.1f} frames/s, "
+          f"{'sustained' if stats['sustained'] else 'BACKLOG'}")
+    for stage in STAGES:
+        if stage in stats:
+            values = "  ".join(f"p{p} {v * 1000:>8.3f} ms" for p, v in stats[stage].items())
+            print(f"  {stage:<8} {values}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End to end latency of MqttHandler with in-process broker")
+    parser.add_argument("--runtime", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--workers", type=int, default=1, help="INGEST_WORKERS")
+    parser.add_argument("--devices", type=int, default=1, help="simulated inverters")
+    parser.add_argument("--json-state", action="store_true", help="PUBLISH_JSON_STATE")
+    parser.add_argument("--rate", type=float, default=20, help="frames per second")
+    parser.add_argument("--frames", type=int, default=200, help="frames per rate step")
+    parser.add_argument("--capture", help="replay frames from dump file instead of generated ones")
+    parser.add_argument("--find-max", action="store_true",
+                        help="double the rate until backlog builds up, report max sustained rate")
+    parser.add_argument("--max-rate", type=float, default=20000)
+    args = parser.parse_args()
+
+    harness = LatencyHarness(runtime=args.runtime, workers=args.workers, devices=args.devices,
+                             json_state=args.json_state)
+    try:
+        harness.start()
+        if args.capture:
+            payloads = captured_payloads(args.capture)
+        else:
+            payloads = generated_payloads(args.frames, args.devices)
+        rate = args.rate
+        sustained = None
+        while True:
+            result = harness.replay(payloads, rate)
+            print_stats(result)
+            if not args.find_max:
+                break
+            if not result["sustained"]:
+                break
+            sustained = rate
+            rate *= 2
+            if rate > args.max_rate:
+                break
+            # next step continues device time, states are different from already published ones
+            if not args.capture:
+                payloads = generated_payloads(args.frames, args.devices, seed=int(rate))
+        if args.find_max:
+            print(f"max sustained rate: {sustained} frames/s" if sustained else "rate not sustained")
+    finally:
+        harness.stop()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Non blocking logging: threads parsing and publishing frames only put records on a queue,
+# message formatting, console and file I/O run on a QueueListener thread.
+
+import atexit
+import collections
+import itertools
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_QUEUE_SIZE = 10000
+# message templates tracked by RateLimitFilter, old windows are purged above it
+MAX_RATE_KEYS = 1000
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler which does not format the record before enqueuing it (formatting is done by the listener)
+    and never blocks: records are dropped when the queue is full.
+    Arguments are formatted later on the listener thread, dict arguments (parsed frames) are copied
+    because they may be changed by the publisher in the meantime.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if isinstance(record.args, tuple) and any(isinstance(a, dict) for a in record.args):
+            record.args = tuple(dict(a) if isinstance(a, dict) else a for a in record.args)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Passes at most `limit` records of one message class (logger and message template) per `interval` seconds.
+    The first record passed in a new window tells how many similar records were suppressed.
+    Records of level WARNING and above are never suppressed.
+    :param limit: 0 disables the filter
+    """
+
+    def __init__(self, limit, interval=60.0, level=logging.WARNING):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.level = level
+        self.suppressed = 0
+        # (logger name, template) -> [window start, passed, suppressed]
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= self.level:
+            return True
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                if window is None and len(self.windows) >= MAX_RATE_KEYS:
+                    self._purge(now)
+                self.windows[key] = [now, 1, 0]
+            elif window[1] < self.limit:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+        if suppressed and isinstance(record.msg, str):
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+    def _purge(self, now):
+        expired = [k for k, w in self.windows.items() if now - w[0] >= self.interval]
+        for k in expired:
+            del self.windows[k]
+        if len(self.windows) >= MAX_RATE_KEYS:
+            # every message unique (e.g. pre-formatted f-strings), nothing to limit
+            self.windows.clear()
+
+
+class LogBuffer:
+    """
+    Last maxlen formatted log lines with monotonic sequence numbers (the first line has 1).
+    Shared by all log viewers, readers ask for lines after the last sequence number they have.
+    """
+
+    def __init__(self, maxlen):
+        self.lines = collections.deque(maxlen=maxlen)
+        self.seq = 0
+        self.condition = threading.Condition()
+
+    def append(self, line):
+        with self.condition:
+            self.seq += 1
+            self.lines.append((self.seq, line))
+            self.condition.notify_all()
+
+    def first(self):
+        with self.condition:
+            return self.lines[0][0] if self.lines else self.seq + 1
+
+    def since(self, seq=0):
+        """
+        :return: (seq, line) list of lines newer than seq, the oldest ones may be already gone
+        """
+        with self.condition:
+            new = self.seq - seq
+            if new <= 0:
+                return []
+            return list(itertools.islice(self.lines, max(0, len(self.lines) - new), None))
+
+    def wait(self, seq, timeout):
+        """
+        Lines newer than seq, waits at most timeout seconds for them
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > seq, timeout)
+            return self.since(seq)
+
+    def __iter__(self):
+        with self.condition:
+            return iter([line for _, line in self.lines])
+
+
+def _stop(listener):
+    # listener may be already stopped by its owner
+    if listener._thread is not None:
+        listener.stop()
+
+
+def start_listener(*handlers, size=LOG_QUEUE_SIZE):
+    """
+    Starts listener thread writing records to handlers, records still queued are written at exit
+    :return: (handler to add to loggers, listener)
+    """
+    log_queue = queue.Queue(size)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop, listener)
+    return DeferredQueueHandler(log_queue), listener
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Prometheus metrics in text exposition format.
+# Hot path only increments plain attributes owned by one thread (device worker / publisher),
+# everything is collected and formatted when /metrics is scraped.
+
+from bisect import bisect_left
+
+from foxess_parser_data_tseries import STATUS_ONLINE
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+PUBLISH_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, observe() does not allocate (besides float sum).
+    Not thread safe, each histogram has a single writer.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        # snapshot, the writer thread may update counts in the meantime
+        counts = list(self.counts)
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            yield bound, total
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class MetricsWriter:
+
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, metric_type, help_text, samples):
+        """
+        :param samples: list of (labels dict, value)
+        """
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def histogram(self, name, help_text, samples):
+        """
+        :param samples: list of (labels dict, Histogram)
+        """
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in samples:
+            counts = list(histogram.cumulative())
+            for bound, total in counts:
+                self.lines.append(f"{name}_bucket{_labels(dict(labels, le=_bound(bound)))} {total}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            self.lines.append(f"{name}_count{_labels(labels)} {counts[-1][1]}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics(handler):
+    """
+    Metrics of MqttHandler and all its devices
+    """
+    devices = list(handler.devices.values())
+    w = MetricsWriter()
+    w.metric("foxess_mqtt_connected", "gauge", "1 when connected to the MQTT broker",
+             [({}, int(handler.is_connected()))])
+    w.metric("foxess_devices", "gauge", "Number of inverters seen on MQTT_TOPIC", [({}, len(devices))])
+
+    w.metric("foxess_payloads_received_total", "counter", "MQTT messages received from the RS485 bridge",
+             [({"device": d.device_id}, d.payloads_received) for d in devices])
+    w.metric("foxess_payloads_dropped_total", "counter", "MQTT messages dropped from a full worker queue",
+             [({"device": d.device_id}, d.payloads_dropped) for d in devices])
+    w.metric("foxess_bytes_received_total", "counter", "Raw bytes received from the RS485 bridge",
+             [({"device": d.device_id}, d.bytes_received) for d in devices])
+    w.metric("foxess_frames_parsed_total", "counter", "Frames with valid crc by frame type",
+             [({"device": d.device_id, "type": t}, c)
+              for d in devices for t, c in list(d.parser.scanner.type_counts.items())])
+    w.metric("foxess_crc_errors_total", "counter", "Frames rejected by crc check",
+             [({"device": d.device_id}, d.parser.scanner.crc_errors) for d in devices])
+    w.metric("foxess_discarded_bytes_total", "counter", "Bytes skipped while searching for frame header",
+             [({"device": d.device_id}, d.parser.scanner.discarded_bytes) for d in devices])
+    w.metric("foxess_cache_size_bytes", "gauge", "Bytes waiting in the receive cache",
+             [({"device": d.device_id}, len(d.parser.scanner)) for d in devices])
+    w.metric("foxess_offline_transitions_total", "counter", "Inverter went offline",
+             [({"device": d.device_id}, d.offline_transitions) for d in devices])
+    w.metric("foxess_online", "gauge", "1 when inverter is online",
+             [({"device": d.device_id}, int(d.status == STATUS_ONLINE)) for d in devices])
+
+    publishers = [(d.device_id, d.publisher) for d in devices]
+    w.metric("foxess_publish_frames_total", "counter", "Frames published to Home Assistant",
+             [({"device": i}, p.published) for i, p in publishers])
+    w.metric("foxess_publish_dropped_total", "counter", "Frames dropped because publish queue was full",
+             [({"device": i}, p.dropped) for i, p in publishers])
+    w.metric("foxess_publish_errors_total", "counter", "Frames not published because of an error",
+             [({"device": i}, p.errors) for i, p in publishers])
+    w.metric("foxess_publish_queue_depth", "gauge", "Frames waiting for publish",
+             [({"device": i}, p.queue_depth()) for i, p in publishers])
+    w.metric("foxess_sensor_publish_total", "counter", "Sensor states published",
+             [({"device": d.device_id, "sensor": k}, c)
+              for d in devices for k, c in list(d.sensors.policy.published.items())])
+    w.metric("foxess_sensor_suppressed_total", "counter", "Sensor states suppressed by publish policy",
+             [({"device": d.device_id, "sensor": k}, c)
+              for d in devices for k, c in list(d.sensors.policy.suppressed.items())])
+
+    w.histogram("foxess_parse_seconds", "Time to parse one MQTT message",
+                [({"device": d.device_id}, d.parse_latency) for d in devices])
+    w.histogram("foxess_publish_latency_seconds", "Time from parsed frame to published states",
+                [({"device": i}, p.latency_histogram) for i, p in publishers])
+
+    workers = handler.get_worker_stats()
+    w.metric("foxess_worker_queue_depth", "gauge", "Tasks waiting for ingest worker",
+             [({"worker": s["name"]}, s["queue_depth"]) for s in workers])
+    w.metric("foxess_worker_dropped_total", "counter", "Tasks dropped because worker queue was full",
+             [({"worker": s["name"]}, s["dropped"]) for s in workers])
+    return w.text()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Dump file parsed by several processes.
+# The mmap-ed file is split into byte ranges, a range owns frames whose header starts in it and reads past
+# its end to complete the last one. A worker cannot know where the sequential scanner stands when it enters
+# the range (previous frame may cross the boundary, a false header may hide a real one), so it decodes every
+# header with a valid crc and the main process selects frames in file order with the rules of FrameScanner:
+# next frame is the first valid one starting at or after the end of the previous one.
+
+import logging
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from foxess_crc import crc16_modbus
+from foxess_parser_data_tseries import FoxessTSeriesDataParser, FRAME_PATTERN, FRAME_HEADER_SIZE, \
+    FRAME_LENGTH_OFFSET
+
+logger = logging.getLogger("foxess_parallel_dump")
+
+# ranges per worker, smaller ranges balance the load
+RANGES_PER_WORKER = 4
+# the longest frame: length field is one byte
+MAX_FRAME_SIZE = FRAME_LENGTH_OFFSET + 0xFF
+
+
+def split_ranges(size, count):
+    """
+    :return: list of (start, end) covering [0, size)
+    """
+    count = max(1, min(count, size // MAX_FRAME_SIZE or 1))
+    bounds = [size * i // count for i in range(count + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def scan_range(path, start, end, timezone="UTC"):
+    """
+    Worker: frames with header in [start, end)
+    :return: list of (frame start, frame end, message), message is None for a crc error
+        and for a frame cut by the end of file
+    """
+    parser = FoxessTSeriesDataParser(timezone=timezone)
+    pattern = re.compile(FRAME_PATTERN % re.escape(bytes(sorted(parser.frame_maps.keys()))))
+    found = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        # header has to start before end, it may continue after it
+        limit = min(end + FRAME_HEADER_SIZE - 1, size)
+        position = start
+        while True:
+            match = pattern.search(data, position, limit)
+            if not match:
+                break
+            frame_start = match.start()
+            position = frame_start + 1
+            frame_end = frame_start + FRAME_LENGTH_OFFSET + data[frame_start + 5]
+            if frame_end > size:
+                found.append((frame_start, frame_end, None))
+                continue
+            frame = data[frame_start:frame_end]
+            if int.from_bytes(frame[-2:], "little") != crc16_modbus(memoryview(frame)[8:-2]):
+                # scanner waits for the whole false frame too, it matters for the read position
+                found.append((frame_start, frame_end, None))
+                continue
+            found.append((frame_start, frame_end, parser._decode_frame(frame[8], frame)))
+        parser.get_messages()
+    return found
+
+
+def _scan(args):
+    return scan_range(*args)
+
+
+def select_frames(ranges, size):
+    """
+    Frames chosen by the sequential scanner, in file order
+    :param ranges: iterable of scan_range results in file order
+    :param size: file size
+    :return: generator of (bytes read when the sequential scanner returns the frame, message)
+    """
+    cursor = 0
+    ready = 0
+    for found in ranges:
+        for start, end, message in found:
+            if start < cursor:
+                # inside the previous frame
+                continue
+            if end > size:
+                # scanner waits for the rest of this frame, nothing after it is parsed
+                return
+            ready = max(ready, end)
+            if message is not None:
+                cursor = end
+                yield ready, message
+
+
+def parallel_messages(path, workers=None, timezone="UTC"):
+    """
+    Parsed messages of the dump file, the same as FoxessTSeriesDataParser fed with the whole file
+    :param workers: processes, os.cpu_count() when None
+    :return: generator of (bytes read when the sequential parser returns the message, message)
+    """
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(path)
+    if not size:
+        return
+    ranges = [(path, start, end, timezone) for start, end in split_ranges(size, workers * RANGES_PER_WORKER)]
+    if workers == 1:
+        yield from select_frames(map(_scan, ranges), size)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # results are returned in order of ranges
+        yield from select_frames(executor.map(_scan, ranges), size)
@@ -23,46 +23,121 @@ from datetime import datetime, timedelta
 import binascii
 import re
 import datetime
-from logging.handlers import RotatingFileHandler
 
 import pytz
 import logging
 
+from foxess_crc import crc16_modbus
+from foxess_register_map import Register, RegisterMap
+from foxess_timezone import LocalTimeConverter
+
 logger = logging.getLogger("rs485_parser")
-logger_file = logging.getLogger("rs485_parser_file")
 
-# --- Simple File Handler Setup ---
-LOG_FILENAME = 'rs485_parser_simple.log' # Choose your log file name
+STATUS_ONLINE = "ONLINE"
+STATUS_OFFLINE = "OFFLINE"
 
-try:
-    # 1. Create a FileHandler instance
-    #    The 'w' mode will overwrite the file each time the script starts.
-    #    Use 'a' for append mode if you want to keep old logs.
-    simple_file_handler = logging.FileHandler(LOG_FILENAME, mode='a', encoding='utf-8')
+# begining of frame: 5 zero bytes, length, 7E 7E, frame type
+FRAME_TYPES = (1, 2, 6)
+FRAME_PATTERN = b'\x00\x00\x00\x00\x00(.)\x7E\x7E([%s])'
+FRAME_HEADER_SIZE = 9
+# bytes before the length field are not counted in it
+FRAME_LENGTH_OFFSET = 6
+# consumed bytes are removed from the buffer when this size is reached
+COMPACT_THRESHOLD = 4096
 
-    # 2. Set the logging level for this handler
-    #    This handler will process messages of this level or higher.
-    simple_file_handler.setLevel(logging.DEBUG) # Or logging.INFO, logging.WARNING, etc.
 
-    # 3. Create a formatter
-    #    This defines how your log messages will look.
-    formatter = logging.Formatter('%(message)s')
-    simple_file_handler.setFormatter(formatter)
+class FrameScanner:
+    """
+    Streaming frame scanner. Keeps a single receive buffer and a read cursor,
+    frames are returned as memoryviews of the buffer (no copy).
+    Memoryviews are valid only until the next feed() call.
+    """
 
-    # 4. Add the handler to your logger
-    logger_file.addHandler(simple_file_handler)
+    def __init__(self, compact_threshold=COMPACT_THRESHOLD, frame_types=FRAME_TYPES):
+        self.pattern = re.compile(FRAME_PATTERN % re.escape(bytes(sorted(frame_types))))
+        self.buffer = bytearray()
+        self.cursor = 0
+        self.compact_threshold = compact_threshold
+        # header already found but frame not complete yet: (start, end, frame type)
+        self.pending = None
+        self.frames_count = 0
+        # frame type -> number of valid frames
+        self.type_counts = dict.fromkeys(frame_types, 0)
+        self.crc_errors = 0
+        self.discarded_bytes = 0
+
+    def __len__(self):
+        return len(self.buffer) - self.cursor
+
+    def feed(self, data):
+        if self.cursor and (self.cursor >= self.compact_threshold or self.cursor == len(self.buffer)):
+            self._compact()
+        try:
+            self.buffer.extend(data)
+        except BufferError:
+            # memoryview of previous frame still in use, detach from it
+            self.buffer = bytearray(self.buffer)
+            self.buffer.extend(data)
 
-    # Optional: Log that the handler was configured
-    logger.info(f"SimpleFileHandler configured for {LOG_FILENAME}")
+    def _compact(self):
+        try:
+            del self.buffer[:self.cursor]
+        except BufferError:
+            self.buffer = self.buffer[self.cursor:]
+        if self.pending is not None:
+            start, end, frame_type = self.pending
+            self.pending = (start - self.cursor, end - self.cursor, frame_type)
+        self.cursor = 0
+
+    def frames(self):
+        """
+        Yields all complete frames with valid crc found in the buffer
+        :return: (frame type, memoryview of whole frame)
+        """
+        buffer = self.buffer
+        view = memoryview(buffer)
+        size = len(buffer)
+        while True:
+            if self.pending is None:
+                match = self.pattern.search(buffer, self.cursor)
+                if not match:
+                    # keep tail, it may be a begining of the next header
+                    keep = max(self.cursor, size - FRAME_HEADER_SIZE + 1)
+                    self.discarded_bytes += keep - self.cursor
+                    self.cursor = keep
+                    return
+                start = match.start()
+                self.discarded_bytes += start - self.cursor
+                self.cursor = start
+                self.pending = (start, start + FRAME_LENGTH_OFFSET + buffer[start + 5], buffer[start + 8])
+            start, end, frame_type = self.pending
+            if end > size:
+                logger.debug("Not enough data - waiting, frame length:%s, data len %s", end - start, size - start)
+                return
+            self.pending = None
+            frame = view[start:end]
+            crc = int.from_bytes(frame[-2:], 'little')
+            crc_check = crc16_modbus(frame[8:-2])
+            if crc != crc_check:
+                logger.debug("Crc check failed, values read: %s, calculated: %s", crc, crc_check)
+                self.crc_errors += 1
+                # resync just after the false header
+                self.cursor = start + 1
+                self.discarded_bytes += 1
+                continue
+            self.cursor = end
+            self.frames_count += 1
+            self.type_counts[frame_type] += 1
+            yield frame_type, frame
 
-except Exception as e:
-    # It's good practice to log any errors during handler setup
-    # This will print to console if the logger isn't fully set up yet or if other handlers exist
-    print(f"Error setting up simple file handler: {e}")
-    logger.error(f"Failed to configure SimpleFileHandler: {e}", exc_info=True)
+    def remaining(self):
+        return self.buffer[self.cursor:]
 
-STATUS_ONLINE = "ONLINE"
-STATUS_OFFLINE = "OFFLINE"
+    def clear(self):
+        self.discarded_bytes += len(self)
+        self.buffer = bytearray()
+        self.cursor = 0
+        self.pending = None
 
 
 class FoxessTSeriesDataParser:
@@ -118,19 +193,86 @@ class FoxessTSeriesDataParser:
     # Fault messages addresses, each 4 byte big endian
     FAULT_MESSAGES = [123, 127, 131, 135, 139, 143, 147, 149]
 
+    # Register maps, frame type -> registers
+    FRAME_1_MAP = RegisterMap([
+        Register("series", SERIES_DATA[0], SERIES_DATA[1] - SERIES_DATA[0], text=True),
+        Register("model", MODEL_DATA[0], MODEL_DATA[1] - MODEL_DATA[0], text=True),
+    ])
+
+    FRAME_2_MAP = RegisterMap([
+        Register("grid_power_value", GRID_POWER_2B, 2),
+        Register("load_power_value", LOAD_POWER_2B, 2),
+        Register("generated_power_value", CURRENT_POWER_2B, 2),
+        Register("today_yield_value", TODAY_YIELD_2B, 2, precision=1),
+        Register("total_yield_value", TOTAL_YIELD_4B, 4, precision=1),
+
+        Register("grid_voltage_r_value", GRID_VOLTAGE_R_2B, 2, precision=1),
+        Register("grid_current_r_value", GRID_CURRENT_R_2B, 2, precision=1),
+        Register("grid_frequency_r_value", GRID_FREQUENCY_R_2B, 2, precision=2),
+        Register("grid_power_r_value", GRID_POWER_R_2B, 2),
+
+        Register("grid_voltage_s_value", GRID_VOLTAGE_S_2B, 2, precision=1),
+        Register("grid_current_s_value", GRID_CURRENT_S_2B, 2, precision=1),
+        Register("grid_frequency_s_value", GRID_FREQUENCY_S_2B, 2, precision=2),
+        Register("grid_power_s_value", GRID_POWER_S_2B, 2),
+
+        Register("grid_voltage_t_value", GRID_VOLTAGE_T_2B, 2, precision=1),
+        Register("grid_current_t_value", GRID_CURRENT_T_2B, 2, precision=1),
+        Register("grid_frequency_t_value", GRID_FREQUENCY_T_2B, 2, precision=2),
+        Register("grid_power_t_value", GRID_POWER_T_2B, 2),
+
+        Register("pv1_voltage_value", PV1_VOLTAGE_2B, 2, precision=1),
+        Register("pv1_current_value", PV1_CURRENT_2B, 2, precision=1),
+
+        Register("pv2_voltage_value", PV2_VOLTAGE_2B, 2, precision=1),
+        Register("pv2_current_value", PV2_CURRENT_2B, 2, precision=1),
+
+        Register("pv3_voltage_value", PV3_VOLTAGE_2B, 2, precision=1),
+        Register("pv3_current_value", PV3_CURRENT_2B, 2, precision=1),
+
+        Register("pv4_voltage_value", PV4_VOLTAGE_2B, 2, precision=1),
+        Register("pv4_current_value", PV4_CURRENT_2B, 2, precision=1),
 
-    def __init__(self,timezone='UTC'):
+        Register("boost_temperature_value", BOST_TEMP_2B, 2),
+        Register("inverter_temperature_value", INVERTER_TEMP_2B, 2),
+        Register("ambient_temperature_value", AMBIENT_TEMP_2B, 2),
+    ])
+
+    # keys are fault ids (addresses)
+    FAULT_MAP = RegisterMap([Register(x, x, 4) for x in FAULT_MESSAGES])
+
+    FRAME_6_MAP = RegisterMap([
+        Register("sn", SN_DATA[0], SN_DATA[1] - SN_DATA[0], text=True),
+    ])
+
+    FRAME_MAPS = {
+        1: FRAME_1_MAP,
+        2: FRAME_2_MAP,
+        6: FRAME_6_MAP,
+    }
+
+
+    def __init__(self,timezone='UTC', frame_maps=None, capture=None):
+        """
+        :param capture: CaptureWriter storing every valid frame (foxess_capture)
+        """
         self.SERIES = None
         self.MODEL = None
         self.SN = None
         self.tz = timezone
+        self.local_time = LocalTimeConverter(timezone)
         self.messages = []
         self.latest_message = {}  # Store the latest parsed message
+        # other models/frame types could be supported by own register maps
+        self.frame_maps = frame_maps if frame_maps is not None else self.FRAME_MAPS
+        self.scanner = FrameScanner(frame_types=self.frame_maps.keys())
+        self.capture = capture
         logger.debug(f"Foxess Timezone {timezone}")
 
 
     @staticmethod
     def _string_zero_terminated(data):
+        data = bytes(data)
         index = data.find(0x00)
         if index == -1:
             return data.decode()
@@ -164,23 +306,8 @@ class FoxessTSeriesDataParser:
         return crc_frame == crc_bytes
 
     @staticmethod
-    def crc16_modbus(data: bytearray):
-        if data is None:
-            return 0
-        offset = 0
-        length = len(data)
-        crc = 0xFFFF
-        for i in range(length):
-            crc ^= data[offset + i]
-            for j in range(8):
-                # print(crc)
-                if ((crc & 0x1) == 1):
-                    # print("bb1=", crc)
-                    crc = int((crc / 2)) ^ 40961
-                    # print("bb2=", crc)
-                else:
-                    crc = int(crc / 2)
-        return crc & 0xFFFF
+    def crc16_modbus(data):
+        return crc16_modbus(data)
 
     @staticmethod
     def local_to_utc(local_timestamp, local_timezone_str ):
@@ -193,40 +320,35 @@ class FoxessTSeriesDataParser:
         offset_direct = local_timezone.utcoffset(local_datetime_naive).total_seconds()
         return local_timestamp-offset_direct
 
+    def feed(self, data):
+        """
+        Add received bytes and parse all complete frames, parsed messages are available in get_messages()
+        :param data: bytes
+        :return: number of parsed frames
+        """
+        self.scanner.feed(data)
+        count = 0
+        for frame_type, frame in self.scanner.frames():
+            self._decode_frame(frame_type, frame)
+            count += 1
+        return count
+
     def parse_data(self, data):
         """
         Parse cache to find inverter data
         :param data: bytes
-        :return: bytes
+        :return: bytes - not parsed rest of data
         """
-        # find a begining of frame
-        frame_pattern = b'\x00\x00\x00\x00\x00(.)\x7E\x7E([\x01\x02\x06])'
-        match = re.search(frame_pattern, data)
-        #print(data.hex())
-        if not match:
-            return data
-        header_index = match.start()
-        frame_type = int.from_bytes(match.group(2), 'big')
-        frame_length = header_index+ 6 + int.from_bytes(match.group(1), 'big')
-        frame = data[header_index:frame_length]
-        logger.debug(f"Frame caught:{frame.hex()}")
-        # if there is not enouch data
-        if len(frame)<frame_length:
-            logger.debug(f"Not enough data - skipping, frame length:{frame_length}, data len {len(frame)} ")
-            return data
-        # Tutaj mechanizm samonaprawczy jeśli bufor jest większy niż długość danych a jednak następuje pominięcie to wyczyścić bufor
-
+        scanner = FrameScanner(frame_types=self.frame_maps.keys())
+        scanner.feed(data)
+        for frame_type, frame in scanner.frames():
+            self._decode_frame(frame_type, frame)
+        return scanner.remaining()
+
+    def _decode_frame(self, frame_type, frame):
+        if self.capture is not None:
+            self.capture.write(frame)
         frame_data = frame[8:-2]
-        crc = int.from_bytes(frame[-2:],'little')
-        crc_check = self.crc16_modbus(frame_data)
-        #drop invalid frame
-        if crc != crc_check:
-            logger.debug(f"Crc check failed,  values read: {crc}, calculated: {crc_check}")
-            return data[header_index+frame_length:]
-
-        logger_file.debug(frame.hex())
-
-        message = {}
         match frame_type:
             case 1:
                 message = self._parse_frame_1(frame_data)
@@ -234,76 +356,32 @@ class FoxessTSeriesDataParser:
                 message = self._parse_frame_2(frame_data)
             case 6:
                 message = self._parse_frame_6(frame_data)
+            case _ if frame_type in self.frame_maps:
+                message = self.frame_maps[frame_type].decode(frame_data)
             case _:
                 message = {}
                 logger.error(f"unknown frame type - {frame_type}")
         message.update(self._parse_time(frame_data))
         self.messages.append(message)
-        # if there is more messages in buffer
-        return self.parse_data(data[header_index+frame_length:])
+        return message
 
     def _parse_time(self,frame_data):
         return {
-            "device_time": self.local_to_utc(self._big_endian4(frame_data, self.DEVICE_TIME),self.tz)
+            "device_time": self.local_time.to_utc(self._big_endian4(frame_data, self.DEVICE_TIME))
         }
 
     def _parse_frame_2(self, frame_data):
-        message = {
-            "grid_power_value": self._big_endian2(frame_data, self.GRID_POWER_2B),
-            "load_power_value": self._big_endian2(frame_data, self.LOAD_POWER_2B),
-            "generated_power_value": self._big_endian2(frame_data, self.CURRENT_POWER_2B),
-            "today_yield_value": self._calculate_precision(self._big_endian2(frame_data, self.TODAY_YIELD_2B),1),
-            "total_yield_value": self._calculate_precision(self._big_endian4(frame_data, self.TOTAL_YIELD_4B), 1),
-
-            "grid_voltage_r_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_VOLTAGE_R_2B), 1),
-            "grid_current_r_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_CURRENT_R_2B), 1),
-            "grid_frequency_r_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_FREQUENCY_R_2B), 2),
-            "grid_power_r_value": self._big_endian2(frame_data, self.GRID_POWER_R_2B),
-
-            "grid_voltage_s_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_VOLTAGE_S_2B), 1),
-            "grid_current_s_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_CURRENT_S_2B), 1),
-            "grid_frequency_s_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_FREQUENCY_S_2B), 2),
-            "grid_power_s_value": self._big_endian2(frame_data, self.GRID_POWER_S_2B),
-
-            "grid_voltage_t_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_VOLTAGE_T_2B), 1),
-            "grid_current_t_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_CURRENT_T_2B), 1),
-            "grid_frequency_t_value": self._calculate_precision(self._big_endian2(frame_data, self.GRID_FREQUENCY_T_2B), 2),
-            "grid_power_t_value": self._big_endian2(frame_data, self.GRID_POWER_T_2B),
-
-            "pv1_voltage_value": self._calculate_precision(self._big_endian2(frame_data, self.PV1_VOLTAGE_2B), 1),
-            "pv1_current_value": self._calculate_precision(self._big_endian2(frame_data, self.PV1_CURRENT_2B), 1),
-
-            "pv2_voltage_value": self._calculate_precision(self._big_endian2(frame_data, self.PV2_VOLTAGE_2B), 1),
-            "pv2_current_value": self._calculate_precision(self._big_endian2(frame_data, self.PV2_CURRENT_2B), 1),
-
-            "pv3_voltage_value": self._calculate_precision(self._big_endian2(frame_data, self.PV3_VOLTAGE_2B), 1),
-            "pv3_current_value": self._calculate_precision(self._big_endian2(frame_data, self.PV3_CURRENT_2B), 1),
-
-            "pv4_voltage_value": self._calculate_precision(self._big_endian2(frame_data, self.PV4_VOLTAGE_2B), 1),
-            "pv4_current_value": self._calculate_precision(self._big_endian2(frame_data, self.PV4_CURRENT_2B), 1),
-
-            "boost_temperature_value": self._big_endian2(frame_data, self.BOST_TEMP_2B),
-            "inverter_temperature_value": self._big_endian2(frame_data, self.INVERTER_TEMP_2B),
-            "ambient_temperature_value": self._big_endian2(frame_data, self.AMBIENT_TEMP_2B),
-            "status" : STATUS_ONLINE
-        }
+        message = self.frame_maps[2].decode(frame_data)
+        message["status"] = STATUS_ONLINE
 
         message["pv1_power_value"] = int(message.get("pv1_voltage_value") * message.get("pv1_current_value"))
         message["pv2_power_value"] = int(message.get("pv2_voltage_value") * message.get("pv2_current_value"))
         message["pv3_power_value"] = int(message.get("pv3_voltage_value") * message.get("pv3_current_value"))
         message["pv4_power_value"] = int(message.get("pv4_voltage_value") * message.get("pv4_current_value"))
 
-        fault_messages = []
-        for x in self.FAULT_MESSAGES:
-            code = self._big_endian4(frame_data, x)
-            if code == 0:
-                continue
-            fault = {
-                "id": x,
-                "code": code
-            }
-            fault_messages.append(fault)
-        message["fault_messages"] = fault_messages
+        fault_map = self.FAULT_MAP
+        message["fault_messages"] = [{"id": x, "code": code}
+                                     for x, code in zip(fault_map.keys, fault_map.unpack(frame_data)) if code != 0]
         return message
 
     def _parse_frame_1(self, frame_data):
@@ -312,10 +390,7 @@ class FoxessTSeriesDataParser:
         :param frame_data:
         :return:
         """
-        return {
-                "series": self._string_zero_terminated(frame_data[self.SERIES_DATA[0]:self.SERIES_DATA[1]]),
-                "model": self._string_zero_terminated(frame_data[self.MODEL_DATA[0]:self.MODEL_DATA[1]])
-        }
+        return self.frame_maps[1].decode(frame_data)
 
     def _parse_frame_6(self, frame_data):
         """
@@ -323,9 +398,7 @@ class FoxessTSeriesDataParser:
         :param frame_data:
         :return:
         """
-        return  {
-            "sn": self._string_zero_terminated(frame_data[self.SN_DATA[0]:self.SN_DATA[1]])
-        }
+        return self.frame_maps[6].decode(frame_data)
 
     def get_messages(self,flush=True):
         ret = self.messages
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# On demand profiling of the running process.
+# Nothing is installed until a profile is requested: CPU profile samples stacks of all threads
+# for a limited time, allocation tracking (tracemalloc) runs only between start and stop.
+
+import collections
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger("foxess_profiler")
+
+MAX_PROFILE_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+DEFAULT_TOP = 30
+TRACEMALLOC_FRAMES = 10
+KEY_TYPES = ("lineno", "filename", "traceback")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+_profile_lock = threading.Lock()
+
+
+def _function(code):
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+def sample_threads(seconds, interval=DEFAULT_INTERVAL, top=DEFAULT_TOP, thread=None):
+    """
+    Statistical profile of all threads (mqtt network loop, workers, publishers, event loop).
+    cProfile sees only the thread which enabled it, so stacks are sampled with sys._current_frames().
+    :param seconds: profile duration, limited to MAX_PROFILE_SECONDS
+    :param thread: only threads with name starting with it, e.g. foxess-worker
+    :return: dict with top functions by own (self) and cumulative samples
+    """
+    seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("Profile already running")
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = collections.Counter()
+        cumulative = collections.Counter()
+        per_thread = collections.Counter()
+        samples = 0
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident == me or (thread and not name.startswith(thread)):
+                    continue
+                per_thread[name] += 1
+                own[_function(frame.f_code)] += 1
+                seen = set()
+                while frame is not None:
+                    function = _function(frame.f_code)
+                    if function not in seen:
+                        seen.add(function)
+                        cumulative[function] += 1
+                    frame = frame.f_back
+            samples += 1
+            time.sleep(interval)
+        thread_samples = sum(per_thread.values()) or 1
+        return {
+            "seconds": seconds,
+            "samples": samples,
+            "threads": dict(per_thread),
+            "own": [{"function": f, "samples": c, "percent": round(100 * c / thread_samples, 2)}
+                    for f, c in own.most_common(top)],
+            "cumulative": [{"function": f, "samples": c, "percent": round(100 * c / thread_samples, 2)}
+                           for f, c in cumulative.most_common(top)],
+        }
+    finally:
+        _profile_lock.release()
+
+
+class AllocationTracker:
+    """
+    tracemalloc snapshots, diff shows allocation sites which grew since the baseline snapshot
+    """
+
+    def __init__(self):
+        self.baseline = None
+        self.lock = threading.Lock()
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": tracemalloc.is_tracing(), "traced": current, "peak": peak,
+                "baseline": self.baseline is not None}
+
+    def start(self, frames=TRACEMALLOC_FRAMES):
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                logger.info("tracemalloc started")
+            self.baseline = tracemalloc.take_snapshot()
+        return self.status()
+
+    def stop(self):
+        with self.lock:
+            self.baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("tracemalloc stopped")
+        return self.status()
+
+    @staticmethod
+    def _filtered(snapshot):
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def snapshot(self, top=DEFAULT_TOP, key_type="lineno"):
+        """
+        Biggest allocation sites now
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        if key_type not in KEY_TYPES:
+            key_type = "lineno"
+        stats = self._filtered(tracemalloc.take_snapshot()).statistics(key_type)
+        return [{"site": str(s.traceback), "size": s.size, "count": s.count} for s in stats[:top]]
+
+    def diff(self, top=DEFAULT_TOP, key_type="lineno", rebase=False):
+        """
+        Allocation sites sorted by growth since baseline
+        :param rebase: the new snapshot becomes the baseline
+        """
+        if key_type not in KEY_TYPES:
+            key_type = "lineno"
+        with self.lock:
+            if not tracemalloc.is_tracing() or self.baseline is None:
+                return None
+            snapshot = tracemalloc.take_snapshot()
+            stats = self._filtered(snapshot).compare_to(self._filtered(self.baseline), key_type)
+            if rebase:
+                self.baseline = snapshot
+        return [{"site": str(s.traceback), "size_diff": s.size_diff, "size": s.size,
+                 "count_diff": s.count_diff, "count": s.count} for s in stats[:top]]
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Publisher stage - parsed frames are sent to HA on a dedicated thread (or a worker pool),
+# so the mqtt network loop (on_message) is never blocked by publishing.
+
+import collections
+import logging
+import threading
+import time
+
+from foxess_metrics import Histogram, PUBLISH_BUCKETS
+
+logger = logging.getLogger("foxess_publisher")
+
+# when queue is full the oldest frame is dropped
+POLICY_DROP_OLDEST = "drop_oldest"
+# frames waiting in queue are merged, the latest value of each sensor wins
+POLICY_LATEST = "latest"
+
+DEFAULT_QUEUE_SIZE = 100
+
+
+class SensorPublisher:
+    """
+    Bounded queue between frame parsing and sensor publishing.
+    """
+
+    def __init__(self, sensors, queue_size=DEFAULT_QUEUE_SIZE, policy=POLICY_DROP_OLDEST, pool=None, shard=0):
+        """
+        Publishing runs on own thread (start()) or, when pool is set, on the pool worker number shard.
+        """
+        if policy not in (POLICY_DROP_OLDEST, POLICY_LATEST):
+            raise ValueError(f"Unknown publish policy: {policy}")
+        self.sensors = sensors
+        self.policy = policy
+        self.queue = collections.deque(maxlen=queue_size)
+        # POLICY_LATEST - merged values waiting for publish and time of the oldest of them
+        self.pending = {}
+        self.pending_since = None
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.pool = pool
+        self.shard = shard
+        self.scheduled = False
+
+        self.submitted = 0
+        self.dropped = 0
+        self.published = 0
+        self.errors = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.latency_histogram = Histogram(PUBLISH_BUCKETS)
+
+    def submit(self, data):
+        """
+        Add parsed frame to the queue, never blocks.
+        """
+        now = time.monotonic()
+        with self.condition:
+            self.submitted += 1
+            if self.policy == POLICY_LATEST:
+                if self.pending:
+                    self.dropped += 1
+                else:
+                    self.pending_since = now
+                self.pending.update(data)
+            else:
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1
+                self.queue.append((now, data))
+            if self.pool is None:
+                self.condition.notify()
+                return
+            schedule = not self.scheduled
+            self.scheduled = True
+        if schedule:
+            # a dropped drain would leave scheduled set and the publisher stalled
+            self.pool.submit(self.shard, self.drain, droppable=False)
+
+    def _take(self):
+        with self.condition:
+            while self.running and not self.queue and not self.pending:
+                self.condition.wait()
+            return self._take_nowait()
+
+    def _take_nowait(self):
+        with self.condition:
+            if self.queue:
+                return self.queue.popleft()
+            if self.pending:
+                item = (self.pending_since, self.pending)
+                self.pending = {}
+                self.pending_since = None
+                return item
+            return None
+
+    def run(self):
+        while self.running:
+            item = self._take()
+            if item is not None:
+                self._publish(item)
+
+    def drain(self):
+        """
+        Publish everything waiting in the queue, used in pool mode
+        """
+        with self.condition:
+            self.scheduled = False
+        item = self._take_nowait()
+        while item is not None:
+            self._publish(item)
+            item = self._take_nowait()
+
+    def _publish(self, item):
+        submitted_at, data = item
+        try:
+            self.sensors.process_data(data)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error publishing data: {e}")
+            return
+        latency = time.monotonic() - submitted_at
+        self.published += 1
+        self.last_latency = latency
+        self.total_latency += latency
+        self.latency_histogram.observe(latency)
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="foxess-publisher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def queue_depth(self):
+        if self.policy == POLICY_LATEST:
+            return 1 if self.pending else 0
+        return len(self.queue)
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "queue_depth": self.queue_depth(),
+            "queue_size": self.queue.maxlen,
+            "submitted": self.submitted,
+            "published": self.published,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_latency": self.last_latency,
+            "avg_latency": self.total_latency / self.published if self.published else None,
+            "max_latency": self.max_latency,
+        }
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Declarative description of frame registers.
+# Register map is compiled once into struct.Struct layout(s) and whole frame is decoded with unpack_from.
+
+import struct
+from collections import namedtuple
+
+# key - message key, offset - position in frame data, width - bytes,
+# signed - two's complement value, precision - number of decimal places (value / 10**precision),
+# text - zero terminated string of width bytes
+Register = namedtuple("Register", ["key", "offset", "width", "signed", "precision", "text"],
+                      defaults=[False, 0, False])
+
+_FORMATS = {
+    (1, False): "B",
+    (1, True): "b",
+    (2, False): "H",
+    (2, True): "h",
+    (4, False): "I",
+    (4, True): "i",
+}
+
+
+def register_format(register):
+    """
+    struct (and array) format character of the register
+    """
+    if register.text:
+        return f"{register.width}s"
+    try:
+        return _FORMATS[(register.width, register.signed)]
+    except KeyError:
+        raise ValueError(f"Unsupported register width {register.width} for {register.key}")
+
+
+def _string_zero_terminated(data):
+    index = data.find(0x00)
+    if index == -1:
+        return data.decode()
+    return data[:index].decode()
+
+
+class RegisterMap:
+    """
+    Big endian register map of a single frame type.
+    Registers may overlap, overlapping ones are placed in separate struct layouts.
+    """
+
+    def __init__(self, registers):
+        self.registers = tuple(registers)
+        self.layouts = []
+        self.keys = []
+        for layer in self._layers(self.registers):
+            fmt = ">"
+            position = 0
+            for r in layer:
+                if r.offset > position:
+                    fmt += f"{r.offset - position}x"
+                fmt += register_format(r)
+                position = r.offset + r.width
+                self.keys.append(r.key)
+            self.layouts.append(struct.Struct(fmt))
+        self.keys = tuple(self.keys)
+        self.size = max((layout.size for layout in self.layouts), default=0)
+        registers = {r.key: r for r in self.registers}
+        # post processing only for fields which need it
+        self._scaled = tuple((i, 10 ** registers[k].precision)
+                             for i, k in enumerate(self.keys) if registers[k].precision)
+        self._texts = tuple(i for i, k in enumerate(self.keys) if registers[k].text)
+
+    @staticmethod
+    def _layers(registers):
+        layers = []
+        for r in sorted(registers, key=lambda r: r.offset):
+            for layer in layers:
+                if layer[-1].offset + layer[-1].width <= r.offset:
+                    layer.append(r)
+                    break
+            else:
+                layers.append([r])
+        return layers
+
+    def unpack(self, data):
+        """
+        Raw register values in order of self.keys
+        """
+        if len(data) < self.size:
+            # short frame, missing registers are zero
+            data = bytes(data).ljust(self.size, b'\x00')
+        if len(self.layouts) == 1:
+            values = self.layouts[0].unpack_from(data)
+        else:
+            values = ()
+            for layout in self.layouts:
+                values += layout.unpack_from(data)
+        if not self._scaled and not self._texts:
+            return values
+        values = list(values)
+        # integer / 10**precision is already the nearest float, round(value, precision) would not change it
+        for i, divider in self._scaled:
+            values[i] = values[i] / divider
+        for i in self._texts:
+            values[i] = _string_zero_terminated(values[i])
+        return values
+
+    def decode(self, data):
+        """
+        Decode frame data to dictionary {key: value}
+        """
+        return dict(zip(self.keys, self.unpack(data)))
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Running min / max / mean / last of numeric frame values per minute, hour and day.
+# A frame updates only the current minute; a closed minute is merged into its hour and a closed hour
+# into its day, so no history is rescanned. Buckets are aligned to FOXESS_TIME_ZONE local time
+# (days of 23 and 25 hours on DST changes).
+
+import collections
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger("foxess_rollups")
+
+MINUTE = "minute"
+HOUR = "hour"
+DAY = "day"
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+# closed buckets kept for queries
+KEEP = {MINUTE: 120, HOUR: 48, DAY: 31}
+# numeric, but not a measurement
+EXCLUDED = frozenset(["device_time"])
+
+_MIN, _MAX, _SUM, _COUNT, _LAST = range(5)
+
+
+class Bucket:
+    __slots__ = ("start", "end", "stats")
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        # key -> [min, max, sum, count, last]
+        self.stats = {}
+
+    def add(self, frame):
+        stats = self.stats
+        for key, value in frame.items():
+            if type(value) not in (int, float) or key in EXCLUDED:
+                continue
+            s = stats.get(key)
+            if s is None:
+                stats[key] = [value, value, value, 1, value]
+                continue
+            if value < s[_MIN]:
+                s[_MIN] = value
+            if value > s[_MAX]:
+                s[_MAX] = value
+            s[_SUM] += value
+            s[_COUNT] += 1
+            s[_LAST] = value
+
+    def merge(self, other):
+        stats = self.stats
+        for key, o in other.stats.items():
+            s = stats.get(key)
+            if s is None:
+                stats[key] = list(o)
+                continue
+            s[_MIN] = min(s[_MIN], o[_MIN])
+            s[_MAX] = max(s[_MAX], o[_MAX])
+            s[_SUM] += o[_SUM]
+            s[_COUNT] += o[_COUNT]
+            s[_LAST] = o[_LAST]
+
+    def values(self, key):
+        """
+        :return: dict min, max, mean, count, last or None
+        """
+        s = self.stats.get(key)
+        if s is None:
+            return None
+        return {"min": s[_MIN], "max": s[_MAX], "mean": s[_SUM] / s[_COUNT], "count": s[_COUNT], "last": s[_LAST]}
+
+    def as_dict(self, fields=None):
+        keys = self.stats.keys() if fields is None else [k for k in fields if k in self.stats]
+        return {"start": self.start, "end": self.end, "fields": {k: self.values(k) for k in keys}}
+
+
+class RollupEngine:
+    """
+    One per device, update() is called by the device worker, queries from any thread
+    """
+
+    def __init__(self, timezone="UTC", keep=None):
+        try:
+            self.tz = pytz.timezone(timezone)
+        except pytz.exceptions.UnknownTimeZoneError:
+            logger.error("Unknown timezone: %s, rollups aligned to UTC", timezone)
+            self.tz = pytz.utc
+        keep = keep or KEEP
+        self.current = dict.fromkeys(RESOLUTIONS)
+        self.closed = {r: collections.deque(maxlen=keep[r]) for r in RESOLUTIONS}
+        self.lock = threading.Lock()
+
+    def bounds(self, resolution, timestamp):
+        """
+        Local time bucket containing timestamp
+        :return: (start, end) seconds since epoch
+        """
+        local = datetime.fromtimestamp(timestamp, self.tz)
+        if resolution == MINUTE:
+            start = local.replace(second=0, microsecond=0).timestamp()
+            return start, start + 60
+        if resolution == HOUR:
+            start = local.replace(minute=0, second=0, microsecond=0).timestamp()
+            return start, start + 3600
+        day = local.date()
+        following = day + timedelta(days=1)
+        return (self.tz.localize(datetime(day.year, day.month, day.day)).timestamp(),
+                self.tz.localize(datetime(following.year, following.month, following.day)).timestamp())
+
+    def update(self, timestamp, frame):
+        """
+        Adds numeric values of the frame to the current minute
+        :param timestamp: receive time, seconds since epoch
+        :return: list of (resolution, Bucket) closed by this frame
+        """
+        with self.lock:
+            minute = self.current[MINUTE]
+            closed = []
+            if minute is None or timestamp >= minute.end:
+                closed = self._roll(timestamp)
+                minute = self.current[MINUTE]
+            minute.add(frame)
+        return closed
+
+    def _close(self, resolution, closed):
+        bucket = self.current[resolution]
+        self.current[resolution] = None
+        self.closed[resolution].append(bucket)
+        closed.append((resolution, bucket))
+        return bucket
+
+    def _merge(self, resolution, bucket):
+        current = self.current[resolution]
+        if current is None:
+            current = self.current[resolution] = Bucket(*self.bounds(resolution, bucket.start))
+        current.merge(bucket)
+
+    def _roll(self, timestamp):
+        closed = []
+        if self.current[MINUTE] is not None:
+            self._merge(HOUR, self._close(MINUTE, closed))
+        hour = self.current[HOUR]
+        if hour is not None and timestamp >= hour.end:
+            self._merge(DAY, self._close(HOUR, closed))
+        day = self.current[DAY]
+        if day is not None and timestamp >= day.end:
+            self._close(DAY, closed)
+        self.current[MINUTE] = Bucket(*self.bounds(MINUTE, timestamp))
+        return closed
+
+    def query(self, resolution, start=None, end=None, fields=None, current=False):
+        """
+        Closed buckets starting in [start, end)
+        :param current: add the bucket in progress (partial values)
+        """
+        with self.lock:
+            buckets = [b for b in self.closed[resolution]
+                       if (start is None or b.start >= start) and (end is None or b.start < end)]
+            result = [b.as_dict(fields) for b in buckets]
+            if current:
+                partial = self._partial(resolution)
+                if partial is not None:
+                    result.append(dict(partial.as_dict(fields), partial=True))
+        return result
+
+    def _partial(self, resolution):
+        # running bucket of the resolution together with not yet merged smaller ones
+        minute = self.current[MINUTE]
+        if resolution == MINUTE:
+            return minute
+        if minute is None:
+            return None
+        partial = Bucket(*self.bounds(resolution, minute.start))
+        if resolution == DAY and self.current[DAY] is not None:
+            partial.merge(self.current[DAY])
+        if self.current[HOUR] is not None:
+            partial.merge(self.current[HOUR])
+        partial.merge(minute)
+        return partial
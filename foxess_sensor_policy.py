@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Per sensor publish policy - decides if a new value is worth sending to HA.
+
+import time
+from collections import namedtuple
+
+# deadband - publish when value moved more than this (absolute) from the last published value
+# relative_deadband - the same as a fraction of the last published value, e.g. 0.01 = 1%
+# min_interval - seconds, never publish more often
+# max_interval - seconds, heartbeat - publish even if value has not changed, None - never
+SensorPolicy = namedtuple("SensorPolicy", ["deadband", "relative_deadband", "min_interval", "max_interval"],
+                          defaults=[0, 0, 0, None])
+
+# every value is published
+POLICY_ALWAYS = SensorPolicy(max_interval=0)
+# published on change, refreshed every 5 minutes
+POLICY_ON_CHANGE = SensorPolicy(max_interval=300)
+# diagnostic data (serial, model...), refreshed every hour
+POLICY_DIAGNOSTIC = SensorPolicy(max_interval=3600)
+POLICY_POWER = SensorPolicy(deadband=10, max_interval=60)
+POLICY_VOLTAGE = SensorPolicy(deadband=1, max_interval=300)
+POLICY_CURRENT = SensorPolicy(deadband=0.2, max_interval=300)
+POLICY_FREQUENCY = SensorPolicy(deadband=0.05, max_interval=300)
+POLICY_TEMPERATURE = SensorPolicy(deadband=1, max_interval=600)
+POLICY_DEVICE_TIME = SensorPolicy(min_interval=60)
+# integrated energy (kWh), changes with every frame
+POLICY_ENERGY = SensorPolicy(deadband=0.01, max_interval=300)
+
+
+class SensorPolicyEngine:
+    """
+    Remembers last published value of every sensor and applies its policy.
+    """
+
+    def __init__(self, default_policy=POLICY_ALWAYS):
+        self.default_policy = default_policy
+        self.policies = {}
+        # key -> (value, time)
+        self.last = {}
+        self.published = {}
+        self.suppressed = {}
+
+    def set_policy(self, key, policy):
+        self.policies[key] = policy if policy is not None else self.default_policy
+
+    def should_publish(self, key, value, now=None):
+        if now is None:
+            now = time.monotonic()
+        last = self.last.get(key)
+        if last is None or self._is_due(self.policies.get(key, self.default_policy), value, last, now):
+            self.last[key] = (value, now)
+            self.published[key] = self.published.get(key, 0) + 1
+            return True
+        self.suppressed[key] = self.suppressed.get(key, 0) + 1
+        return False
+
+    @staticmethod
+    def _is_due(policy, value, last, now):
+        last_value, last_time = last
+        elapsed = now - last_time
+        if elapsed < policy.min_interval:
+            return False
+        if policy.max_interval is not None and elapsed >= policy.max_interval:
+            return True
+        if isinstance(value, (int, float)) and isinstance(last_value, (int, float)) \
+                and not isinstance(value, bool):
+            threshold = max(policy.deadband, policy.relative_deadband * abs(last_value))
+            return abs(value - last_value) > threshold
+        return value != last_value
+
+    def reset(self, key=None):
+        """
+        Forget last published values, next value is always published
+        """
+        if key is None:
+            self.last.clear()
+        else:
+            self.last.pop(key, None)
+
+    def stats(self):
+        return {
+            "published": sum(self.published.values()),
+            "suppressed": sum(self.suppressed.values()),
+            "sensors": {key: {"published": self.published.get(key, 0), "suppressed": self.suppressed.get(key, 0)}
+                        for key in self.policies},
+        }
@@ -16,13 +16,31 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import time
+import collections
+import json
+import logging
 from ha_mqtt_discoverable import Settings
 from ha_mqtt_discoverable.sensors import Sensor, SensorInfo, DeviceInfo
 import os
 import paho.mqtt.client as mqtt
+from foxess_discovery_cache import DiscoveryCache, definition_hash
+from foxess_sensor_policy import SensorPolicyEngine, POLICY_ON_CHANGE, POLICY_DIAGNOSTIC, POLICY_POWER, \
+    POLICY_VOLTAGE, POLICY_CURRENT, POLICY_FREQUENCY, POLICY_TEMPERATURE, POLICY_DEVICE_TIME, \
+    POLICY_ENERGY
 from helper import FOXESS_DEVICE_NAME,FOXESS_SN,FOXESS_SW_VERSION,FOXESS_MODEL,FOXESS_MANUFACTURER,FOXESS_TIME_ZONE
-from helper import MQTT_USER,MQTT_PASSWORD,MQTT_CLIENT_ID,MQTT_BROKER,MQTT_PORT,MQTT_TOPIC
+from helper import MQTT_USER,MQTT_PASSWORD,MQTT_CLIENT_ID,MQTT_BROKER,MQTT_PORT,MQTT_TOPIC,PUBLISH_WINDOW,PUBLISH_JSON_STATE
+from helper import DISCOVERY_CACHE_DIR
+
+logger = logging.getLogger("foxess_sensors_handler")
+
+# max time to wait for a publish when in-flight window is full
+PUBLISH_TIMEOUT = 5
+# HA birth / last will messages
+HA_STATUS_TOPIC = "homeassistant/status"
+HA_STATUS_ONLINE = b"online"
+# reconnect backoff, seconds
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 120
 
 
 SERIAL = "sn"
@@ -56,7 +74,34 @@ GENERATED_POWER_VALUE = "generated_power_value"
 LOAD_POWER_VALUE = "load_power_value"
 GRID_POWER_VALUE = "grid_power_value"
 
+# unit and device class of values derived from a frame value, by key suffix
+SUFFIX_CLASSES = {
+    "_power_value": (UNIT_W, CLASS_POWER),
+    "_voltage_value": ("V", CLASS_VOLTAGE),
+    "_current_value": ("A", CLASS_CURRENT),
+    "_frequency_value": ("Hz", CLASS_FREQUENCY),
+    "_temperature_value": ("°C", CLASS_TEMPERATURE),
+    # HA energy class requires total state class, not a measurement
+    "_yield_value": ("kWh", None),
+}
+ROLLUP_NAMES = {"minute": "Minute", "hour": "Hourly", "day": "Daily"}
+ROLLUP_STATS = ("min", "max", "mean")
+
+
+def rollup_key(key, resolution, stat):
+    return f"{key}_{resolution}_{stat}"
+
+
+
+
+class _DiscoverySensor(Sensor):
+    """
+    Sensor used only to build discovery payload. Client is shared with the handler,
+    Discoverable.__del__ would disconnect it and stop its network loop.
+    """
 
+    def __del__(self):
+        pass
 
 
 class FoxessSensorsHandler:
@@ -67,13 +112,15 @@ class FoxessSensorsHandler:
     def __init__(
         self,
             mqtt_param,
-            foxess
+            foxess,
+            client=None
     ):
         """
         Initializes the FoxessDataHandler with MQTT settings and device info.
 
         Args:
             mqtt (dict): MQTT params
+            client (mqtt.Client, optional): connected client to share, if not set own long-lived client is started
         """
 
         self.name=foxess.get(FOXESS_DEVICE_NAME,None)
@@ -85,17 +132,88 @@ class FoxessSensorsHandler:
 
         self.broker =  mqtt_param.get(MQTT_BROKER)
         self.port = mqtt_param.get(MQTT_PORT)
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,client_id=mqtt_param.get(MQTT_CLIENT_ID))
-        self.client.username_pw_set(mqtt_param.get(MQTT_USER),mqtt_param.get(MQTT_PASSWORD))
+        self.own_client = client is None
+        if self.own_client:
+            client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,client_id=mqtt_param.get(MQTT_CLIENT_ID))
+            client.username_pw_set(mqtt_param.get(MQTT_USER),mqtt_param.get(MQTT_PASSWORD))
+            client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY)
+            # network loop reconnects with backoff
+            client.connect_async(self.broker,self.port,keepalive=60)
+            client.loop_start()
+        self.client = client
         self.mqtt_settings = Settings.MQTT(client=self.client)
 
         self.sensors = {}  # Dictionary to store created sensors
+        self.policy = SensorPolicyEngine()
         self.device_info = None
+        # messages handed over to mqtt client but not written to the broker yet
+        self.publish_window = mqtt_param.get(PUBLISH_WINDOW, 10)
+        self.inflight = collections.deque()
+        # all sensors read their values from one json state topic
+        self.json_state = mqtt_param.get(PUBLISH_JSON_STATE, False)
+        self.state = {}
+        # discovery payloads are built once and published only when changed or HA restarted
+        self.discovery = DiscoveryCache(mqtt_param.get(DISCOVERY_CACHE_DIR))
+        self.discovery_pending = True
+        self.discovery_force = False
+        # sensors of derived values (rollups, energy), created together with the frame sensors
+        self.extra_sensors = []
 
     def _get_id(self, key):
         return "_".join([self.identifiers, key])
 
-    def create_sensor(self, sensor_data_key, sensor_name, unit_of_measurement=None, device_class=None, state_class=None, icon=None, entity_category=None,value_template=None):
+    def _get_json_state_topic(self):
+        return f"{self.mqtt_settings.state_prefix}/sensor/{self.identifiers}/state"
+
+    @staticmethod
+    def _json_value_template(key, value_template):
+        """
+        Template picking sensor value from json state, `value` in the given template is replaced by sensor value
+        """
+        if value_template is None:
+            return f"{{{{ value_json.{key} }}}}"
+        return value_template.replace("value", f"value_json.{key}", 1)
+
+    def _create(self, sensor_data_key, definition, policy):
+        """
+        Builds discovery payload of the sensor or takes it from the cache
+        """
+        key = definition_hash([definition, self.device_info, self.json_state,
+                               self.mqtt_settings.discovery_prefix, self.mqtt_settings.state_prefix])
+        entry = self.discovery.get(key)
+        if entry is None:
+            sensor_info = SensorInfo(device=DeviceInfo(**self.device_info), **definition)
+            sensor = _DiscoverySensor(Settings(mqtt=self.mqtt_settings, entity=sensor_info))
+            if self.json_state:
+                sensor.state_topic = self._get_json_state_topic()
+            entry = self.discovery.add(key, sensor.config_topic, sensor.state_topic,
+                                       json.dumps(sensor.generate_config()))
+        self.sensors[sensor_data_key] = entry
+        self.policy.set_policy(sensor_data_key, policy)
+
+    def request_discovery(self, force=True):
+        """
+        Discovery configs will be (re)published with the next processed data, e.g. after HA birth message
+        """
+        self.discovery_force = self.discovery_force or force
+        self.discovery_pending = True
+
+    def publish_discovery(self, force=False):
+        if force:
+            self.discovery.clear_published()
+        count = 0
+        for entry in self.sensors.values():
+            if self.discovery.is_published(entry):
+                continue
+            self._track_publish(self.client.publish(entry.config_topic, entry.config, retain=True))
+            self.discovery.set_published(entry)
+            count += 1
+        # every sensor was created by now, entries of removed sensors are not needed
+        self.discovery.prune()
+        self.discovery.save()
+        logger.info(f"Discovery configs published: {count}, unchanged: {len(self.sensors) - count}")
+
+    def create_sensor(self, sensor_data_key, sensor_name, unit_of_measurement=None, device_class=None, state_class=None, icon=None, entity_category=None,value_template=None, policy=None):
         """
         Creates a Home Assistant sensor.
         Args:
@@ -105,26 +223,55 @@ class FoxessSensorsHandler:
             device_class (str, optional): Device class for Home Assistant. Defaults to None.
             state_class (str, optional): State class for Home Assistant. Defaults to None.
             icon (str, optional): Icon for Home Assistant. Defaults to None.
+            policy (SensorPolicy, optional): When the state is published. Defaults to every value.
         """
         unique_id = self._get_id(sensor_data_key)
-        sensor_info = SensorInfo(
+        if self.json_state:
+            value_template = self._json_value_template(sensor_data_key, value_template)
+        definition = dict(
             name=sensor_name,
             unique_id=unique_id,
             device_class=device_class,
             unit_of_measurement=unit_of_measurement,
-            device=self.device_info,
             state_class=state_class,
             icon=icon,
             entity_category=entity_category,
             value_template=value_template,
             object_id=unique_id
         )
+        self._create(sensor_data_key, definition, policy)
 
-        settings = Settings(mqtt=self.mqtt_settings, entity=sensor_info)
-        sensor = Sensor(settings)
-        self.sensors[sensor_data_key] = sensor
+    def add_sensor(self, sensor_data_key, sensor_name, unit_of_measurement=None, device_class=None, state_class=None,
+                   policy=None):
+        """
+        Sensor of a value added to the frame by this application, created with the first frame
+        when the device is known, arguments as create_sensor.
+        """
+        self.extra_sensors.append((sensor_data_key, dict(sensor_name=sensor_name, unit_of_measurement=unit_of_measurement,
+                                                         device_class=device_class, state_class=state_class,
+                                                         policy=policy)))
 
-    def create_text_sensor(self, sensor_data_key, sensor_name, device_class=None, icon=None, entity_category=None):
+    def add_rollup_sensors(self, keys, resolution):
+        """
+        min / max / mean sensors of closed rollup buckets (foxess_rollups)
+        """
+        for key in keys:
+            unit, device_class = next((c for suffix, c in SUFFIX_CLASSES.items() if key.endswith(suffix)), (None, None))
+            name = key.removesuffix("_value").replace("_", " ").title()
+            for stat in ROLLUP_STATS:
+                self.add_sensor(rollup_key(key, resolution, stat), f"{name} {ROLLUP_NAMES[resolution]} {stat.title()}",
+                                unit, device_class=device_class, state_class="measurement", policy=POLICY_ON_CHANGE)
+
+    def add_energy_sensors(self, keys):
+        """
+        total_increasing kWh sensors of integrated power (foxess_energy)
+        """
+        for key in keys:
+            name = key.removesuffix("_value").replace("_", " ").title().replace("Pv", "PV")
+            self.add_sensor(key, name, "kWh", device_class=CLASS_ENERGY, state_class="total_increasing",
+                            policy=POLICY_ENERGY)
+
+    def create_text_sensor(self, sensor_data_key, sensor_name, device_class=None, icon=None, entity_category=None, policy=None):
         """
         Creates a Home Assistant sensor.
 
@@ -135,19 +282,18 @@ class FoxessSensorsHandler:
             device_class (str, optional): Device class for Home Assistant. Defaults to None.
             state_class (str, optional): State class for Home Assistant. Defaults to None.
             icon (str, optional): Icon for Home Assistant. Defaults to None.
+            policy (SensorPolicy, optional): When the state is published. Defaults to every value.
         """
         unique_id = self._get_id(sensor_data_key)
-        sensor_info = SensorInfo(
+        definition = dict(
             name=sensor_name,
             unique_id=unique_id,
             device_class=device_class,
-            device=self.device_info,
             icon=icon,
-            entity_category=entity_category
+            entity_category=entity_category,
+            value_template=self._json_value_template(sensor_data_key, None) if self.json_state else None
         )
-        settings = Settings(mqtt=self.mqtt_settings, entity=sensor_info)
-        text = Sensor(settings)
-        self.sensors[sensor_data_key] = text
+        self._create(sensor_data_key, definition, policy)
 
     def _device_info(self, frame):
         if self.name is None:
@@ -166,11 +312,11 @@ class FoxessSensorsHandler:
         if self.sw_version is None:
             self.sw_version=frame.get("sw_version", self.sw_version)
 
-        return DeviceInfo(name=self.name,
-                          identifiers= self.identifiers,
-                          model=self.model,
-                          manufacturer=self.manufacturer,
-                          sw_version=self.sw_version)
+        return dict(name=self.name,
+                    identifiers= self.identifiers,
+                    model=self.model,
+                    manufacturer=self.manufacturer,
+                    sw_version=self.sw_version)
 
     def process_data(self, data):
         """
@@ -183,98 +329,151 @@ class FoxessSensorsHandler:
         self.device_info = self._device_info(data)
         if self.device_info is None:
             return
+        self.discovery.load(self.identifiers)
 
-        self.client.connect(self.broker,self.port,keepalive=60)
+        # text sensor, the same type in every frame for both state modes and the policy;
+        # a copy, the frame is kept in history as parsed
+        fm = data.get("fault_messages", [] if "fault_messages" not in self.sensors else None)
+        if fm is not None and not isinstance(fm, str):
+            data = dict(data, fault_messages=",".join(str(f) for f in fm))
 
         # Create sensors if they don't exist
 
         if "manufacturer" not in self.sensors:
-            self.create_text_sensor("manufacturer", "Manufacturer",entity_category="diagnostic")
+            self.create_text_sensor("manufacturer", "Manufacturer",entity_category="diagnostic", policy=POLICY_DIAGNOSTIC)
         if "model" not in self.sensors:
-            self.create_text_sensor("model", "Model",entity_category="diagnostic")
+            self.create_text_sensor("model", "Model",entity_category="diagnostic", policy=POLICY_DIAGNOSTIC)
         if SERIAL not in self.sensors:
-            self.create_text_sensor(SERIAL, "Serial", entity_category="diagnostic")
+            self.create_text_sensor(SERIAL, "Serial", entity_category="diagnostic", policy=POLICY_DIAGNOSTIC)
         if SERIES not in self.sensors:
-            self.create_text_sensor(SERIES, "Series", entity_category="diagnostic")
+            self.create_text_sensor(SERIES, "Series", entity_category="diagnostic", policy=POLICY_DIAGNOSTIC)
         if "status" not in self.sensors:
-            self.create_text_sensor("status", "Status",entity_category="diagnostic")
+            self.create_text_sensor("status", "Status",entity_category="diagnostic", policy=POLICY_ON_CHANGE)
         if "fault_messages" not in self.sensors:
-            fm = data.get("fault_messages",[])
-            if len(fm)>0:
-                data["fault_messages"] = ",".join(fm)
-            else:
-                data["fault_messages"] = ""
-            self.create_text_sensor("fault_messages", "Errors", entity_category="diagnostic")
+            self.create_text_sensor("fault_messages", "Errors", entity_category="diagnostic", policy=POLICY_ON_CHANGE)
         if "device_time" not in self.sensors:
-            self.create_sensor(sensor_data_key="device_time", sensor_name="Device time",device_class="timestamp",value_template="{{ value | int | timestamp_custom('%Y-%m-%dT%H:%M:%S+02:00') }}")
+            self.create_sensor(sensor_data_key="device_time", sensor_name="Device time",device_class="timestamp",value_template="{{ value | int | timestamp_custom('%Y-%m-%dT%H:%M:%S+02:00') }}", policy=POLICY_DEVICE_TIME)
         if GRID_POWER_VALUE not in self.sensors:
-            self.create_sensor(sensor_data_key=GRID_POWER_VALUE, sensor_name="Grid Power", unit_of_measurement=UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor(sensor_data_key=GRID_POWER_VALUE, sensor_name="Grid Power", unit_of_measurement=UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if LOAD_POWER_VALUE not in self.sensors:
-            self.create_sensor(LOAD_POWER_VALUE, "Load Power", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor(LOAD_POWER_VALUE, "Load Power", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if GENERATED_POWER_VALUE not in self.sensors:
-            self.create_sensor(GENERATED_POWER_VALUE, "Generated Power", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor(GENERATED_POWER_VALUE, "Generated Power", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if TODAY_YIELD_VALUE not in self.sensors:
-            self.create_sensor(TODAY_YIELD_VALUE, "Today's Yield", "kWh", device_class=CLASS_ENERGY, state_class="total_increasing")
+            self.create_sensor(TODAY_YIELD_VALUE, "Today's Yield", "kWh", device_class=CLASS_ENERGY, state_class="total_increasing", policy=POLICY_ON_CHANGE)
         if TOTAL_YIELD_VALUE not in self.sensors:
-            self.create_sensor(TOTAL_YIELD_VALUE, "Total Yield", "kWh", device_class=CLASS_ENERGY, state_class="total_increasing")
+            self.create_sensor(TOTAL_YIELD_VALUE, "Total Yield", "kWh", device_class=CLASS_ENERGY, state_class="total_increasing", policy=POLICY_ON_CHANGE)
         if GRID_VOLTAGE_R_VALUE not in self.sensors:
-            self.create_sensor(GRID_VOLTAGE_R_VALUE, "Grid Voltage R", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor(GRID_VOLTAGE_R_VALUE, "Grid Voltage R", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if GRID_CURRENT_R_VALUE not in self.sensors:
-            self.create_sensor(GRID_CURRENT_R_VALUE, "Grid Current R", "A", device_class=CLASS_CURRENT)
+            self.create_sensor(GRID_CURRENT_R_VALUE, "Grid Current R", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if GRID_FREQUENCY_R_VALUE not in self.sensors:
-            self.create_sensor(GRID_FREQUENCY_R_VALUE, "Grid Frequency R", "Hz", device_class=CLASS_FREQUENCY)
+            self.create_sensor(GRID_FREQUENCY_R_VALUE, "Grid Frequency R", "Hz", device_class=CLASS_FREQUENCY, policy=POLICY_FREQUENCY)
         if GRID_POWER_R_VALUE not in self.sensors:
-            self.create_sensor(GRID_POWER_R_VALUE, "Grid Power R", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor(GRID_POWER_R_VALUE, "Grid Power R", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if GRID_VOLTAGE_S_VALUE not in self.sensors:
-            self.create_sensor(GRID_VOLTAGE_S_VALUE, "Grid Voltage S", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor(GRID_VOLTAGE_S_VALUE, "Grid Voltage S", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if GRID_CURRENT_S_VALUE not in self.sensors:
-            self.create_sensor(GRID_CURRENT_S_VALUE, "Grid Current S", "A", device_class=CLASS_CURRENT)
+            self.create_sensor(GRID_CURRENT_S_VALUE, "Grid Current S", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if GRID_FREQUENCY_S_VALUE not in self.sensors:
-            self.create_sensor(GRID_FREQUENCY_S_VALUE, "Grid Frequency S", "Hz", device_class=CLASS_FREQUENCY)
+            self.create_sensor(GRID_FREQUENCY_S_VALUE, "Grid Frequency S", "Hz", device_class=CLASS_FREQUENCY, policy=POLICY_FREQUENCY)
         if GRID_POWER_S_VALUE not in self.sensors:
-            self.create_sensor(GRID_POWER_S_VALUE, "Grid Power S", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor(GRID_POWER_S_VALUE, "Grid Power S", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if GRID_VOLTAGE_T_VALUE not in self.sensors:
-            self.create_sensor(GRID_VOLTAGE_T_VALUE, "Grid Voltage T", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor(GRID_VOLTAGE_T_VALUE, "Grid Voltage T", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if "grid_current_t_value" not in self.sensors:
-            self.create_sensor("grid_current_t_value", "Grid Current T", "A", device_class=CLASS_CURRENT)
+            self.create_sensor("grid_current_t_value", "Grid Current T", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if "grid_frequency_t_value" not in self.sensors:
-            self.create_sensor("grid_frequency_t_value", "Grid Frequency T", "Hz", device_class=CLASS_FREQUENCY)
+            self.create_sensor("grid_frequency_t_value", "Grid Frequency T", "Hz", device_class=CLASS_FREQUENCY, policy=POLICY_FREQUENCY)
         if "grid_power_t_value" not in self.sensors:
-            self.create_sensor("grid_power_t_value", "Grid Power T", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor("grid_power_t_value", "Grid Power T", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if "pv1_voltage_value" not in self.sensors:
-            self.create_sensor("pv1_voltage_value", "PV1 Voltage", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor("pv1_voltage_value", "PV1 Voltage", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if "pv1_current_value" not in self.sensors:
-            self.create_sensor("pv1_current_value", "PV1 Current", "A", device_class=CLASS_CURRENT)
+            self.create_sensor("pv1_current_value", "PV1 Current", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if "pv2_voltage_value" not in self.sensors:
-            self.create_sensor("pv2_voltage_value", "PV2 Voltage", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor("pv2_voltage_value", "PV2 Voltage", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if "pv2_current_value" not in self.sensors:
-            self.create_sensor("pv2_current_value", "PV2 Current", "A", device_class=CLASS_CURRENT)
+            self.create_sensor("pv2_current_value", "PV2 Current", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if "pv3_voltage_value" not in self.sensors:
-            self.create_sensor("pv3_voltage_value", "PV3 Voltage", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor("pv3_voltage_value", "PV3 Voltage", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if "pv3_current_value" not in self.sensors:
-            self.create_sensor("pv3_current_value", "PV3 Current", "A", device_class=CLASS_CURRENT)
+            self.create_sensor("pv3_current_value", "PV3 Current", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if "pv4_voltage_value" not in self.sensors:
-            self.create_sensor("pv4_voltage_value", "PV4 Voltage", "V", device_class=CLASS_VOLTAGE)
+            self.create_sensor("pv4_voltage_value", "PV4 Voltage", "V", device_class=CLASS_VOLTAGE, policy=POLICY_VOLTAGE)
         if "pv4_current_value" not in self.sensors:
-            self.create_sensor("pv4_current_value", "PV4 Current", "A", device_class=CLASS_CURRENT)
+            self.create_sensor("pv4_current_value", "PV4 Current", "A", device_class=CLASS_CURRENT, policy=POLICY_CURRENT)
         if "boost_temperature_value" not in self.sensors:
-            self.create_sensor("boost_temperature_value", "Boost Temperature", "°C", device_class=CLASS_TEMPERATURE)
+            self.create_sensor("boost_temperature_value", "Boost Temperature", "°C", device_class=CLASS_TEMPERATURE, policy=POLICY_TEMPERATURE)
         if "inverter_temperature_value" not in self.sensors:
-            self.create_sensor("inverter_temperature_value", "Inverter Temperature", "°C", device_class=CLASS_TEMPERATURE)
+            self.create_sensor("inverter_temperature_value", "Inverter Temperature", "°C", device_class=CLASS_TEMPERATURE, policy=POLICY_TEMPERATURE)
         if "ambient_temperature_value" not in self.sensors:
-            self.create_sensor("ambient_temperature_value", "Ambient Temperature", "°C", device_class=CLASS_TEMPERATURE)
+            self.create_sensor("ambient_temperature_value", "Ambient Temperature", "°C", device_class=CLASS_TEMPERATURE, policy=POLICY_TEMPERATURE)
         if "pv1_power_value" not in self.sensors:
-            self.create_sensor("pv1_power_value", "PV1 Power", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor("pv1_power_value", "PV1 Power", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if "pv2_power_value" not in self.sensors:
-            self.create_sensor("pv2_power_value", "PV2 Power", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor("pv2_power_value", "PV2 Power", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if "pv3_power_value" not in self.sensors:
-            self.create_sensor("pv3_power_value", "PV3 Power", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor("pv3_power_value", "PV3 Power", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
         if "pv4_power_value" not in self.sensors:
-            self.create_sensor("pv4_power_value", "PV4 Power", UNIT_W, device_class=CLASS_POWER)
+            self.create_sensor("pv4_power_value", "PV4 Power", UNIT_W, device_class=CLASS_POWER, policy=POLICY_POWER)
+        for key, definition in self.extra_sensors:
+            if key not in self.sensors:
+                self.create_sensor(key, **definition)
+
+        if self.discovery_pending:
+            self.discovery_pending = False
+            if self.discovery_force:
+                # HA restarted and lost states, send everything again
+                self.discovery_force = False
+                self.publish_discovery(force=True)
+                self.policy.reset()
+            else:
+                self.publish_discovery()
+
+        if self.json_state:
+            self._publish_json_state(data)
+            return
 
         # Update sensor states
         for key, sensor in self.sensors.items():
             if key in data.keys():
-                if data.get(key,None) is not None:
-                    sensor.set_state(data[key])
-                    time.sleep(50/1000)
+                if data.get(key,None) is not None and self.policy.should_publish(key, data[key]):
+                    self._publish_state(sensor, data[key])
+
+    def _publish_json_state(self, data):
+        """
+        One message with all sensors values, values not present in this frame are taken from previous frames
+        """
+        values = {key: value for key, value in data.items() if key in self.sensors and value is not None}
+        self.state.update(values)
+        # every key has to be checked to keep policy state up to date
+        changed = [self.policy.should_publish(key, value) for key, value in values.items()]
+        if not any(changed):
+            return
+        payload = json.dumps(self.state, separators=(',', ':'), default=str)
+        # retained, every sensor of the device reads this topic
+        self._track_publish(self.client.publish(self._get_json_state_topic(), payload, retain=True))
+
+    def _publish_state(self, sensor, value):
+        # retained as by Sensor.set_state, HA resubscribing without a birth message gets the last state
+        self._track_publish(self.client.publish(sensor.state_topic, str(value), retain=True))
+
+    def _track_publish(self, info):
+        if self.publish_window is None:
+            # no waiting for the broker, e.g. in asyncio runtime
+            return
+        self.inflight.append(info)
+        while len(self.inflight) >= self.publish_window:
+            self._wait_for_publish(self.inflight.popleft())
+
+    def _wait_for_publish(self, info):
+        try:
+            info.wait_for_publish(PUBLISH_TIMEOUT)
+        except (ValueError, RuntimeError) as e:
+            logger.debug(f"Publish failed: {e}")
+
+    def close(self):
+        if self.own_client:
+            self.client.loop_stop()
+            self.client.disconnect()
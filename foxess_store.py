@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Persistent store of type 2 frames, compressed column by column.
+# Directory of segments <first timestamp ms>.fxts, a segment never crosses a segment_span boundary
+# (a new one is started also by every writer). Segment: magic, columns (length + JSON), then blocks
+#   header: rows (uint32), first and last timestamp (int64 ms), payload size (uint32), crc32 of payload
+#   payload: size of every column (varints), then the columns
+# Block headers are the index of the segment, a reader jumps over blocks outside of the time range.
+# Columns keep raw register integers (as TimeSeriesRing): timestamps and device time delta-of-delta,
+# values delta to the previous row, zigzag varints - an unchanged value takes one byte.
+# Rows are buffered and written as one block every flush_interval seconds, followed by fsync.
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_left
+
+from foxess_timeseries import Column, DEFAULT_LIMIT, TIMESTAMP, DEVICE_TIME, row_encoders, encode_row, decode_value
+
+logger = logging.getLogger("foxess_store")
+
+MAGIC = b"FXTS\x00\x01\x00\x00"
+SEGMENT_SUFFIX = ".fxts"
+LENGTH = struct.Struct("<I")
+BLOCK_HEADER = struct.Struct("<IqqII")
+DEFAULT_SEGMENT_SPAN = 24 * 3600
+DEFAULT_FLUSH_INTERVAL = 60
+# rows of one block, written earlier than flush interval when reached
+MAX_BLOCK_ROWS = 4096
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _put(out, value):
+    value = _zigzag(value)
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_deltas(values, order=1):
+    """
+    :param order: 1 - delta to previous value, 2 - delta of deltas (regular intervals)
+    """
+    out = bytearray()
+    previous = 0
+    delta = 0
+    for value in values:
+        d = value - previous
+        _put(out, d - delta if order == 2 else d)
+        previous = value
+        delta = d
+    return out
+
+
+def decode_deltas(data, count, order=1, position=0):
+    """
+    :return: (list of count values, position after them)
+    """
+    values = []
+    previous = 0
+    delta = 0
+    for _ in range(count):
+        value = 0
+        shift = 0
+        while True:
+            b = data[position]
+            position += 1
+            value |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        d = _unzigzag(value)
+        if order == 2:
+            d += delta
+        previous += d
+        delta = d
+        values.append(previous)
+    return values, position
+
+
+def list_segments(directory):
+    """
+    :return: sorted first timestamps (ms) of segments
+    """
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[:-len(SEGMENT_SUFFIX)]) for n in names
+                  if n.endswith(SEGMENT_SUFFIX) and n[:-len(SEGMENT_SUFFIX)].isdigit())
+
+
+class Segment:
+    """
+    Read only view of one segment file, blocks are read one at a time
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a frame store segment")
+        size, = LENGTH.unpack(self.file.read(LENGTH.size))
+        self.columns = [Column(*c) for c in json.loads(self.file.read(size))]
+        self.data_start = self.file.tell()
+
+    def headers(self):
+        """
+        :return: generator of (rows, first, last, payload position, payload size, crc), stops at a torn block
+        """
+        position = self.data_start
+        file_size = os.fstat(self.file.fileno()).st_size
+        while position + BLOCK_HEADER.size <= file_size:
+            self.file.seek(position)
+            rows, first, last, size, crc = BLOCK_HEADER.unpack(self.file.read(BLOCK_HEADER.size))
+            payload = position + BLOCK_HEADER.size
+            if payload + size > file_size:
+                break
+            yield rows, first, last, payload, size, crc
+            position = payload + size
+
+    def read_block(self, rows, payload, size, crc, keys):
+        """
+        :param keys: column keys to decode, other columns are skipped
+        :return: dict timestamp, device_time and keys -> list of raw values, None for a damaged block
+        """
+        self.file.seek(payload)
+        data = self.file.read(size)
+        if zlib.crc32(data) != crc:
+            logger.warning("Damaged block in %s", self.path)
+            return None
+        names = [TIMESTAMP, DEVICE_TIME] + [c.key for c in self.columns]
+        sizes, position = decode_deltas(data, len(names))
+        result = {}
+        for name, column_size in zip(names, sizes):
+            if name in (TIMESTAMP, DEVICE_TIME) or name in keys:
+                order = 2 if name in (TIMESTAMP, DEVICE_TIME) else 1
+                result[name], _ = decode_deltas(data, rows, order, position)
+            position += column_size
+        return result
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FrameStore:
+    """
+    Append only store of one inverter. append() is called by the device worker, queries from any thread.
+    :param segment_span: seconds, segments are aligned to multiples of it (UTC)
+    :param retention: seconds, older segments are deleted on rotation, 0 - keep all
+    """
+
+    def __init__(self, directory, columns, segment_span=DEFAULT_SEGMENT_SPAN, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 retention=0):
+        self.directory = directory
+        self.columns = list(columns)
+        self.typecodes = {c.key: c.typecode for c in self.columns}
+        self.scales = {c.key: 10 ** c.precision for c in self.columns}
+        self._encoders = row_encoders(self.columns)
+        self.segment_span = segment_span * 1000
+        self.flush_interval = flush_interval
+        self.retention = retention * 1000
+        self.file = None
+        self.segment_end = 0
+        # rows not written yet: timestamps (ms) and raw values
+        self.timestamps = []
+        self.rows = []
+        self.last_timestamp = 0
+        self.last_flush = time.monotonic()
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        segments = list_segments(directory)
+        if segments:
+            # clock may be set back, keep timestamps ordered across segments
+            self.last_timestamp = max(segments[-1] + 1, self._last_timestamp(segments[-1]))
+
+    def _path(self, segment):
+        return os.path.join(self.directory, str(segment) + SEGMENT_SUFFIX)
+
+    def _last_timestamp(self, segment):
+        last = 0
+        try:
+            with Segment(self._path(segment)) as s:
+                for header in s.headers():
+                    last = header[2]
+        except (OSError, ValueError):
+            pass
+        return last
+
+    def append(self, timestamp, frame):
+        """
+        :param timestamp: receive time, seconds since epoch
+        :param frame: parsed frame dict, fields not in columns are ignored
+        :return: False for other frame types (e.g. model, serial number)
+        """
+        if self.columns and self.columns[0].key not in frame:
+            return False
+        row = encode_row(self._encoders, frame)
+        with self.lock:
+            if self.closed:
+                return False
+            timestamp = max(int(timestamp * 1000), self.last_timestamp)
+            # rows buffered without an open segment (first block, after a write error) start one at timestamps[0]
+            if self.file is not None:
+                segment_end = self.segment_end
+            elif self.timestamps:
+                segment_end = self._segment_end(self.timestamps[0])
+            else:
+                segment_end = None
+            if segment_end is not None and timestamp >= segment_end:
+                self._flush()
+                self._close_segment()
+            self.timestamps.append(timestamp)
+            self.rows.append(row)
+            self.last_timestamp = timestamp
+            if len(self.rows) >= MAX_BLOCK_ROWS or self._flush_due():
+                self._flush()
+        return True
+
+    def _flush_due(self):
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def flush(self, due=False):
+        """
+        :param due: only when flush_interval passed, called periodically so the last rows are written
+            when frames stop coming
+        """
+        with self.lock:
+            if not due or self._flush_due():
+                self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        try:
+            if self.file is None:
+                start = self._open_segment(self.timestamps[0])
+                if start > self.timestamps[0]:
+                    # segment name is the first timestamp, rows are moved as by the clamping in append()
+                    self.timestamps = [max(t, start) for t in self.timestamps]
+                    self.last_timestamp = max(self.last_timestamp, start)
+            block = self._encode_block()
+            self.file.write(block)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.rows_written += len(self.rows)
+            self.bytes_written += len(block)
+        except OSError as e:
+            # e.g. disk full, the block is lost, storing must not stop parsing
+            logger.error("Frame store write failed: %s", e)
+            self._close_segment()
+        self.timestamps = []
+        self.rows = []
+
+    def _encode_block(self):
+        columns = [encode_deltas(self.timestamps, 2)] + [encode_deltas(c, 2 if i == 0 else 1)
+                                                          for i, c in enumerate(zip(*self.rows))]
+        payload = encode_deltas([len(c) for c in columns]) + b"".join(columns)
+        return BLOCK_HEADER.pack(len(self.rows), self.timestamps[0], self.timestamps[-1], len(payload),
+                                 zlib.crc32(payload)) + payload
+
+    def _segment_end(self, timestamp):
+        return (timestamp // self.segment_span + 1) * self.segment_span
+
+    def _open_segment(self, timestamp):
+        """
+        :return: first timestamp of the segment, later than timestamp when a segment of that name exists
+            (e.g. the one closed after a write error)
+        """
+        if self.retention:
+            self._remove_old_segments(timestamp)
+        while True:
+            path = self._path(timestamp)
+            try:
+                self.file = open(path, "xb")
+                break
+            except FileExistsError:
+                logger.warning("Frame store segment %s exists, starting a new one after it", path)
+                last = list_segments(self.directory)[-1]
+                # as in __init__, rows stay ordered across segments
+                timestamp = max(timestamp, last + 1, self._last_timestamp(last))
+        self.segment_end = self._segment_end(timestamp)
+        header = json.dumps([list(c) for c in self.columns]).encode()
+        self.file.write(MAGIC + LENGTH.pack(len(header)) + header)
+        logger.info("Frame store segment %s started", path)
+        return timestamp
+
+    def _close_segment(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+    def _remove_old_segments(self, timestamp):
+        segments = list_segments(self.directory)
+        # a segment ends where the next one starts
+        for segment, following in zip(segments, segments[1:]):
+            if following > timestamp - self.retention:
+                break
+            try:
+                os.remove(self._path(segment))
+                logger.info("Frame store segment %s removed", self._path(segment))
+            except OSError as e:
+                logger.warning("Frame store segment %s not removed: %s", self._path(segment), e)
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self._close_segment()
+            self.closed = True
+
+    def _segments(self, start=None, end=None):
+        segments = list_segments(self.directory)
+        first = 0 if start is None else max(0, bisect_left(segments, start + 1) - 1)
+        last = len(segments) if end is None else bisect_left(segments, end)
+        return segments[first:last]
+
+    def blocks(self, start=None, end=None, fields=None):
+        """
+        Rows with start <= timestamp < end (ms), read one block at a time, the rows not flushed yet are the last block
+        :return: generator of dict of lists of raw values
+        """
+        keys = set(self.typecodes if fields is None else fields)
+        # taken first, rows flushed meanwhile are read from the snapshot only
+        pending = self._pending_block(start, end, keys)
+        stored_end = end
+        if pending is not None:
+            first = pending[TIMESTAMP][0]
+            stored_end = first if end is None else min(end, first)
+        yield from self._stored_blocks(start, stored_end, keys)
+        if pending is not None:
+            yield pending
+
+    def _stored_blocks(self, start, end, keys):
+        for segment in self._segments(start, end):
+            try:
+                s = Segment(self._path(segment))
+            except (OSError, ValueError) as e:
+                logger.warning("Frame store segment %s skipped: %s", segment, e)
+                continue
+            with s:
+                for rows, first, last, payload, size, crc in s.headers():
+                    if start is not None and last < start:
+                        continue
+                    if end is not None and first >= end:
+                        return
+                    block = s.read_block(rows, payload, size, crc, keys)
+                    if block is None:
+                        continue
+                    timestamps = block[TIMESTAMP]
+                    lo = 0 if start is None else bisect_left(timestamps, start)
+                    hi = rows if end is None else bisect_left(timestamps, end)
+                    if lo or hi < rows:
+                        block = {k: v[lo:hi] for k, v in block.items()}
+                    if hi > lo:
+                        yield block
+
+    def _pending_block(self, start, end, keys):
+        with self.lock:
+            timestamps = self.timestamps
+            lo = 0 if start is None else bisect_left(timestamps, start)
+            hi = len(timestamps) if end is None else bisect_left(timestamps, end)
+            if hi <= lo:
+                return None
+            rows = self.rows[lo:hi]
+            block = {TIMESTAMP: timestamps[lo:hi], DEVICE_TIME: [r[0] for r in rows]}
+        for i, c in enumerate(self.columns, 1):
+            if c.key in keys:
+                block[c.key] = [r[i] for r in rows]
+        return block
+
+    def count(self, start=None, end=None):
+        """
+        Rows with start <= timestamp < end (ms), only blocks on the range edges are decoded
+        """
+        with self.lock:
+            timestamps = self.timestamps
+            total = (len(timestamps) if end is None else bisect_left(timestamps, end)) - \
+                (0 if start is None else bisect_left(timestamps, start))
+        total = max(0, total)
+        for segment in self._segments(start, end):
+            try:
+                s = Segment(self._path(segment))
+            except (OSError, ValueError):
+                continue
+            with s:
+                for rows, first, last, payload, size, crc in s.headers():
+                    if (start is not None and last < start) or (end is not None and first >= end):
+                        continue
+                    if (start is None or first >= start) and (end is None or last < end):
+                        total += rows
+                        continue
+                    block = s.read_block(rows, payload, size, crc, ())
+                    if block is not None:
+                        timestamps = block[TIMESTAMP]
+                        total += (rows if end is None else bisect_left(timestamps, end)) - \
+                            (0 if start is None else bisect_left(timestamps, start))
+        return total
+
+    def first_of_last(self, rows):
+        """
+        Timestamp (seconds) from which the store holds about rows rows, None when empty
+        """
+        total = 0
+        first = None
+        for segment in reversed(list_segments(self.directory)):
+            try:
+                with Segment(self._path(segment)) as s:
+                    headers = list(s.headers())
+            except (OSError, ValueError):
+                continue
+            for h in reversed(headers):
+                total += h[0]
+                first = h[1]
+                if total >= rows:
+                    return first / 1000
+        return first / 1000 if first is not None else None
+
+    def frames(self, start=None, end=None):
+        """
+        Stored frames with start <= timestamp < end (seconds)
+        :return: generator of (timestamp, frame dict)
+        """
+        start_ms = None if start is None else int(start * 1000)
+        end_ms = None if end is None else int(end * 1000)
+        for block in self.blocks(start_ms, end_ms):
+            keys = [c.key for c in self.columns if c.key in block]
+            for i, timestamp in enumerate(block[TIMESTAMP]):
+                frame = {k: decode_value(block[k][i], self.typecodes[k], self.scales[k]) for k in keys}
+                frame[DEVICE_TIME] = decode_value(block[DEVICE_TIME][i], "q", 1)
+                yield timestamp / 1000, frame
+
+    def query(self, start=None, end=None, fields=None, limit=DEFAULT_LIMIT):
+        """
+        The same result as TimeSeriesRing.query, from disk
+        """
+        fields = [c.key for c in self.columns if fields is None or c.key in fields]
+        start_ms = None if start is None else int(start * 1000)
+        end_ms = None if end is None else int(end * 1000)
+        step = max(1, -(-self.count(start_ms, end_ms) // limit)) if limit else 1
+        result = {TIMESTAMP: [], DEVICE_TIME: []}
+        result.update((k, []) for k in fields)
+        index = 0
+        for block in self.blocks(start_ms, end_ms, fields):
+            rows = len(block[TIMESTAMP])
+            # every step-th row counted across blocks
+            first = -index % step
+            index += rows
+            result[TIMESTAMP] += [t / 1000 for t in block[TIMESTAMP][first::step]]
+            result[DEVICE_TIME] += [decode_value(v, "q", 1) for v in block[DEVICE_TIME][first::step]]
+            for k in fields:
+                if k in block:
+                    typecode = self.typecodes[k]
+                    scale = self.scales[k]
+                    result[k] += [decode_value(v, typecode, scale) for v in block[k][first::step]]
+                else:
+                    # column added after the segment was written
+                    result[k] += [None] * len(range(first, rows, step))
+        result["step"] = step
+        return result
+
+    def stats(self):
+        segments = list_segments(self.directory)
+        size = 0
+        for segment in segments:
+            try:
+                size += os.path.getsize(self._path(segment))
+            except OSError:
+                pass
+        return {"segments": len(segments), "bytes": size, "rows_written": self.rows_written,
+                "bytes_written": self.bytes_written, "pending": len(self.rows),
+                "first": segments[0] / 1000 if segments else None}
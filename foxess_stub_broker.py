@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Minimal in-process MQTT 3.1.1 broker for benchmarks, listens on localhost only.
+# Supports what this project uses: connect, subscribe with wildcards, QoS 0/1 publish, retained messages, ping.
+
+import asyncio
+import logging
+import threading
+import time
+
+from paho.mqtt.client import topic_matches_sub
+
+logger = logging.getLogger("foxess_stub_broker")
+
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA0
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+
+def _remaining_length(length):
+    out = bytearray()
+    while True:
+        b = length % 128
+        length //= 128
+        if length:
+            b |= 0x80
+        out.append(b)
+        if not length:
+            return bytes(out)
+
+
+def _string(data, position):
+    length = int.from_bytes(data[position:position + 2], 'big')
+    return data[position + 2:position + 2 + length].decode(), position + 2 + length
+
+
+def publish_packet(topic, payload, retain=False):
+    topic = topic.encode()
+    body = len(topic).to_bytes(2, 'big') + topic + payload
+    return bytes([PUBLISH | (1 if retain else 0)]) + _remaining_length(len(body)) + body
+
+
+class _Session:
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.task = asyncio.current_task()
+        self.client_id = None
+        self.subscriptions = set()
+
+
+class StubBroker:
+    """
+    Broker running on own thread with asyncio loop.
+    on_publish(client_id, topic, payload, timestamp) is called (on broker thread) for every received publish.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, on_publish=None):
+        self.host = host
+        self.port = port
+        self.on_publish = on_publish
+        self.sessions = []
+        self.retained = {}
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.started = threading.Event()
+        self.received = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="stub-broker", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._client, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+        self.server.close()
+        tasks = [s.task for s in self.sessions]
+        # closed connection ends the client coroutine
+        for s in self.sessions:
+            s.writer.close()
+        self.loop.run_until_complete(asyncio.wait(tasks, timeout=1) if tasks else asyncio.sleep(0))
+        self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(5)
+
+    def subscribers(self, topic):
+        return [s for s in self.sessions if any(topic_matches_sub(f, topic) for f in s.subscriptions)]
+
+    def inject(self, topic, payload, sent=None):
+        """
+        Publish from outside of the broker thread, e.g. raw frames of a simulated RS485 bridge.
+        :param sent: called with timestamp when the message was written to subscribers
+        """
+        self.loop.call_soon_threadsafe(self._route, None, topic, payload, False, sent)
+
+    def _route(self, session, topic, payload, retain, sent=None):
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        if sent is not None:
+            # before write, subscriber may read the message before write() returns
+            sent(time.perf_counter())
+        packet = None
+        for s in self.subscribers(topic):
+            packet = packet or publish_packet(topic, payload)
+            s.writer.write(packet)
+
+    async def _client(self, reader, writer):
+        session = _Session(writer)
+        self.sessions.append(session)
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length = 0
+                multiplier = 1
+                while True:
+                    b = (await reader.readexactly(1))[0]
+                    length += (b & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not b & 0x80:
+                        break
+                data = await reader.readexactly(length) if length else b''
+                if not self._packet(session, header[0], data):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Client {session.client_id} dropped: {e}")
+        finally:
+            self.sessions.remove(session)
+            writer.close()
+
+    def _packet(self, session, header, data):
+        packet_type = header & 0xF0
+        writer = session.writer
+        if packet_type == CONNECT:
+            # protocol name, level, flags, keepalive, client id
+            _, position = _string(data, 0)
+            session.client_id, _ = _string(data, position + 4)
+            writer.write(bytes([CONNACK, 2, 0, 0]))
+        elif packet_type == PUBLISH:
+            now = time.perf_counter()
+            qos = (header >> 1) & 0x03
+            topic, position = _string(data, 0)
+            if qos:
+                writer.write(bytes([PUBACK, 2]) + data[position:position + 2])
+                position += 2
+            payload = data[position:]
+            self.received += 1
+            if self.on_publish is not None:
+                self.on_publish(session.client_id, topic, payload, now)
+            self._route(session, topic, payload, header & 0x01)
+        elif packet_type == SUBSCRIBE:
+            packet_id = data[:2]
+            position = 2
+            granted = bytearray()
+            topics = []
+            while position < len(data):
+                topic, position = _string(data, position)
+                position += 1
+                topics.append(topic)
+                session.subscriptions.add(topic)
+                granted.append(0)
+            writer.write(bytes([SUBACK]) + _remaining_length(2 + len(granted)) + packet_id + granted)
+            for topic, payload in list(self.retained.items()):
+                if any(topic_matches_sub(f, topic) for f in topics):
+                    writer.write(publish_packet(topic, payload, retain=True))
+        elif packet_type == UNSUBSCRIBE:
+            position = 2
+            while position < len(data):
+                topic, position = _string(data, position)
+                session.subscriptions.discard(topic)
+            writer.write(bytes([UNSUBACK, 2]) + data[:2])
+        elif packet_type == PINGREQ:
+            writer.write(bytes([PINGRESP, 0]))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
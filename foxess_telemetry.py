@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Live stream of parsed frames for HTTP clients.
+# Devices write to one ring buffer, every client reads it with own cursor. Writer never waits for readers:
+# a client which falls behind by more than the ring capacity skips the overwritten frames.
+
+import json
+import threading
+
+DEFAULT_CAPACITY = 1024
+
+
+class TelemetryItem:
+    __slots__ = ("seq", "device_id", "frame", "_json")
+
+    def __init__(self, seq, device_id, frame):
+        self.seq = seq
+        self.device_id = device_id
+        self.frame = frame
+        self._json = None
+
+    def json(self):
+        # encoded by the first client which needs it, shared by the others
+        if self._json is None:
+            self._json = json.dumps({"seq": self.seq, "device": self.device_id, **self.frame}, default=str)
+        return self._json
+
+
+class TelemetryRing:
+    """
+    Single ring, written by device workers, read by any number of subscriptions
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        # sequence number of the next frame
+        self.seq = 0
+        self.subscribers = 0
+        self.published = 0
+        self.skipped = 0
+        self.condition = threading.Condition()
+
+    def publish(self, device_id, frame):
+        """
+        Called for every parsed frame, nothing is stored while no client is connected
+        """
+        if not self.subscribers:
+            return
+        # frame dict is changed later by the sensors handler, clients encode it on other threads
+        frame = dict(frame)
+        with self.condition:
+            self.slots[self.seq % self.capacity] = TelemetryItem(self.seq, device_id, frame)
+            self.seq += 1
+            self.published += 1
+            self.condition.notify_all()
+
+    def subscribe(self):
+        return TelemetrySubscription(self)
+
+    def read(self, cursor, timeout):
+        """
+        :return: (items from cursor, next cursor, number of frames skipped because they were overwritten)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > cursor, timeout)
+            skipped = max(0, self.seq - self.capacity - cursor)
+            cursor += skipped
+            self.skipped += skipped
+            items = [self.slots[i % self.capacity] for i in range(cursor, self.seq)]
+            return items, self.seq, skipped
+
+    def stats(self):
+        return {"capacity": self.capacity, "subscribers": self.subscribers,
+                "published": self.published, "skipped": self.skipped}
+
+
+class TelemetrySubscription:
+    """
+    Cursor of one client, starts with the next published frame
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        with ring.condition:
+            ring.subscribers += 1
+            self.cursor = ring.seq
+        self.closed = False
+
+    def read(self, timeout):
+        """
+        :return: (new items, skipped count), empty list when nothing came within timeout
+        """
+        items, self.cursor, skipped = self.ring.read(self.cursor, timeout)
+        return items, skipped
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            with self.ring.condition:
+                self.ring.subscribers -= 1
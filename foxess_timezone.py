@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Conversion of inverter time (local wall clock as seconds since epoch) to UTC.
+# The UTC offset is constant between DST transitions, so the offset of the last interval is cached
+# and a conversion is a range check and a subtraction. The offset is looked up by pytz again only
+# when a timestamp falls outside the cached interval.
+# Local times which do not exist (spring forward) or are ambiguous (fall back) take the standard time offset.
+
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+import pytz
+
+logger = logging.getLogger("foxess_timezone")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def utc_offset(timezone, local_timestamp):
+    """
+    UTC offset in seconds of the local wall time, reference for LocalTimeConverter
+    :param timezone: pytz timezone
+    """
+    local = _EPOCH + timedelta(seconds=local_timestamp)
+    return timezone.localize(local, is_dst=False).utcoffset().total_seconds()
+
+
+class LocalTimeConverter:
+    """
+    Timezone resolved once, to_utc() called for every frame by one parser
+    """
+
+    def __init__(self, timezone):
+        try:
+            self.timezone = pytz.timezone(timezone)
+        except pytz.exceptions.UnknownTimeZoneError:
+            logger.error(f"Unknown timezone: {timezone}")
+            self.timezone = None
+        # local wall times where the offset may change, sorted
+        self.boundaries = self._boundaries(self.timezone)
+        # cached interval [start, end) and its offset
+        self.start = 0.0
+        self.end = 0.0
+        self.offset = 0.0
+        self.misses = 0
+
+    @staticmethod
+    def _boundaries(timezone):
+        transitions = getattr(timezone, "_utc_transition_times", None)
+        infos = getattr(timezone, "_transition_info", None)
+        if not transitions or not infos:
+            # fixed offset, e.g. UTC
+            return []
+        boundaries = set()
+        for utc, before, after in zip(transitions[1:], infos, infos[1:]):
+            # wall clock before and after the transition, the gap / overlap between them is a separate interval
+            utc = (utc - _EPOCH).total_seconds()
+            boundaries.add(utc + before[0].total_seconds())
+            boundaries.add(utc + after[0].total_seconds())
+        return sorted(boundaries)
+
+    def to_utc(self, local_timestamp):
+        """
+        :return: seconds since epoch, None for unknown timezone
+        """
+        if self.start <= local_timestamp < self.end:
+            return local_timestamp - self.offset
+        if self.timezone is None:
+            return None
+        return local_timestamp - self._lookup(local_timestamp)
+
+    def _lookup(self, local_timestamp):
+        self.misses += 1
+        boundaries = self.boundaries
+        i = bisect_right(boundaries, local_timestamp)
+        self.start = boundaries[i - 1] if i else float("-inf")
+        self.end = boundaries[i] if i < len(boundaries) else float("inf")
+        self.offset = utc_offset(self.timezone, local_timestamp)
+        return self.offset
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# Sharded worker pool - tasks with the same key always run on the same worker,
+# so tasks of one device are executed in order.
+
+import collections
+import logging
+import threading
+import zlib
+
+logger = logging.getLogger("foxess_workers")
+
+DEFAULT_WORKER_QUEUE_SIZE = 1000
+
+
+class _Worker:
+
+    def __init__(self, name, queue_size):
+        self.name = name
+        # (fn, args, droppable, on_drop), only droppable tasks count to queue_size
+        self.queue = collections.deque()
+        self.queue_size = queue_size
+        self.droppable = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.executed = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, fn, args, droppable=True, on_drop=None):
+        with self.condition:
+            if droppable:
+                if self.droppable == self.queue_size:
+                    self._drop_oldest()
+                self.droppable += 1
+            self.queue.append((fn, args, droppable, on_drop))
+            self.condition.notify()
+
+    def _drop_oldest(self):
+        for i, (_, args, droppable, on_drop) in enumerate(self.queue):
+            if droppable:
+                del self.queue[i]
+                self.droppable -= 1
+                self.dropped += 1
+                if on_drop is not None:
+                    on_drop(*args)
+                return
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                fn, args, droppable, _ = self.queue.popleft()
+                if droppable:
+                    self.droppable -= 1
+            try:
+                fn(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error in worker {self.name}: {e}")
+            self.executed += 1
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+
+class ShardedWorkerPool:
+    """
+    Fixed number of worker threads, each with own bounded queue (the oldest droppable task is dropped when full).
+    """
+
+    def __init__(self, workers=1, queue_size=DEFAULT_WORKER_QUEUE_SIZE, name="foxess-worker"):
+        self.workers = [_Worker(f"{name}-{i}", queue_size) for i in range(max(1, workers))]
+
+    def shard(self, key):
+        # stable between runs, unlike hash() of str
+        return zlib.crc32(key.encode()) % len(self.workers)
+
+    def submit(self, shard, fn, *args, droppable=True, on_drop=None):
+        """
+        Run fn(*args) on worker number shard, see shard(key)
+        :param droppable: False - task is never dropped from a full queue, for tasks scheduled only once
+            (publisher drain) or changing state (device offline)
+        :param on_drop: called with args when the task is dropped, on the submitting thread under the queue lock
+        """
+        self.workers[shard].submit(fn, args, droppable, on_drop)
+
+    def start(self):
+        for w in self.workers:
+            w.start()
+
+    def stop(self):
+        for w in self.workers:
+            w.stop()
+
+    def stats(self):
+        return [{
+            "name": w.name,
+            "queue_depth": len(w.queue),
+            "executed": w.executed,
+            "dropped": w.dropped,
+            "errors": w.errors,
+        } for w in self.workers]
@@ -19,9 +19,10 @@
 import os
 import logging
 import sys
-import collections
 import json
 
+from foxess_logging import LogBuffer, RateLimitFilter, start_listener
+
 
 
 
@@ -32,6 +33,40 @@ MQTT_USER = "MQTT_USER"
 MQTT_PASSWORD = "MQTT_PASSWORD"
 MQTT_CLIENT_ID= 'MQTT_CLIENT_ID'
 
+# sensors publishing
+PUBLISH_QUEUE_SIZE = "PUBLISH_QUEUE_SIZE"
+PUBLISH_POLICY = "PUBLISH_POLICY"
+PUBLISH_WINDOW = "PUBLISH_WINDOW"
+PUBLISH_JSON_STATE = "PUBLISH_JSON_STATE"
+# number of threads parsing & publishing data of devices
+INGEST_WORKERS = "INGEST_WORKERS"
+# "thread" or "asyncio" - mqtt I/O, parsing and publishing on one event loop
+MQTT_RUNTIME = "MQTT_RUNTIME"
+# directory for cached HA discovery payloads
+DISCOVERY_CACHE_DIR = "DISCOVERY_CACHE_DIR"
+# binary capture of raw frames, disabled when CAPTURE_DIR is not set
+CAPTURE_DIR = "CAPTURE_DIR"
+CAPTURE_SEGMENT_SIZE = "CAPTURE_SEGMENT_SIZE"
+CAPTURE_SEGMENT_AGE = "CAPTURE_SEGMENT_AGE"
+CAPTURE_MAX_SIZE = "CAPTURE_MAX_SIZE"
+# frames kept in memory for /timeseries, per inverter, 0 - disabled
+TIMESERIES_CAPACITY = "TIMESERIES_CAPACITY"
+# comma separated frame values published as min/max/mean sensors of closed rollup buckets
+ROLLUP_SENSORS = "ROLLUP_SENSORS"
+# minute, hour or day
+ROLLUP_SENSOR_RESOLUTION = "ROLLUP_SENSOR_RESOLUTION"
+# energy integrated from power values
+ENERGY_SENSORS = "ENERGY_SENSORS"
+# directory for energy totals, energy sensors are disabled when not set
+ENERGY_STATE_DIR = "ENERGY_STATE_DIR"
+# seconds, longer intervals between frames are not integrated
+ENERGY_MAX_GAP = "ENERGY_MAX_GAP"
+# compressed store of parsed frames, disabled when STORE_DIR is not set
+STORE_DIR = "STORE_DIR"
+STORE_SEGMENT_SPAN = "STORE_SEGMENT_SPAN"
+STORE_FLUSH_INTERVAL = "STORE_FLUSH_INTERVAL"
+STORE_RETENTION = "STORE_RETENTION"
+
 
 FOXESS_DEVICE_NAME = "FOXESS_DEVICE_NAME"
 FOXESS_SN = "FOXESS_SN"
@@ -40,15 +75,21 @@ FOXESS_MANUFACTURER = "FOXESS_MANUFACTURER"
 FOXESS_SW_VERSION = "FOXESS_SW_VERSION"
 FOXESS_TIME_ZONE = "FOXESS_TIME_ZONE"
 
+# token required by /debug profiling endpoints, endpoints are disabled when not set
+PROFILING_TOKEN = "PROFILING_TOKEN"
+
 LOG_LEVEL="LOG_LEVEL"
+# records of one message template passed per LOG_RATE_INTERVAL seconds, 0 - no limit
+LOG_RATE_LIMIT = "LOG_RATE_LIMIT"
+LOG_RATE_INTERVAL = "LOG_RATE_INTERVAL"
 CURRENT_LOG_LEVEL=None
 
 ENV_FOXESS = {}
 ENV_MQTT = {}
 MAX_LOG_LINES = 100
 
-# Queue for logs, limited length to preserve memory
-log_queue = collections.deque(maxlen=MAX_LOG_LINES)
+# Queue for logs, limited length to preserve memory, lines are numbered for incremental reads
+log_queue = LogBuffer(MAX_LOG_LINES)
 # --- Custom logging handler saving to the queue ---
 class QueueLogHandler(logging.Handler):
     def __init__(self, queue):
@@ -71,8 +112,17 @@ console_handler = logging.StreamHandler(sys.stdout)
 console_handler.setFormatter(log_formatter)
 logger = logging.getLogger("helper")
 
+# console and log viewer handlers run on the listener thread, loggers only enqueue records
+ingest_handler = None
+log_listener = None
+rate_limit_filter = RateLimitFilter(int(os.getenv(LOG_RATE_LIMIT, 10)), float(os.getenv(LOG_RATE_INTERVAL, 60)))
+
+
 def set_logger_state(level=None):
-    global CURRENT_LOG_LEVEL
+    """
+    Sets level of all loggers, handlers are added to the root logger only once
+    """
+    global CURRENT_LOG_LEVEL, ingest_handler, log_listener
     if level is None:
         if ENV_MQTT.get(LOG_LEVEL,'INFO').upper() == 'DEBUG':
             state = logging.DEBUG
@@ -86,14 +136,26 @@ def set_logger_state(level=None):
     else:
         CURRENT_LOG_LEVEL = 'INFO'
 
+    if log_listener is None:
+        ingest_handler, log_listener = start_listener(queue_handler, console_handler)
+        ingest_handler.addFilter(rate_limit_filter)
+        logging.getLogger().addHandler(ingest_handler)
+
     loggers = [logging.getLogger(name) for name in logging.root.manager.loggerDict]
     for l in loggers:
         l.setLevel(state)
-        l.addHandler(queue_handler)
-        l.addHandler(console_handler)
         l.debug("Change logger status %s to %s", l.name,CURRENT_LOG_LEVEL)
 
 
+def get_logging_stats():
+    return {
+        "level": CURRENT_LOG_LEVEL,
+        "queued": ingest_handler.queue.qsize() if ingest_handler else 0,
+        "dropped": ingest_handler.dropped if ingest_handler else 0,
+        "suppressed": rate_limit_filter.suppressed,
+    }
+
+
 def refresh_env_variables():
     global ENV_MQTT,ENV_FOXESS
     ENV_FOXESS = {
@@ -113,7 +175,31 @@ def refresh_env_variables():
             MQTT_USER : os.getenv(MQTT_USER),
             MQTT_PASSWORD : os.getenv(MQTT_PASSWORD),
             MQTT_CLIENT_ID : os.getenv(MQTT_CLIENT_ID,"FoxessT20G3"),
+            PUBLISH_QUEUE_SIZE : int(os.getenv(PUBLISH_QUEUE_SIZE,100)),
+            PUBLISH_POLICY : os.getenv(PUBLISH_POLICY,"drop_oldest"),
+            PUBLISH_WINDOW : int(os.getenv(PUBLISH_WINDOW,10)),
+            PUBLISH_JSON_STATE : os.getenv(PUBLISH_JSON_STATE,'false').lower() == 'true',
+            DISCOVERY_CACHE_DIR : os.getenv(DISCOVERY_CACHE_DIR),
+            INGEST_WORKERS : int(os.getenv(INGEST_WORKERS,1)),
+            MQTT_RUNTIME : os.getenv(MQTT_RUNTIME,'thread').lower(),
+            CAPTURE_DIR : os.getenv(CAPTURE_DIR),
+            # MB, hours, MB
+            CAPTURE_SEGMENT_SIZE : int(os.getenv(CAPTURE_SEGMENT_SIZE,64)),
+            CAPTURE_SEGMENT_AGE : float(os.getenv(CAPTURE_SEGMENT_AGE,24)),
+            CAPTURE_MAX_SIZE : int(os.getenv(CAPTURE_MAX_SIZE,0)),
+            TIMESERIES_CAPACITY : int(os.getenv(TIMESERIES_CAPACITY,50000)),
+            ROLLUP_SENSORS : [k.strip() for k in os.getenv(ROLLUP_SENSORS,'').split(',') if k.strip()],
+            ROLLUP_SENSOR_RESOLUTION : os.getenv(ROLLUP_SENSOR_RESOLUTION,'hour').lower(),
+            ENERGY_SENSORS : os.getenv(ENERGY_SENSORS,'true').lower() == 'true',
+            ENERGY_STATE_DIR : os.getenv(ENERGY_STATE_DIR),
+            ENERGY_MAX_GAP : int(os.getenv(ENERGY_MAX_GAP,60)),
+            STORE_DIR : os.getenv(STORE_DIR),
+            STORE_SEGMENT_SPAN : int(os.getenv(STORE_SEGMENT_SPAN,24)),
+            STORE_FLUSH_INTERVAL : int(os.getenv(STORE_FLUSH_INTERVAL,60)),
+            STORE_RETENTION : int(os.getenv(STORE_RETENTION,0)),
             LOG_LEVEL: os.getenv(LOG_LEVEL,'INFO'),
+            LOG_RATE_LIMIT: rate_limit_filter.limit,
+            LOG_RATE_INTERVAL: rate_limit_filter.interval,
             'CURRENT_LOG_LEVEL' : CURRENT_LOG_LEVEL
         }
     logger.debug("MQTT ENVs:%s", json.dumps(ENV_MQTT, indent=4))
@@ -125,4 +211,8 @@ def get_foxess_env():
 def get_mqtt_params():
     return ENV_MQTT
 
+def get_profiling_token():
+    # not in ENV_MQTT, env variables are shown on the log viewer page
+    return os.getenv(PROFILING_TOKEN) or None
+
 refresh_env_variables()
\ No newline at end of file
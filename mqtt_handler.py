@@ -20,25 +20,33 @@
 # more information about handling offline status here
 # https://github.com/assembly12/Foxess-T-series-ESPHome-Home-Assistant
 
-import datetime
 import json
-from time import sleep
-from foxess_parser_data_tseries import FoxessTSeriesDataParser, STATUS_OFFLINE, STATUS_ONLINE
-from foxess_sensors_handler import FoxessSensorsHandler
+import socket
+from foxess_device import FoxessDevice
+from foxess_telemetry import TelemetryRing
+from foxess_sensors_handler import RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, HA_STATUS_TOPIC, HA_STATUS_ONLINE
+from foxess_workers import ShardedWorkerPool
 import paho.mqtt.client as mqtt
 import threading
-from datetime import datetime, timedelta
-from helper import MQTT_CLIENT_ID,MQTT_USER,MQTT_PASSWORD,MQTT_PORT,MQTT_TOPIC,MQTT_BROKER,FOXESS_TIME_ZONE
-import collections
+from datetime import datetime
+from helper import MQTT_CLIENT_ID,MQTT_USER,MQTT_PASSWORD,MQTT_PORT,MQTT_TOPIC,MQTT_BROKER
+from helper import FOXESS_DEVICE_NAME,FOXESS_SN,INGEST_WORKERS
 import logging
 
 logger = logging.getLogger("mqtt_handler")
 
 # timeout when inverter goes off line
 TIMEOUT = 3600
-MAX_HISTORY_BUFFER = 10
-# max cache size in bytes
-MAX_CACHE_SIZE = 10000
+
+def set_tcp_nodelay(sock):
+    """
+    Sensor states are many small packets, with Nagle's algorithm they wait for ACK of the previous one
+    """
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError) as e:
+        logger.debug(f"TCP_NODELAY not set: {e}")
+
 
 class MqttHandler:
 
@@ -52,22 +60,24 @@ class MqttHandler:
         self.connected = False
         self.message_received = False
         self.thread_running = False
-        self.CACHE = bytearray()
-        self.status = STATUS_ONLINE
-        self.last_message_timestamp = datetime.now()
-        self.history = collections.deque(maxlen=MAX_HISTORY_BUFFER)
         self.foxess = foxess
         # for sensors
         self.mqtt_sensor = mqtt_param
-        self.mqtt_sensor[MQTT_CLIENT_ID] = self.mqtt_sensor[MQTT_CLIENT_ID] + "_ha"
-        self.sensors = None
-        self.parser = None
+        # topic -> FoxessDevice, many inverters when topic contains wildcards
+        self.devices = {}
+        self.multi_device = bool(self.topic) and ('+' in self.topic or '#' in self.topic)
+        self.pool = ShardedWorkerPool(workers=mqtt_param.get(INGEST_WORKERS, 1))
+        self.client = None
+        self.stopping = threading.Event()
+        # parsed frames of all devices for live HTTP clients
+        self.telemetry = TelemetryRing()
 
     def on_connect(self, client, userdata, flags, rc, prop):
         if rc == 0:
             logger.info( "Connected to MQTT")
             self.connected = True
             client.subscribe(self.topic)
+            client.subscribe(HA_STATUS_TOPIC)
         else:
             logger.error(f"Error, not connected  to MQTT:{rc}")
 
@@ -75,68 +85,95 @@ class MqttHandler:
         logger.warning(f"Disconnected with result code: {rc}")
         self.connected = False
 
+    def on_ha_status(self, msg):
+        logger.info(f"Home Assistant status: {msg.payload}")
+        if msg.payload == HA_STATUS_ONLINE:
+            # HA restarted, discovery configs and states have to be sent again
+            for device in list(self.devices.values()):
+                device.request_discovery()
+
+    def _device_id(self, topic):
+        """
+        Topic levels matched by wildcards identify the device
+        """
+        levels = topic.split('/')
+        ids = [level for pattern, level in zip(self.topic.split('/'), levels) if pattern in ('+', '#')]
+        if self.topic.endswith('#'):
+            ids.extend(levels[len(self.topic.split('/')):])
+        return "_".join(ids) or topic
+
+    def _add_device(self, topic):
+        foxess = self.foxess
+        device_id = topic
+        if self.multi_device:
+            device_id = self._device_id(topic)
+            foxess = dict(self.foxess)
+            # serial number is read from the inverter, device name has to be unique
+            foxess[FOXESS_SN] = None
+            foxess[FOXESS_DEVICE_NAME] = f"{self.foxess.get(FOXESS_DEVICE_NAME) or 'Foxess'} {device_id}"
+        device = self._create_device(device_id, topic, foxess)
+        self.devices[topic] = device
+        logger.info(f"New device {device_id} on topic {topic}")
+        return device
+
+    def _add_static_device(self):
+        """
+        Device of a topic without wildcards exists from start-up, so the offline timeout runs
+        (and the offline state is published) even when the inverter is silent, e.g. at night
+        """
+        if self.topic and not self.multi_device and self.topic not in self.devices:
+            self._add_device(self.topic)
+
+    def _create_device(self, device_id, topic, foxess):
+        return FoxessDevice(device_id, topic, self.mqtt_sensor, foxess, self.client,
+                            pool=self.pool, shard=self.pool.shard(topic), telemetry=self.telemetry)
+
     def on_message(self, client, userdata, msg):
-        logger.debug(f"Message received:{msg.payload.hex()}")
+        if msg.topic == HA_STATUS_TOPIC:
+            self.on_ha_status(msg)
+            return
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Message received:%s", msg.payload.hex())
         # health data
         self.message_received = True
-        self.last_message_timestamp = datetime.now()
-
-        self.CACHE.extend(msg.payload)
-        self.CACHE = self.parser.parse_data(self.CACHE)
-
-        if self.parser is None:
-            return
-
-        parsed_frames = self.parser.get_messages()
-
-        self.status = STATUS_ONLINE
-        if len(parsed_frames)>0:
-            for f in parsed_frames:
-                if self.sensors is not None:
-                    self.sensors.process_data(f)
-                logger.info(f"data processed {f}")
-                self.history.append(f)
-
-
-        # After messages are parsed cache should be clear, in case of rubbish in cache clear it
-        if len(self.CACHE)>MAX_CACHE_SIZE:
-            logger.debug(f"Clearing ca cache, max size exceeded:{len(self.CACHE)}")
-            self.CACHE = bytearray()
-
-
 
+        device = self.devices.get(msg.topic)
+        if device is None:
+            device = self._add_device(msg.topic)
+        # parsing and publishing are done by the device worker
+        device.on_payload(msg.payload)
 
     def check_status(self):
-        while True:
+        while not self.stopping.is_set():
             logger.debug("Start check status loop:%s",datetime.now())
-            if (self.last_message_timestamp + timedelta(seconds=TIMEOUT)) < datetime.now() and self.status == STATUS_ONLINE:
-                logger.debug("Inverter is offline, last message received at {}".format(self.last_message_timestamp))
-                logger.info("Inverter is offline")
-                self.sensors.process_data(self.parser.get_message_offline())
-                self.status = STATUS_OFFLINE
+            for device in list(self.devices.values()):
+                device.check_offline(TIMEOUT)
 
-            # self.client.connect(self.broker, self.port, 60)
-            # self.client.loop_start()
-            sleep(60)
-            # self.client.loop_stop()
+            self.stopping.wait(60)
 
-    def mqtt_thread(self):
-        self.thread_running = True
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,client_id=self.client_id)
-        self.client.username_pw_set(self.user,self.password)
+    def _create_client(self):
+        client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2,client_id=self.client_id)
+        client.username_pw_set(self.user,self.password)
+        client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY)
 
-        self.client.on_connect = lambda client, userdata, flags, rc, prop: self.on_connect(client, userdata, flags, rc, prop)
-        self.client.on_disconnect = lambda client,flags,userdata,rc, prop: self.on_disconnect(client, flags, userdata, rc, prop )
-        self.client.on_message = lambda client, userdata, msg: self.on_message(client, userdata, msg)
+        client.on_connect = lambda client, userdata, flags, rc, prop: self.on_connect(client, userdata, flags, rc, prop)
+        client.on_disconnect = lambda client,flags,userdata,rc, prop: self.on_disconnect(client, flags, userdata, rc, prop )
+        client.on_message = lambda client, userdata, msg: self.on_message(client, userdata, msg)
+        client.on_socket_open = lambda client, userdata, sock: set_tcp_nodelay(sock)
+        return client
 
-        self.parser = FoxessTSeriesDataParser(timezone=self.foxess.get(FOXESS_TIME_ZONE,'UTC'))
-        self.sensors= FoxessSensorsHandler(self.mqtt_sensor,foxess=self.foxess)
+    def mqtt_thread(self):
+        self.thread_running = True
+        self.client = self._create_client()
+        self.pool.start()
+        self._add_static_device()
 
         try:
-            self.client.connect(host=self.broker, port=self.port, keepalive=60)
-            #self.client.loop_forever()
+            # connection (and reconnects) are handled by the network loop
+            self.client.connect_async(host=self.broker, port=self.port, keepalive=60)
             self.client.loop_start()
             self.check_status()
+            self.client.disconnect()
             self.client.loop_stop()
 
         except Exception as e:
@@ -144,10 +181,16 @@ class MqttHandler:
             self.thread_running = False
         finally:
             self.thread_running = False
+            for device in list(self.devices.values()):
+                device.stop()
+            self.pool.stop()
 
     def start(self):
         threading.Thread(target=self.mqtt_thread).start()
 
+    def stop(self):
+        self.stopping.set()
+
     def is_connected(self):
         return self.connected
 
@@ -156,3 +199,43 @@ class MqttHandler:
 
     def is_thread_running(self):
         return self.thread_running
+
+    def get_publisher_stats(self):
+        return {device.device_id: device.publisher.stats() for device in list(self.devices.values())}
+
+    def get_policy_stats(self):
+        return {device.device_id: device.sensors.policy.stats() for device in list(self.devices.values())}
+
+    def get_worker_stats(self):
+        return self.pool.stats()
+
+    def get_memory_stats(self):
+        """
+        Sizes of buffers which may grow, together with tracemalloc diff shows what is leaking
+        """
+        return {device.device_id: {
+            "history": len(device.history),
+            "cache": len(device.parser.scanner),
+            "messages": len(device.parser.messages),
+            "sensors": len(device.sensors.sensors),
+            "publish_queue": device.publisher.queue_depth(),
+        } for device in list(self.devices.values())}
+
+    def get_storage_stats(self):
+        return {device.device_id: {
+            "timeseries": device.timeseries.stats() if device.timeseries is not None else None,
+            "store": device.store.stats() if device.store is not None else None,
+        } for device in list(self.devices.values())}
+
+    def get_latest_frames(self):
+        """
+        The last parsed frame of every device
+        """
+        return {device.device_id: device.history[-1] if device.history else None
+                for device in list(self.devices.values())}
+
+    def get_runtime_stats(self):
+        return {
+            "runtime": "thread",
+            "threads": threading.active_count(),
+        }
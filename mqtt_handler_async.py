@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# asyncio runtime - mqtt socket I/O, parsing and publishing run on one event loop (one thread).
+# Offline detection uses one deadline timer per device instead of a polling loop.
+
+import asyncio
+import functools
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+
+from foxess_device import FoxessDevice
+from foxess_sensors_handler import RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY
+from helper import MQTT_RUNTIME, STORE_FLUSH_INTERVAL
+from mqtt_handler import MqttHandler, TIMEOUT, set_tcp_nodelay
+
+logger = logging.getLogger("mqtt_handler_async")
+
+RUNTIME_THREAD = "thread"
+RUNTIME_ASYNCIO = "asyncio"
+
+# how often paho housekeeping (keepalive ping) runs, keepalive is 60 s
+MISC_INTERVAL = 10
+KEEPALIVE = 60
+
+
+class DeadlineTimer:
+    """
+    Calls callback when reset() was not called for timeout seconds.
+    reset() only moves the deadline, the loop timer is rescheduled when it fires too early,
+    so there is at most one timer wakeup per timeout.
+    """
+
+    def __init__(self, loop, timeout, callback):
+        self.loop = loop
+        self.timeout = timeout
+        self.callback = callback
+        self.deadline = loop.time() + timeout
+        self.handle = loop.call_at(self.deadline, self._fire)
+
+    def reset(self):
+        self.deadline = self.loop.time() + self.timeout
+        if self.handle is None:
+            self.handle = self.loop.call_at(self.deadline, self._fire)
+
+    def _fire(self):
+        if self.loop.time() < self.deadline:
+            self.handle = self.loop.call_at(self.deadline, self._fire)
+            return
+        self.handle = None
+        self.callback()
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+
+class AsyncioSocketHelper:
+    """
+    Drives paho client from asyncio loop, socket readiness replaces the network thread.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.thread = threading.get_ident()
+        self.client = client
+        self.misc = None
+        client.on_socket_open = self._in_loop(self.on_socket_open)
+        client.on_socket_close = self._in_loop(self.on_socket_close)
+        client.on_socket_register_write = self._in_loop(self.on_socket_register_write)
+        client.on_socket_unregister_write = self._in_loop(self.on_socket_unregister_write)
+
+    def _in_loop(self, callback):
+        # connect() runs in an executor thread, socket callbacks called by it are moved to the loop
+        def wrapper(*args):
+            if threading.get_ident() == self.thread:
+                callback(*args)
+            else:
+                self.loop.call_soon_threadsafe(callback, *args)
+        return wrapper
+
+    def on_socket_open(self, client, userdata, sock):
+        if sock.fileno() < 0:
+            # closed before the loop got to it (connect failed after the socket was opened)
+            return
+        set_tcp_nodelay(sock)
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(MISC_INTERVAL)
+
+
+class AsyncMqttHandler(MqttHandler):
+    """
+    MqttHandler running on asyncio event loop in a single thread.
+    """
+
+    def __init__(self, mqtt_param, foxess={}):
+        super().__init__(mqtt_param, foxess)
+        self.loop = None
+        self.stopped = None
+        self.reconnecting = False
+        # kept across disconnects, a broker accepting TCP and dropping the session must not cause a tight loop
+        self.reconnect_delay = RECONNECT_MIN_DELAY
+        # topic -> DeadlineTimer
+        self.timers = {}
+
+    def _create_device(self, device_id, topic, foxess):
+        device = FoxessDevice(device_id, topic, self.mqtt_sensor, foxess, self.client, inline=True,
+                              telemetry=self.telemetry)
+        # publishing must not wait for the broker, the loop is the one sending the data
+        device.sensors.publish_window = None
+        self.timers[topic] = DeadlineTimer(self.loop, TIMEOUT, device.set_offline)
+        return device
+
+    def on_message(self, client, userdata, msg):
+        super().on_message(client, userdata, msg)
+        timer = self.timers.get(msg.topic)
+        if timer is not None:
+            timer.reset()
+
+    def on_connect(self, client, userdata, flags, rc, prop):
+        super().on_connect(client, userdata, flags, rc, prop)
+        if rc == 0:
+            self.reconnect_delay = RECONNECT_MIN_DELAY
+
+    def on_disconnect(self, client, flags, userdata, rc, properties=None):
+        super().on_disconnect(client, flags, userdata, rc, properties)
+        if not self.stopped.is_set():
+            self.loop.create_task(self._connect(wait=True))
+
+    async def _backoff(self):
+        try:
+            await asyncio.wait_for(self.stopped.wait(), self.reconnect_delay)
+        except asyncio.TimeoutError:
+            pass
+        self.reconnect_delay = min(self.reconnect_delay * 2, RECONNECT_MAX_DELAY)
+
+    async def _connect(self, wait=False):
+        """
+        wait - sleep the backoff delay before the first attempt (reconnect after a disconnect)
+        """
+        if self.reconnecting:
+            return
+        self.reconnecting = True
+        try:
+            while not self.stopped.is_set():
+                if wait:
+                    logger.info(f"MQTT reconnect in {self.reconnect_delay}s")
+                    await self._backoff()
+                    if self.stopped.is_set():
+                        return
+                wait = True
+                try:
+                    if self.client.is_connected():
+                        return
+                    # DNS lookup and TCP connect block, the loop keeps parsing and running timers meanwhile
+                    await self.loop.run_in_executor(None, functools.partial(
+                        self.client.connect, host=self.broker, port=self.port, keepalive=KEEPALIVE))
+                    return
+                except OSError as e:
+                    logger.warning(f"MQTT connection failed: {e}")
+        finally:
+            self.reconnecting = False
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.client = self._create_client()
+        AsyncioSocketHelper(self.loop, self.client)
+        self._add_static_device()
+        flush = self.loop.create_task(self.flush_loop())
+        await self._connect()
+        await self.stopped.wait()
+        flush.cancel()
+        self.client.disconnect()
+
+    async def flush_loop(self):
+        # check_status of the threaded runtime does the same, offline deadline may be far away
+        interval = self.mqtt_sensor.get(STORE_FLUSH_INTERVAL) or 60
+        while True:
+            await asyncio.sleep(interval)
+            for device in list(self.devices.values()):
+                device.flush_storage()
+
+    def mqtt_thread(self):
+        self.thread_running = True
+        try:
+            asyncio.run(self.run())
+        except Exception as e:
+            logger.error(f"Error in event loop:{e}")
+        finally:
+            self.thread_running = False
+            for timer in list(self.timers.values()):
+                timer.cancel()
+            # publisher, energy totals, capture and store are flushed like in the threaded runtime
+            for device in list(self.devices.values()):
+                device.stop()
+            self.pool.stop()
+
+    def stop(self):
+        super().stop()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def get_runtime_stats(self):
+        return {
+            "runtime": RUNTIME_ASYNCIO,
+            "threads": threading.active_count(),
+            "timers": len(self.timers),
+        }
+
+
+def create_mqtt_handler(mqtt_param, foxess={}):
+    """
+    MqttHandler for runtime selected by MQTT_RUNTIME
+    """
+    if mqtt_param.get(MQTT_RUNTIME, RUNTIME_THREAD) == RUNTIME_ASYNCIO:
+        return AsyncMqttHandler(mqtt_param, foxess)
+    return MqttHandler(mqtt_param, foxess)
@@ -16,7 +16,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-from mqtt_handler import MqttHandler
+from mqtt_handler_async import create_mqtt_handler
 from helper import get_mqtt_params, get_foxess_env
 import logging
 
@@ -27,5 +27,5 @@ if __name__ == '__main__':
     foxess = get_foxess_env()
 
     logger.info("Start reading mqtt messages")
-    handler = MqttHandler(mqtt_param=mqtt, foxess=foxess)
+    handler = create_mqtt_handler(mqtt_param=mqtt, foxess=foxess)
     handler.start()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# ha-foxess-mqtt
+# Copyright (C) 2025 Jarosław Kozak <jaroslaw.kozak68@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+# table driven crc has to give the same result as the bit by bit one it replaced
+# run: python -m pytest -q test_foxess_crc.py
+
+import os
+import random
+
+from foxess_crc import crc16_modbus, Crc16Modbus
+from foxess_parser_data_tseries import FoxessTSeriesDataParser
+
+
+def crc16_modbus_legacy(data: bytearray):
+    """
+    FoxessTSeriesDataParser.crc16_modbus before it was replaced by foxess_crc, kept unchanged as reference
+    """
+    if data is None:
+        return 0
+    offset = 0
+    length = len(data)
+    crc = 0xFFFF
+    for i in range(length):
+        crc ^= data[offset + i]
+        for j in range(8):
+            if ((crc & 0x1) == 1):
+                crc = int((crc / 2)) ^ 40961
+            else:
+                crc = int(crc / 2)
+    return crc & 0xFFFF
+
+
+def random_frames(seed=2025):
+    rnd = random.Random(seed)
+    for length in (0, 1, 3, 57, 256, 1021):
+        yield bytes(rnd.randrange(256) for _ in range(length))
+    yield os.urandom(512)
+
+
+def test_none():
+    assert crc16_modbus(None) == crc16_modbus_legacy(None) == 0
+
+
+def test_all_1_byte_patterns():
+    for a in range(256):
+        data = bytes([a])
+        assert crc16_modbus(data) == crc16_modbus_legacy(data), data.hex()
+
+
+def test_all_2_byte_patterns():
+    for a in range(256):
+        for b in range(256):
+            data = bytes([a, b])
+            assert crc16_modbus(data) == crc16_modbus_legacy(data), data.hex()
+
+
+def test_random_frames():
+    for data in random_frames():
+        expected = crc16_modbus_legacy(data)
+        assert crc16_modbus(data) == expected, data.hex()
+        assert crc16_modbus(bytearray(data)) == expected, data.hex()
+        assert crc16_modbus(memoryview(data)) == expected, data.hex()
+        # parser keeps its static method for callers
+        assert FoxessTSeriesDataParser.crc16_modbus(data) == expected, data.hex()
+
+
+def test_incremental_split_feed():
+    for data in random_frames():
+        expected = crc16_modbus_legacy(data)
+        # every split point, and chunks of varying size
+        for split in range(0, len(data) + 1, max(1, len(data) // 16)):
+            assert Crc16Modbus(data[:split]).update(data[split:]).value() == expected, (data.hex(), split)
+            assert crc16_modbus(data[split:], crc16_modbus(data[:split])) == expected, (data.hex(), split)
+        for size in (1, 7, 64):
+            incremental = Crc16Modbus()
+            view = memoryview(data)
+            for i in range(0, len(data), size):
+                incremental.update(view[i:i + size])
+            assert incremental.value() == expected, (data.hex(), size)
+            assert incremental.matches(expected.to_bytes(2, 'little'))
+            incremental.reset()
+            assert incremental.value() == Crc16Modbus().value()